@@ -2,16 +2,15 @@
 Assignment agent implementation using LangChain and py_trees.
 """
 
-from langchain_core.runnables import RunnableSequence
-from langchain.chat_models import init_chat_model
-from langchain.prompts import PromptTemplate
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import InMemorySaver
-from fastapi import FastAPI, HTTPException
+from functools import lru_cache
 from logger.config import agent_logger
+from shared.checkpoint import SQLiteCheckpointSaver
+from shared.rate_limit import llm_rate_limiter, BACKGROUND
+from shared.resilience import ResilientChatModel, LLMUnavailableError, llm_circuit_breaker
+from shared.record_cache import record_cache
 
 # Import configuration
-from .config import openai_api_key, model_name, system_prompt
+from .config import get_openai_api_key, model_name, system_prompt
 
 # Import behavior tree
 from .behavior_tree import assignment_tree
@@ -19,55 +18,119 @@ from .behavior_tree import assignment_tree
 # Import tools
 from .tools import tools, analyze_task_assignment_fit
 
-# Initialize the chat model compatible with Langraph
-llm = init_chat_model(
-    model=model_name,
-    api_key=openai_api_key
-)
+# The chat model, checkpointer and agent graph are built on first use rather than at import time
+@lru_cache(maxsize=None)
+def get_llm():
+    """Return the chat model compatible with Langraph, behind the resilience layer and shared rate limiter."""
+    from langchain.chat_models import init_chat_model
 
-agent_logger.info(f"Using OpenAI model: {model_name}")
+    llm = ResilientChatModel(
+        # Retries are handled by the resilience layer, not by the client
+        model=init_chat_model(
+            model=model_name,
+            api_key=get_openai_api_key(),
+            max_retries=0
+        ),
+        breaker=llm_circuit_breaker,
+        # Every attempt, retries and hedges included, is charged to the shared rate limiter
+        limiter=llm_rate_limiter,
+        lane=BACKGROUND
+    )
+    agent_logger.info(f"Using OpenAI model: {model_name}")
+    return llm
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """Return the durable, pruned memory of the agent."""
+    return SQLiteCheckpointSaver()
 
-# Create memory saver for the agent
-checkpointer = InMemorySaver()
+@lru_cache(maxsize=None)
+def get_agent():
+    """Return the assignment agent, creating it on first use."""
+    from langgraph.prebuilt import create_react_agent
+    from shared.tool_executor import ConcurrentToolNode
+
+    try:
+        agent = create_react_agent(
+            model=get_llm(),
+            # Independent tool calls of one turn run concurrently, each with its own deadline; assignments
+            # are writes and run to completion, and fit analyses share the behavior tree blackboard
+            tools=ConcurrentToolNode(tools, write_tools={"assign_task_to_developer"},
+                                     serial_tools={"analyze_task_assignment_fit"}),
+            prompt=system_prompt,
+            checkpointer=get_checkpointer()
+        )
+        agent_logger.info("Assignment agent initialization complete")
+        return agent
+    except Exception as e:
+        agent_logger.error(f"Failed to initialize agent: {str(e)}")
+        raise
 
-# Create the agent
-try:
-    agent = create_react_agent(
-        model=llm,
-        tools=tools,
-        prompt=system_prompt,
-        checkpointer=checkpointer
+def _build_assignment_query(task_id, developer_id, analysis):
+    """Build the agent prompt for a task/developer pair from the behavior tree analysis."""
+    return (
+        f"Analyze task {task_id} and determine if it should be assigned to developer {developer_id}. "
+        f"The behavior tree analysis shows: {analysis.get('recommendation', analysis.get('error', 'No recommendation available'))} "
+        f"with explanation: {analysis.get('explanation', 'No explanation available')}. "
+        "Consider this along with the developer's current workload and availability."
     )
-    agent_logger.info("Assignment agent initialization complete")
-except Exception as e:
-    agent_logger.error(f"Failed to initialize agent: {str(e)}")
-    raise
 
-async def process_task_assignment(task_id, developer_id):
+def _extract_agent_output(response):
+    """Return the content of the last message produced by the agent."""
+    if isinstance(response, dict) and response.get("messages"):
+        return response["messages"][-1].content
+    return None
+
+def _behavior_tree_decision(task_id, developer_id, analysis, reason):
+    """Answer with the behavior tree verdict when the LLM cannot be reached."""
+    if "error" in analysis:
+        return {"error": f"{reason}; behavior tree analysis failed: {analysis['error']}", "task_id": task_id, "developer_id": developer_id}
+    agent_logger.warning(f"Falling back to behavior tree decision for task {task_id}, developer {developer_id}: {reason}")
+    return {
+        "task_id": task_id,
+        "developer_id": developer_id,
+        "agent_response": f"{analysis.get('recommendation')}. {analysis.get('explanation', '')} (LLM unavailable, behavior tree decision)",
+        "behavior_tree_analysis": analysis,
+        "processed": True,
+        "fallback": "behavior_tree"
+    }
+
+async def process_task_assignment(task_id, developer_id, analysis=None):
     """
     Process a task assignment request using the LLM-powered agent
     
     Args:
         task_id: ID of the task to assign
         developer_id: ID of the developer to consider assigning to
+        analysis: Optional behavior tree analysis computed beforehand
         
     Returns:
-        Assignment decision and explanation
+        Assignment decision and explanation. While the LLM is unavailable the
+        behavior tree decision is returned with ``"fallback": "behavior_tree"``.
     """
     try:
         # First, analyze the assignment using the behavior tree
-        analysis = analyze_task_assignment_fit(task_id, developer_id)
+        if analysis is None:
+            analysis = analyze_task_assignment_fit(task_id, developer_id)
+        
+        # Don't wait on a provider known to be down
+        if llm_circuit_breaker.is_open:
+            return _behavior_tree_decision(task_id, developer_id, analysis, "LLM circuit breaker is open")
         
-        # Run the agent with the assignment query and include the analysis
-        response = agent.invoke({
-            "input": f"Analyze task {task_id} and determine if it should be assigned to developer {developer_id}. The behavior tree analysis shows: {analysis['recommendation']} with explanation: {analysis.get('explanation', 'No explanation available')}. Consider this along with the developer's current workload and availability."
-        })
+        # Run the agent with the assignment query and include the analysis.
+        # Repeated task and developer lookups within the run are memoized.
+        with record_cache.run_scope():
+            response = await get_agent().ainvoke(
+                {"messages": [("user", _build_assignment_query(task_id, developer_id, analysis))]},
+                config={"configurable": {"thread_id": f"assignment_{task_id}_{developer_id}"}}
+            )
         
-        if isinstance(response, dict) and "output" in response:
+        output = _extract_agent_output(response)
+        if output:
             return {
                 "task_id": task_id,
                 "developer_id": developer_id,
-                "agent_response": response["output"],
+                "agent_response": output,
                 "behavior_tree_analysis": analysis,
                 "processed": True
             }
@@ -77,6 +140,8 @@ async def process_task_assignment(task_id, developer_id):
                 "task_id": task_id,
                 "developer_id": developer_id
             }
+    except LLMUnavailableError as e:
+        return _behavior_tree_decision(task_id, developer_id, analysis, str(e))
     except Exception as e:
         agent_logger.error(f"Error in agent processing: {e}")
-        return {"error": str(e)} 
\ No newline at end of file
+        return {"error": str(e), "task_id": task_id, "developer_id": developer_id}
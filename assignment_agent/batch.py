@@ -0,0 +1,135 @@
+"""
+Intelligent batch assignment with bounded concurrency.
+
+Every task is pre-scored against the candidate developers with the behavior tree
+on a worker thread, then the LLM-backed agent reviews the best candidate. Tasks
+are fanned out under a concurrency cap and a requests-per-minute limit, and results
+are yielded as soon as each task completes, including tasks with no candidate.
+"""
+
+import asyncio
+import time
+from logger.config import agent_logger
+from .agent import process_task_assignment
+from .tools import analyze_task_assignment_fit
+from .precompute import rank as _rank
+from .config import batch_concurrency, batch_rate_limit_per_minute
+
+
+class RateLimiter:
+    """Space out call starts so that at most `rate_per_minute` begin each minute."""
+
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute and rate_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class BatchStats:
+    """Throughput and failure counters for a batch run."""
+
+    def __init__(self, total):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+
+    def record(self, result):
+        self.completed += 1
+        if "error" in result:
+            self.failed += 1
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "elapsed_seconds": round(elapsed, 3),
+            "tasks_per_minute": round(self.completed / elapsed * 60, 2) if elapsed > 0 else 0.0
+        }
+
+
+def prescore_task(task_id, developer_ids):
+    """
+    Score a task against every candidate developer with the behavior tree.
+
+    Args:
+        task_id: ID of the task
+        developer_ids: IDs of the candidate developers
+
+    Returns:
+        Tuple of the best developer ID and its analysis, or (None, None) if no
+        developer could be analyzed
+    """
+    best_id, best_analysis = None, None
+    for developer_id in developer_ids:
+        analysis = analyze_task_assignment_fit(task_id, developer_id)
+        if "error" in analysis:
+            continue
+        if best_analysis is None or _rank(analysis) > _rank(best_analysis):
+            best_id, best_analysis = developer_id, analysis
+    return best_id, best_analysis
+
+
+async def run_intelligent_batch(task_ids, developer_ids, concurrency=None, rate_limit_per_minute=None):
+    """
+    Run the intelligent assignment path over many tasks concurrently.
+
+    Args:
+        task_ids: IDs of the tasks to assign
+        developer_ids: IDs of the candidate developers
+        concurrency: Maximum number of agent calls in flight (defaults to config)
+        rate_limit_per_minute: Maximum agent calls started per minute (defaults to config)
+
+    Yields:
+        Per-task result dictionaries in completion order, followed by a final
+        ``{"summary": ...}`` dictionary with throughput and failure counts
+    """
+    concurrency = concurrency or batch_concurrency
+    rate_limit_per_minute = batch_rate_limit_per_minute if rate_limit_per_minute is None else rate_limit_per_minute
+    stats = BatchStats(len(task_ids))
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_limit_per_minute)
+
+    prescoring = asyncio.Semaphore(concurrency)
+    agent_logger.info(f"Batch assignment of {len(task_ids)} tasks against {len(developer_ids)} developers")
+
+    async def run_one(task_id):
+        developer_id = None
+        try:
+            # Pre-scoring queries the database, so it runs off the event loop
+            async with prescoring:
+                developer_id, analysis = await asyncio.to_thread(prescore_task, task_id, developer_ids)
+            if developer_id is None:
+                return {"error": f"No candidate developer for task {task_id}", "task_id": task_id, "developer_id": None}
+            async with semaphore:
+                await limiter.acquire()
+                return await process_task_assignment(task_id, developer_id, analysis=analysis)
+        except Exception as e:
+            agent_logger.error(f"Batch assignment of task {task_id} failed: {e}")
+            return {"error": str(e), "task_id": task_id, "developer_id": developer_id}
+
+    pending = [asyncio.create_task(run_one(task_id)) for task_id in task_ids]
+    try:
+        for future in asyncio.as_completed(pending):
+            result = await future
+            stats.record(result)
+            yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+    summary = stats.to_dict()
+    agent_logger.info(f"Batch assignment finished: {summary}")
+    yield {"summary": summary}
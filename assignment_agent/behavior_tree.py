@@ -7,6 +7,7 @@ import json
 import redis
 from dotenv import load_dotenv
 import os
+import threading
 from logger.config import agent_logger
 
 # Connect to Redis
@@ -17,6 +18,8 @@ class TaskAssignmentBehaviorTree:
         """Initialize the behavior tree for task assignment decisions"""
         self.blackboard = py_trees.blackboard.Blackboard()
         self.tree = self._create_tree()
+        # The blackboard is shared, so analyses run one at a time
+        self._lock = threading.Lock()
         
     def _create_tree(self):
         """Create the behavior tree structure"""
@@ -242,24 +245,25 @@ class TaskAssignmentBehaviorTree:
         Returns:
             Analysis results
         """
-        # Set data in blackboard
-        self.blackboard.set("task_id", task_id)
-        self.blackboard.set("developer_id", developer_id)
+        with self._lock:
+            # Set data in blackboard
+            self.blackboard.set("task_id", task_id)
+            self.blackboard.set("developer_id", developer_id)
         
-        # Setup and tick the tree
-        self.tree.setup()
-        self.tree.tick_once()
+            # Setup and tick the tree
+            self.tree.setup()
+            self.tree.tick_once()
         
-        # Get results from blackboard
-        error = self.blackboard.get("error", None)
-        if error:
-            return {"error": error, "task_id": task_id, "developer_id": developer_id}
+            # Get results from blackboard
+            error = self.blackboard.get("error", None)
+            if error:
+                return {"error": error, "task_id": task_id, "developer_id": developer_id}
             
-        # Get recommendation
-        recommendation = self.blackboard.get("recommendation", "No recommendation available")
-        recommendation_score = self.blackboard.get("recommendation_score", 0.0)
-        skill_match = self.blackboard.get("skill_match", 0.0)
-        workload = self.blackboard.get("workload", 0.0)
+            # Get recommendation
+            recommendation = self.blackboard.get("recommendation", "No recommendation available")
+            recommendation_score = self.blackboard.get("recommendation_score", 0.0)
+            skill_match = self.blackboard.get("skill_match", 0.0)
+            workload = self.blackboard.get("workload", 0.0)
         
         # Create result
         result = {
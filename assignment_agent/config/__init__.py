@@ -11,12 +11,20 @@ load_dotenv()
 
 # Access the OpenAI API key
 openai_api_key = os.getenv('OPENAI_API_KEY')
-if not openai_api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set")
+
+def get_openai_api_key():
+    """Return the OpenAI API key, failing only when the LLM is actually needed."""
+    if not openai_api_key:
+        raise ValueError("OPENAI_API_KEY environment variable not set")
+    return openai_api_key
 
 # Get model name from environment variable or use default
 model_name = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
 
+# Intelligent batch assignment limits
+batch_concurrency = int(os.getenv('ASSIGNMENT_BATCH_CONCURRENCY', '8'))
+batch_rate_limit_per_minute = int(os.getenv('ASSIGNMENT_BATCH_RATE_LIMIT_PER_MINUTE', '60'))
+
 # Connect to Redis
 redis_client = redis.StrictRedis(host='localhost', port=6379, db=0)
 
@@ -1,11 +1,51 @@
+import json
+from datetime import date
+from typing import Optional
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from shared.logger import log_decision
+from shared import metrics
+from shared.export import export, EXPORT_KINDS, EXPORT_FORMATS, MEDIA_TYPES
 from .agent import process_task_assignment
+from .batch import run_intelligent_batch
 from shared.models import SessionLocal, Task, Assignment, User
 from .tools import assign_task_to_developer
+from .precompute import precomputer, get_recommendations, PRECOMPUTE_ENABLED
 
 app = FastAPI()
 
+@app.on_event("startup")
+def start_precompute():
+    """Precompute assignment analyses of new tasks in the background."""
+    if PRECOMPUTE_ENABLED:
+        precomputer.start()
+
+@app.on_event("shutdown")
+def stop_precompute():
+    precomputer.stop()
+
+@app.get("/metrics")
+async def read_metrics():
+    """Get in-process service metrics (LLM queue wait times, request counts)."""
+    return metrics.snapshot()
+
+@app.get("/export/{kind}")
+async def export_data(kind: str, format: str = "ndjson", project_id: Optional[int] = None,
+                      since: Optional[date] = None, until: Optional[date] = None):
+    """Stream tasks, assignments or assignment decisions as NDJSON or CSV, optionally filtered by project and date range."""
+    if kind not in EXPORT_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {kind}. Use one of: {', '.join(EXPORT_KINDS)}")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown export format: {format}. Use one of: {', '.join(EXPORT_FORMATS)}")
+
+    extension = "csv" if format == "csv" else "ndjson"
+    return StreamingResponse(
+        export(kind, format, project_id=project_id, since=since, until=until),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{kind}.{extension}"'}
+    )
+
 @app.post("/assign/intelligent")
 async def assign_task_intelligent(task_id: int, developer_id: int):
     result = await process_task_assignment(task_id, developer_id)
@@ -17,6 +57,14 @@ async def assign_task_intelligent(task_id: int, developer_id: int):
     log_decision(f"AI Agent decision: {result.get('agent_response', '')[:100]}...", task_id=task_id, developer_id=developer_id)
     return result 
 
+@app.get("/assign/intelligent/recommendations/{task_id}")
+async def read_recommendations(task_id: int):
+    """Get the best candidate developers for a task, served from precomputed analyses while their inputs are unchanged."""
+    recommendations = await run_in_threadpool(get_recommendations, task_id)
+    if not recommendations:
+        raise HTTPException(status_code=404, detail=f"No candidate developers found for task {task_id}")
+    return {"task_id": task_id, "recommendations": recommendations}
+
 @app.post("/assign/intelligent/batch")
 async def assign_all_intelligent():
     """Find all unassigned tasks and assign each one to an available developer based on the least number of current assignments."""
@@ -48,4 +96,31 @@ async def assign_all_intelligent():
         assignments_results.append({"task_id": task.id, "developer_id": selected_dev_id, "result": result})
     
     db.commit()
-    return {"assignments": assignments_results} 
\ No newline at end of file
+    return {"assignments": assignments_results}
+
+@app.post("/assign/intelligent/batch/stream")
+async def assign_all_intelligent_stream(concurrency: Optional[int] = None, rate_limit_per_minute: Optional[int] = None):
+    """Run the LLM-backed assignment path over all unassigned tasks, streaming NDJSON results as they complete."""
+    db = SessionLocal()
+    try:
+        task_ids = [task.id for task in db.query(Task.id).filter(~Task.id.in_(db.query(Assignment.task_id))).all()]
+        developer_ids = [dev.id for dev in db.query(User.id).filter(User.role=='developer', User.disabled==False).all()]
+    finally:
+        db.close()
+
+    if not task_ids:
+        return {"message": "No unassigned tasks found."}
+
+    if not developer_ids:
+        return {"message": "No available developers found."}
+
+    async def stream_results():
+        async for result in run_intelligent_batch(task_ids, developer_ids, concurrency, rate_limit_per_minute):
+            if "summary" not in result:
+                if "error" in result:
+                    log_decision(f"Assignment failed: {result['error']}", task_id=result.get("task_id"), developer_id=result.get("developer_id"))
+                else:
+                    log_decision(f"AI Agent decision: {result.get('agent_response', '')[:100]}...", task_id=result["task_id"], developer_id=result["developer_id"])
+            yield json.dumps(result, default=str) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
@@ -0,0 +1,223 @@
+"""
+Speculative precomputation of assignment analyses.
+
+New tasks are picked up in the background as soon as they are created. Each one
+is scored against every available developer with the behavior tree and the
+analyses of the top candidates are stored, keyed by task, developer and a digest
+of the behavior tree's inputs (the data version). Later requests reuse a stored
+analysis while its data version still matches and compute it afresh otherwise.
+
+Only the side-effect free analysis is precomputed: the agent itself may assign
+tasks, so it still runs on request.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import func
+
+from logger.config import agent_logger
+from shared import metrics
+from shared.models import SessionLocal, AssignmentAnalysis, Assignment, Task, User
+from . import behavior_tree
+
+# Whether analyses are precomputed, for how many developers per task, and how often new tasks are looked for
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "true").lower() in ("1", "true", "yes")
+PRECOMPUTE_TOP_K = int(os.getenv("PRECOMPUTE_TOP_K", "3"))
+PRECOMPUTE_POLL_SECONDS = float(os.getenv("PRECOMPUTE_POLL_SECONDS", "5"))
+
+
+def _input_keys(task_id, developer_id):
+    """Return the Redis keys the behavior tree reads for a task/developer pair."""
+    return [
+        f"task:{task_id}",
+        f"developer:{developer_id}:availability",
+        f"developer:{developer_id}:skills",
+        f"developer:{developer_id}:task_count",
+        f"developer:{developer_id}:capacity",
+    ]
+
+
+def data_version(task_id, developer_id):
+    """Return a digest of the data an analysis of the pair depends on, read in one round trip."""
+    values = behavior_tree.redis_client.mget(_input_keys(task_id, developer_id))
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(b"\x00" if value is None else b"\x01" + value)
+    return digest.hexdigest()
+
+
+def rank(analysis):
+    """Order analyses by tree score, preferring lighter workloads on ties."""
+    if "error" in analysis:
+        return (-1.0, 0.0)
+    return (analysis.get("score", 0.0), -analysis.get("workload", 0.0))
+
+
+def get_precomputed_analysis(task_id, developer_id):
+    """Return the stored analysis of the pair if its data version is still current, else None."""
+    db = SessionLocal()
+    try:
+        row = db.get(AssignmentAnalysis, (task_id, developer_id))
+        if row is None:
+            metrics.increment("precompute.misses")
+            return None
+        if row.data_version != data_version(task_id, developer_id):
+            metrics.increment("precompute.stale")
+            return None
+        metrics.increment("precompute.hits")
+        return json.loads(row.analysis)
+    finally:
+        db.close()
+
+
+def available_developer_ids(db):
+    """Return the IDs of the developers that can take new tasks."""
+    return [dev_id for (dev_id,) in db.query(User.id).filter(User.role == 'developer', User.disabled == False)]
+
+
+def precompute_task(task_id, developer_ids=None, top_k=PRECOMPUTE_TOP_K):
+    """
+    Score a task against the candidate developers and store the top analyses.
+
+    Args:
+        task_id: ID of the task
+        developer_ids: IDs of the candidate developers, all available developers by default
+        top_k: Number of best-ranked analyses stored
+
+    Returns:
+        The stored analyses, best first
+    """
+    start = time.perf_counter()
+    db = SessionLocal()
+    try:
+        if developer_ids is None:
+            developer_ids = available_developer_ids(db)
+        scored = []
+        for developer_id in developer_ids:
+            # Read the version first, so a change during the analysis leaves the entry stale
+            version = data_version(task_id, developer_id)
+            analysis = behavior_tree.assignment_tree.analyze_assignment(task_id, developer_id)
+            if "error" not in analysis:
+                scored.append((analysis, version))
+        scored.sort(key=lambda item: rank(item[0]), reverse=True)
+        best = scored[:top_k]
+        db.query(AssignmentAnalysis).filter(AssignmentAnalysis.task_id == task_id).delete()
+        db.add_all([
+            AssignmentAnalysis(task_id=task_id, developer_id=analysis["developer_id"], data_version=version, analysis=json.dumps(analysis))
+            for analysis, version in best
+        ])
+        db.commit()
+    finally:
+        db.close()
+    metrics.increment("precompute.tasks")
+    metrics.observe("precompute.task_seconds", time.perf_counter() - start)
+    return [analysis for analysis, _ in best]
+
+
+def get_recommendations(task_id):
+    """
+    Return the ranked candidate analyses of a task, serving stored ones while they are current.
+
+    Stale or missing analyses are recomputed for the whole task.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(AssignmentAnalysis).filter(AssignmentAnalysis.task_id == task_id).all()
+        stored = [(json.loads(row.analysis), row.data_version) for row in rows]
+    finally:
+        db.close()
+    if stored and all(version == data_version(task_id, analysis["developer_id"]) for analysis, version in stored):
+        metrics.increment("precompute.hits")
+        return sorted((analysis for analysis, _ in stored), key=rank, reverse=True)
+    metrics.increment("precompute.stale" if stored else "precompute.misses")
+    return precompute_task(task_id)
+
+
+class AnalysisPrecomputer:
+    """
+    Background worker that precomputes analyses of newly created tasks.
+
+    Tasks are created by the intake agent in another process, so the worker
+    notices them by polling for task IDs above the highest one it has seen.
+    Tasks can also be queued directly with schedule().
+
+    Args:
+        poll_seconds: Interval between checks for new tasks
+        top_k: Number of best-ranked analyses stored per task
+    """
+
+    def __init__(self, poll_seconds=PRECOMPUTE_POLL_SECONDS, top_k=PRECOMPUTE_TOP_K):
+        self.poll_seconds = poll_seconds
+        self.top_k = top_k
+        self.last_task_id = None
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def schedule(self, task_ids):
+        """Queue tasks for precomputation."""
+        for task_id in task_ids:
+            self._queue.put(task_id)
+
+    def poll(self):
+        """Queue the unassigned tasks created since the last poll."""
+        db = SessionLocal()
+        try:
+            if self.last_task_id is None:
+                # Tasks created before startup are analysed on demand
+                self.last_task_id = db.query(func.max(Task.id)).scalar() or 0
+                return
+            task_ids = [task_id for (task_id,) in db.query(Task.id).filter(
+                Task.id > self.last_task_id, ~Task.id.in_(db.query(Assignment.task_id))
+            ).order_by(Task.id)]
+            self.last_task_id = max(task_ids, default=self.last_task_id)
+        finally:
+            db.close()
+        self.schedule(task_ids)
+
+    def run_pending(self, timeout=0):
+        """Precompute the queued tasks, waiting up to timeout seconds for the first one."""
+        try:
+            task_id = self._queue.get(timeout=timeout) if timeout else self._queue.get_nowait()
+        except queue.Empty:
+            return 0
+        count = 0
+        while True:
+            try:
+                precompute_task(task_id, top_k=self.top_k)
+                count += 1
+            except Exception as e:
+                agent_logger.error(f"Precomputing analyses for task {task_id} failed: {e}")
+            try:
+                task_id = self._queue.get_nowait()
+            except queue.Empty:
+                return count
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                agent_logger.error(f"Polling for new tasks to precompute failed: {e}")
+            count = self.run_pending(timeout=self.poll_seconds)
+            if count:
+                agent_logger.info(f"Precomputed assignment analyses for {count} new tasks")
+
+    def start(self):
+        """Start the background worker thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="assignment-precompute", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the background worker thread to stop after its current task."""
+        self._stop.set()
+
+
+# Started by the assignment agent API on startup
+precomputer = AnalysisPrecomputer()
@@ -7,42 +7,63 @@ import uuid
 import time
 from logger.config import agent_logger
 from .behavior_tree import assignment_tree
+from .precompute import get_precomputed_analysis
 from shared.models import get_task, get_user, Assignment, get_db
+from shared.record_cache import record_cache
+
+
+def _load_task_details(task_id):
+    db = get_db()
+    try:
+        task = get_task(db, task_id)
+        if not task:
+            return None
+        return {
+            "id": task.id,
+            "project_id": task.project_id,
+            "title": task.title,
+            "description": task.description,
+            "priority": task.priority,
+            "role_required": task.role_required,
+            "deadline": task.deadline.isoformat() if task.deadline else None,
+            "created_by": task.created_by,
+            "user_id": task.user_id
+        }
+    finally:
+        db.close()
 
 
 def get_task_details(task_id, config=None):
     """Retrieve detailed information for a task given its ID from the database."""
-    db = get_db()
-    task = get_task(db, task_id)
-    if not task:
+    result = record_cache.get_or_load("task", task_id, lambda: _load_task_details(task_id))
+    if result is None:
         return {"error": f"Task with ID {task_id} not found"}
-    result = {
-        "id": task.id,
-        "project_id": task.project_id,
-        "title": task.title,
-        "description": task.description,
-        "priority": task.priority,
-        "role_required": task.role_required,
-        "deadline": task.deadline.isoformat() if task.deadline else None,
-        "created_by": task.created_by,
-        "user_id": task.user_id
-    }
     return result
 
 
+def _load_developer_availability(developer_id):
+    db = get_db()
+    try:
+        user = get_user(db, developer_id)
+        if not user:
+            return None
+        task_count = db.query(Assignment).filter(Assignment.user_id == developer_id).count()
+        availability = "available" if not user.disabled else "unavailable"
+        return {
+            "developer_id": developer_id,
+            "availability": availability,
+            "current_task_count": task_count
+        }
+    finally:
+        db.close()
+
+
 def check_developer_availability(developer_id, config=None):
     """Check a developer's availability by counting current assignments and evaluating the user status."""
-    db = get_db()
-    user = get_user(db, developer_id)
-    if not user:
+    result = record_cache.get_or_load("developer", developer_id, lambda: _load_developer_availability(developer_id))
+    if result is None:
         return {"error": f"Developer with ID {developer_id} not found"}
-    task_count = db.query(Assignment).filter(Assignment.user_id == developer_id).count()
-    availability = "available" if not user.disabled else "unavailable"
-    return {
-        "developer_id": developer_id,
-        "availability": availability,
-        "current_task_count": task_count
-    }
+    return result
 
 
 def assign_task_to_developer(task_id, developer_id, config=None):
@@ -70,7 +91,10 @@ def assign_task_to_developer(task_id, developer_id, config=None):
 def analyze_task_assignment_fit(task_id, developer_id, config=None):
     """Analyze the fit of a task assignment using a behavior tree based evaluation."""
     try:
-        result = assignment_tree.analyze_assignment(task_id, developer_id)
+        # Reuse the analysis precomputed when the task was created, if its inputs are unchanged
+        result = get_precomputed_analysis(task_id, developer_id)
+        if result is None:
+            result = assignment_tree.analyze_assignment(task_id, developer_id)
         if "error" not in result:
             recommendation = result["recommendation"]
             skill_match = result["skill_match"]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-request overhead of resolving the current user from a bearer token.
+
+Usage:
+    python benchmarks/bench_auth.py --requests 20000
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from shared import models
+from intake_agent import auth
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+async def run(token, requests, cached):
+    """Resolve the same token `requests` times, clearing the cache first unless `cached`."""
+    times = []
+    for _ in range(requests):
+        if not cached:
+            auth.token_cache.clear()
+        start = time.perf_counter()
+        await auth.get_current_user(token)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(name, times):
+    print(f"{name}:")
+    print(f"  mean={statistics.mean(times) * 1e6:.1f}us p50={percentile(times, 50) * 1e6:.1f}us p99={percentile(times, 99) * 1e6:.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark get_current_user")
+    parser.add_argument("--requests", type=int, default=20000, help="Number of resolved requests per mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # A throwaway users table, so the benchmark never touches clara_pm.db
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'users.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        models.SessionLocal = auth.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        asyncio.run(auth.create_user("user", "user", "user@example.com", "Regular User"))
+        token = auth.create_access_token({"sub": "user"})
+        report("Verify every request (cached user directory)", asyncio.run(run(token, args.requests, cached=False)))
+        report("Verified-token cache", asyncio.run(run(token, args.requests, cached=True)))
+
+
+if __name__ == "__main__":
+    main()
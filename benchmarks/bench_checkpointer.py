@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark checkpoint write/read latency and on-disk size of the SQLite checkpointer.
+
+Usage:
+    python benchmarks/bench_checkpointer.py --threads 200 --turns 20
+"""
+
+import os
+import sys
+import argparse
+import statistics
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import InMemorySaver
+from shared.checkpoint import SQLiteCheckpointSaver
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(saver, threads, turns):
+    """Write `turns` growing checkpoints for each thread, then read the latest of each."""
+    write_times, read_times = [], []
+    for t in range(threads):
+        config = {"configurable": {"thread_id": f"user_{t}", "checkpoint_ns": ""}}
+        messages = []
+        for turn in range(turns):
+            messages = messages + [
+                HumanMessage(content=f"Please create a task for feature {turn} of project {t}"),
+                AIMessage(content=f"I created task {turn} with priority High for the Developer role. " * 4),
+            ]
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"messages": messages}
+            checkpoint["channel_versions"] = {"messages": turn + 1}
+            start = time.perf_counter()
+            config = saver.put(config, checkpoint, {"source": "loop", "step": turn}, {"messages": turn + 1})
+            write_times.append(time.perf_counter() - start)
+    for t in range(threads):
+        start = time.perf_counter()
+        saver.get_tuple({"configurable": {"thread_id": f"user_{t}"}})
+        read_times.append(time.perf_counter() - start)
+    return write_times, read_times
+
+
+def report(name, write_times, read_times, size_bytes=None):
+    print(f"{name}:")
+    print(f"  write  mean={statistics.mean(write_times) * 1e3:.3f}ms p99={percentile(write_times, 99) * 1e3:.3f}ms")
+    print(f"  read   mean={statistics.mean(read_times) * 1e3:.3f}ms p99={percentile(read_times, 99) * 1e3:.3f}ms")
+    if size_bytes is not None:
+        print(f"  size   {size_bytes / 1024:.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SQLite checkpointer")
+    parser.add_argument("--threads", type=int, default=200, help="Number of conversation threads")
+    parser.add_argument("--turns", type=int, default=20, help="Checkpoints written per thread")
+    parser.add_argument("--keep", type=int, default=10, help="Checkpoints kept per thread")
+    args = parser.parse_args()
+
+    report("InMemorySaver", *run(InMemorySaver(), args.threads, args.turns))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        saver = SQLiteCheckpointSaver(
+            os.path.join(tmp_dir, "checkpoints.db"),
+            max_checkpoints_per_thread=args.keep,
+            compact_interval_seconds=0,
+        )
+        write_times, read_times = run(saver, args.threads, args.turns)
+        saver.compact()
+        report(f"SQLiteCheckpointSaver (keep={args.keep})", write_times, read_times, saver.size_bytes())
+        saver.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent logins and how long they stall the event loop.
+
+Usage:
+    python benchmarks/bench_login.py --logins 32 --rounds 12
+"""
+
+import os
+import sys
+import argparse
+import asyncio
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from shared import models
+from shared.passwords import PasswordHasher, PASSWORD_HASH_WORKERS
+from intake_agent import auth
+
+
+async def run(logins):
+    """Run `logins` concurrent logins while a ticker measures event-loop lag."""
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - started - 0.005)
+
+    ticking = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    results = await asyncio.gather(*(auth.authenticate_user("user", "user") for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await ticking
+    assert all(results)
+    return elapsed, lags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent logins")
+    parser.add_argument("--logins", type=int, default=32, help="Number of concurrent logins")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--workers", type=int, default=PASSWORD_HASH_WORKERS, help="Size of the hashing pool")
+    args = parser.parse_args()
+
+    auth.password_hasher = PasswordHasher(CryptContext(schemes=["bcrypt"], bcrypt__rounds=args.rounds), args.workers)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # A throwaway users table, so the benchmark never touches clara_pm.db
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'users.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        models.SessionLocal = auth.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        asyncio.run(auth.create_user("user", "user", "user@example.com", "Regular User"))
+        elapsed, lags = asyncio.run(run(args.logins))
+
+    print(f"{args.logins} logins, cost {args.rounds}, {args.workers} workers:")
+    print(f"  total={elapsed:.2f}s throughput={args.logins / elapsed:.1f} logins/s")
+    print(f"  event loop lag max={max(lags) * 1e3:.1f}ms over {len(lags)} ticks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compact message log against a list of message dicts: bytes per message and formatting time.
+
+Usage:
+    python benchmarks/bench_message_log.py --messages 1000000
+"""
+
+import os
+import sys
+import argparse
+import gc
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from intake_agent.message_log import MessageLog
+
+
+def format_dicts(messages):
+    # The formatting done before the message log, for comparison
+    return [{"type": "user" if msg["role"] == "user" else "ai", "content": msg["content"]} for msg in messages]
+
+
+def measure(build):
+    """Return what build() returns and the bytes it left allocated."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the message log")
+    parser.add_argument("--messages", type=int, default=1000000, help="Number of messages")
+    args = parser.parse_args()
+
+    # Contents are created up front and shared, so only the per-message overhead is measured
+    contents = [f"Message {i}" for i in range(args.messages)]
+    roles = ["user", "assistant"]
+
+    dicts, dict_bytes = measure(lambda: [{"role": roles[i % 2], "content": contents[i]} for i in range(args.messages)])
+    log, log_bytes = measure(lambda: MessageLog(dicts))
+    print(f"bytes/message besides content: dicts={dict_bytes / args.messages:.1f} log={log_bytes / args.messages:.1f}")
+
+    for name, fn in (
+        ("dicts -> list", lambda: format_dicts(dicts)),
+        ("log view", lambda: log.formatted()),
+        ("log view -> list", lambda: list(log.formatted())),
+        ("log iteration", lambda: sum(1 for _ in log)),
+    ):
+        start = time.perf_counter()
+        fn()
+        print(f"{name}: {(time.perf_counter() - start) * 1e3:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
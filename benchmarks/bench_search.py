@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark conversation search: query latency for a user with many messages, among other users.
+
+Usage:
+    python benchmarks/bench_search.py --messages 100000 --other-users 20
+"""
+
+import os
+import sys
+import argparse
+import itertools
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from shared import models
+from intake_agent.conversation_store import ConversationStore
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark conversation search")
+    parser.add_argument("--messages", type=int, default=100000, help="Messages of the searching user")
+    parser.add_argument("--other-users", type=int, default=20, help="Other users, with as many messages each")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    args = parser.parse_args()
+
+    # Words follow a Zipf distribution, so queries range from very common to rare words
+    rng = random.Random(0)
+    vocabulary = [f"word{i}" for i in range(20000)]
+    cumulative = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+
+    def sentence():
+        return " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=25))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # A throwaway database, so the benchmark never touches clara_pm.db
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'search.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        models.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = models.SessionLocal()
+        users = [models.User(username=f"user{i}", email=f"user{i}@example.com") for i in range(args.other_users + 1)]
+        db.add_all(users)
+        db.commit()
+
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        per_session = 20
+        for user in users:
+            sessions = args.messages // per_session
+            db.execute(insert(models.ConversationSession), [
+                {"session_id": f"{user.id}-{i}", "user_id": user.id} for i in range(sessions)
+            ])
+            db.execute(insert(models.Message), [
+                {"session_id": f"{user.id}-{i // per_session}", "type": "user", "content": sentence(), "timestamp": now}
+                for i in range(sessions * per_session)
+            ])
+            db.commit()
+        db.close()
+        print(f"Indexed {len(users)} users x {args.messages} messages in {time.perf_counter() - start:.1f}s")
+
+        store = ConversationStore(flush_seconds=3600)
+        for label, words in (("common", vocabulary[:10]), ("medium", vocabulary[50:500]), ("rare", vocabulary[2000:20000])):
+            times = []
+            for _ in range(args.queries):
+                query = rng.choice(words) if rng.random() < 0.7 else f"{rng.choice(words)} {rng.choice(vocabulary[:200])}"
+                started = time.perf_counter()
+                store.search("user0", query)
+                times.append(time.perf_counter() - started)
+            print(f"{label}: mean={statistics.mean(times) * 1e3:.2f}ms p50={percentile(times, 50) * 1e3:.2f}ms "
+                  f"p99={percentile(times, 99) * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
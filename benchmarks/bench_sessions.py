@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory-bounded conversation store: resident memory, evictions and page-in latency.
+
+Usage:
+    python benchmarks/bench_sessions.py --sessions 2000 --messages 20 --budget-mb 8
+"""
+
+import os
+import sys
+import argparse
+import random
+import statistics
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from shared import metrics, models
+from intake_agent.conversation_store import ConversationStore
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversation store")
+    parser.add_argument("--sessions", type=int, default=2000, help="Number of sessions")
+    parser.add_argument("--messages", type=int, default=20, help="Messages per session")
+    parser.add_argument("--budget-mb", type=float, default=8, help="Memory budget in MiB")
+    parser.add_argument("--accesses", type=int, default=5000, help="Number of session accesses")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # A throwaway database, so the benchmark never touches clara_pm.db
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'sessions.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        models.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = models.SessionLocal()
+        db.add(models.User(username="user", email="user@example.com"))
+        db.commit()
+        db.close()
+
+        store = ConversationStore(flush_seconds=3600, flush_max_pending=10 ** 9,
+                                  memory_budget_bytes=int(args.budget_mb * 1024 * 1024))
+        start = time.perf_counter()
+        for i in range(args.sessions):
+            store.save("user", f"s{i}", [{"role": "user" if j % 2 == 0 else "assistant",
+                                          "content": f"Message {j} of session {i}. " * 8} for j in range(args.messages)])
+        store.flush()
+        print(f"Stored {args.sessions} sessions x {args.messages} messages in {time.perf_counter() - start:.2f}s")
+
+        # Most accesses go to a few hot sessions, the rest are spread over the cold ones
+        rng = random.Random(0)
+        times = []
+        for _ in range(args.accesses):
+            session_id = f"s{min(int(rng.paretovariate(1.2)) - 1, args.sessions - 1)}"
+            started = time.perf_counter()
+            store.get("user", session_id)
+            times.append(time.perf_counter() - started)
+
+    snapshot = metrics.snapshot()
+    page_ins = snapshot["histograms"].get("conversations.page_in_seconds", {})
+    print(f"resident={store.resident_bytes / 2 ** 20:.1f}MiB budget={args.budget_mb:.1f}MiB "
+          f"evictions={snapshot['counters'].get('conversations.evictions', 0)} "
+          f"page_ins={snapshot['counters'].get('conversations.page_ins', 0)}")
+    print(f"get: mean={statistics.mean(times) * 1e6:.1f}us p50={percentile(times, 50) * 1e6:.1f}us "
+          f"p99={percentile(times, 99) * 1e6:.1f}us")
+    if page_ins:
+        print(f"page-in: p50={page_ins['p50'] * 1e3:.2f}ms p99={page_ins['p99'] * 1e3:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark ranked query latency and on-disk size of the local vector index.
+
+Vectors for the first distinct tasks are computed, then tiled up to the
+requested number of tasks so that large indexes build quickly. The cost of
+reloading the index after another worker process wrote it is reported too.
+
+Usage:
+    python benchmarks/bench_vector_index.py --tasks 1000000
+"""
+
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+from shared.vector_index import VectorIndex, task_text, vectorize
+
+SUBJECTS = ["login page", "billing service", "database migration", "API endpoint", "release pipeline",
+            "search screen", "user profile", "notification emails", "audit log", "onboarding guide"]
+VERBS = ["Implement", "Fix", "Refactor", "Document", "Test", "Deploy", "Design", "Optimize"]
+QUERIES = ["auth", "payments", "fix the crash in the api", "documentation", "schema change", "ship the release"]
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def build(index, tasks, distinct):
+    """Fill the index with `tasks` vectors, tiling the vectors of `distinct` generated tasks."""
+    base = np.stack([
+        vectorize(task_text(f"{VERBS[i % len(VERBS)]} {SUBJECTS[i % len(SUBJECTS)]} {i}",
+                            f"Work item {i} for the {SUBJECTS[(i * 7) % len(SUBJECTS)]}"), index.dim)
+        for i in range(distinct)
+    ])
+    for start in range(0, tasks, distinct):
+        for offset, vector in enumerate(base[:tasks - start]):
+            index._store(start + offset + 1, vector)
+    index.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local vector index")
+    parser.add_argument("--tasks", type=int, default=1_000_000, help="Number of indexed tasks")
+    parser.add_argument("--distinct", type=int, default=10_000, help="Number of distinct task texts")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = VectorIndex(path=tmp_dir)
+        start = time.perf_counter()
+        build(index, args.tasks, min(args.distinct, args.tasks))
+        print(f"Built {len(index)} vectors (dim={index.dim}) in {time.perf_counter() - start:.1f}s")
+
+        times = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            index.search(QUERIES[i % len(QUERIES)], k=20)
+            times.append(time.perf_counter() - start)
+        print(f"  query  p50={percentile(times, 50) * 1e3:.2f}ms p95={percentile(times, 95) * 1e3:.2f}ms")
+
+        # Another worker process writes the index; the next search here first reloads it
+        other = VectorIndex(path=tmp_dir)
+        other.upsert([(args.tasks + 1, "Implement audit log export", "Work item for the audit log")])
+        start = time.perf_counter()
+        index.search(QUERIES[0], k=20)
+        print(f"  query after another worker's write (reload) {(time.perf_counter() - start) * 1e3:.2f}ms")
+
+        size = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir))
+        print(f"  size   {size / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ import LoginForm from './components/LoginForm';
 // Configure API base URL 
 const API_BASE_URL = 'http://localhost:8000';
 
+// The refresh in progress, shared by every request that needs it: a refresh token can be used only once
+let refreshInFlight = null;
+
 function App() {
   const [inputText, setInputText] = useState('');
   const [conversation, setConversation] = useState([]);
@@ -39,15 +42,56 @@ function App() {
   // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);  // fetchSession is defined after this hook, so we're disabling the lint warning
 
+  // Swap the stored refresh token for a new access token; returns null if it is no longer valid
+  const refreshAccessToken = () => {
+    if (!refreshInFlight) {
+      refreshInFlight = requestNewTokens().finally(() => {
+        refreshInFlight = null;
+      });
+    }
+    return refreshInFlight;
+  };
+
+  const requestNewTokens = async () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) {
+      return null;
+    }
+    const response = await fetch(`${API_BASE_URL}/token/refresh`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh_token: refreshToken })
+    });
+    if (!response.ok) {
+      localStorage.removeItem('refreshToken');
+      return null;
+    }
+    const data = await response.json();
+    localStorage.setItem('token', data.access_token);
+    localStorage.setItem('refreshToken', data.refresh_token);
+    setToken(data.access_token);
+    return data.access_token;
+  };
+
+  // Fetch with the access token, refreshing it once if it has expired
+  const authorizedFetch = async (url, options = {}, authToken) => {
+    const withToken = (accessToken) => ({
+      ...options,
+      headers: { ...(options.headers || {}), 'Authorization': `Bearer ${accessToken}` }
+    });
+    const response = await fetch(url, withToken(authToken || token));
+    if (response.status !== 401) {
+      return response;
+    }
+    const newToken = await refreshAccessToken();
+    return newToken ? fetch(url, withToken(newToken)) : response;
+  };
+
   // Fetch an existing session's messages
   const fetchSession = async (sessionId, authToken) => {
     try {
       setError('');
-      const response = await fetch(`${API_BASE_URL}/intake/sessions/${sessionId}`, {
-        headers: {
-          'Authorization': `Bearer ${authToken || token}`
-        }
-      });
+      const response = await authorizedFetch(`${API_BASE_URL}/intake/sessions/${sessionId}`, {}, authToken);
       
       if (!response.ok) {
         // If session not found, clear session ID
@@ -94,6 +138,7 @@ function App() {
       
       // Save token and set authentication state
       localStorage.setItem('token', data.access_token);
+      localStorage.setItem('refreshToken', data.refresh_token);
       setToken(data.access_token);
       
       // Get user information
@@ -121,6 +166,7 @@ function App() {
   const handleLogout = () => {
     // Clear token and user info
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('user');
     localStorage.removeItem('sessionId');
     setToken('');
@@ -155,11 +201,10 @@ function App() {
       
       console.log('Sending request with payload:', payload);
       
-      const response = await fetch(`${API_BASE_URL}/intake/query`, {
+      const response = await authorizedFetch(`${API_BASE_URL}/intake/query`, {
         method: 'POST',
         headers: { 
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          'Content-Type': 'application/json'
         },
         body: JSON.stringify(payload)
       });
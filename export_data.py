@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Export tasks, assignments or assignment decisions as NDJSON or CSV.
+
+Examples:
+    python export_data.py tasks --format csv --project-id 1 -o tasks.csv
+    python export_data.py assignments --since 2026-01-01 --until 2026-03-31
+"""
+
+import argparse
+import os
+import sys
+from datetime import date
+
+# Add the parent directory to the path so we can import the modules
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from shared.export import export, EXPORT_KINDS, EXPORT_FORMATS, EXPORT_BATCH_SIZE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream an export of the Clara PM database.")
+    parser.add_argument("kind", choices=EXPORT_KINDS, help="What to export")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson", help="Output format (default: ndjson)")
+    parser.add_argument("--project-id", type=int, help="Only export tasks and assignments of this project")
+    parser.add_argument("--since", type=date.fromisoformat, help="First date to include (YYYY-MM-DD)")
+    parser.add_argument("--until", type=date.fromisoformat, help="Last date to include (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE, help="Rows fetched per round trip")
+    parser.add_argument("-o", "--output", help="Output file (default: standard output)")
+    args = parser.parse_args(argv)
+
+    chunks = export(args.kind, args.format, project_id=args.project_id, since=args.since,
+                    until=args.until, batch_size=args.batch_size)
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
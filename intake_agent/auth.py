@@ -1,15 +1,25 @@
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
+from collections import OrderedDict
 from pydantic import BaseModel
+import hashlib
 import os
+import secrets
+import threading
+import time
+import uuid
 from logger import system_logger
+from shared import metrics, models
+from shared.models import SessionLocal
+from shared.user_directory import user_directory, USER_DIRECTORY_TTL_SECONDS
+from shared.last_login import last_login_recorder
 
-# Configure password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing runs on a bounded worker pool, off the event loop
+from shared.passwords import pwd_context, password_hasher
 
 # Configure OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -20,29 +30,21 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-for-development-only")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Mock user database - replace with a real database in production
-users_db = {
-    "admin": {
-        "username": "admin",
-        "full_name": "Admin User",
-        "email": "admin@example.com",
-        "hashed_password": pwd_context.hash("admin"),
-        "disabled": False,
-        "role": "admin"
-    },
-    "user": {
-        "username": "user",
-        "full_name": "Regular User",
-        "email": "user@example.com",
-        "hashed_password": pwd_context.hash("user"),
-        "disabled": False,
-        "role": "user"
-    }
-}
+# Lifetime of a refresh token; each rotation issues a successor with a fresh lifetime
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+# Seconds during which a just-rotated refresh token may be presented again, e.g. by a concurrent request
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_TOKEN_REUSE_GRACE_SECONDS", "10"))
+
+# Maximum number of verified tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
     
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -55,30 +57,52 @@ class User(BaseModel):
     role: Optional[str] = None
     
 class UserInDB(User):
+    id: Optional[int] = None
     hashed_password: str
 
 def verify_password(plain_password, hashed_password):
     """Verify that the provided password matches the hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_and_update(plain_password, hashed_password)[0]
 
 def get_password_hash(password):
     """Generate a hash for the given password."""
-    return pwd_context.hash(password)
-
-def get_user(db, username: str):
-    """Retrieve a user from the database."""
-    if username in db:
-        user_dict = db[username]
-        return UserInDB(**user_dict)
-    return None
-
-def authenticate_user(db, username: str, password: str):
-    """Authenticate a user with username and password."""
-    user = get_user(db, username)
+    return password_hasher.hash(password)
+
+def get_user(username: str):
+    """Retrieve a user through the cached user directory."""
+    record = user_directory.get(username)
+    if record is None:
+        return None
+    return UserInDB(**record)
+
+def _store_password_hash(username: str, new_hash: str):
+    """Store an upgraded password hash. This also updates last_login."""
+    db = SessionLocal()
+    try:
+        user_row = models.get_user_by_username(db, username)
+        models.update_user(db, user_row.id, hashed_password=new_hash)
+    finally:
+        db.close()
+
+async def authenticate_user(username: str, password: str):
+    """
+    Authenticate a user with username and password.
+
+    The password is verified on the hashing pool, so the event loop keeps serving
+    other requests. A hash made with an outdated cost factor is replaced. The login
+    time is written to last_login in the next batch.
+    """
+    user = get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.averify_and_update(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        system_logger.info(f"Rehashing the password of {username} with the current cost factor")
+        await run_in_threadpool(_store_password_hash, username, new_hash)
+    else:
+        last_login_recorder.record(username)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -92,8 +116,155 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def _refresh_token_digest(token: str):
+    # Refresh tokens are 256-bit random values, so a fast hash is as safe as bcrypt here
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _refresh_token_expiry():
+    return datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+
+def issue_refresh_token(user_id: int):
+    """Create the first refresh token of a login and return its value."""
+    token = secrets.token_urlsafe(32)
+    db = SessionLocal()
+    try:
+        models.create_refresh_token(db, user_id, _refresh_token_digest(token), uuid.uuid4().hex, _refresh_token_expiry())
+    finally:
+        db.close()
+    return token
+
+def rotate_refresh_token(refresh_token: str):
+    """
+    Exchange a refresh token for its successor.
+
+    Each refresh token can be used once. A token presented again after it was
+    rotated has probably been stolen, so every token of its login is revoked,
+    unless it was rotated within the last REFRESH_TOKEN_REUSE_GRACE_SECONDS:
+    concurrent requests of one client then each receive a token of the login.
+
+    Returns:
+        Tuple of the user and the new refresh token, or None if the token is not valid
+    """
+    db = SessionLocal()
+    try:
+        row = models.get_refresh_token(db, _refresh_token_digest(refresh_token))
+        if row is None or row.expires_at <= datetime.utcnow():
+            metrics.increment("auth.refresh.rejected")
+            return None
+        token = secrets.token_urlsafe(32)
+        if row.revoked_at is None:
+            user = get_user(row.user.username) if row.user else None
+            if user is None or user.disabled:
+                metrics.increment("auth.refresh.rejected")
+                return None
+            if models.rotate_refresh_token(db, row, _refresh_token_digest(token), _refresh_token_expiry()):
+                metrics.increment("auth.refresh.rotated")
+                return user, token
+            # Lost the race to a concurrent rotation of the same token
+        if models.recently_rotated(db, row, REFRESH_TOKEN_REUSE_GRACE_SECONDS):
+            user = get_user(row.user.username) if row.user else None
+            if user is None or user.disabled:
+                metrics.increment("auth.refresh.rejected")
+                return None
+            models.create_refresh_token(db, row.user_id, _refresh_token_digest(token), row.family_id, _refresh_token_expiry())
+            metrics.increment("auth.refresh.grace")
+            return user, token
+        revoked = models.revoke_refresh_tokens(db, family_id=row.family_id)
+        metrics.increment("auth.refresh.reused")
+        system_logger.warning(f"Refresh token reused for user id {row.user_id}; revoked {revoked} tokens of its login")
+        return None
+    finally:
+        db.close()
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of verified tokens and their users, keyed by token digest.
+
+    An entry is served until the token's expiry, but for no longer than max_age_seconds,
+    so a repeated request skips the signature check and the user lookup. Entries of a
+    user are revoked in this worker when the user is disabled or deleted; other workers
+    only learn of it from the database, so their entries live no longer than a user
+    directory record and the change reaches them as soon as it reaches their directory.
+
+    Args:
+        max_entries: Maximum number of tokens kept
+        max_age_seconds: Longest time an entry is served
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE, max_age_seconds=USER_DIRECTORY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(token):
+        # Keep only a digest, not the bearer token itself
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, token):
+        """Return the user of a verified, unexpired token, or None."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if time.time() >= expires_at:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, token, expires_at, user):
+        """Remember a verified token until expires_at (a Unix timestamp), or max_age_seconds at most."""
+        key = self._key(token)
+        expires_at = min(expires_at, time.time() + self.max_age_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(user.username, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, user = self._entries.pop(key)
+        keys = self._by_user.get(user.username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user.username]
+
+    def revoke_user(self, username):
+        """Forget every cached token of a user. Returns the number of tokens dropped."""
+        with self._lock:
+            keys = list(self._by_user.get(username, ()))
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+token_cache = VerifiedTokenCache()
+
+# A changed or deleted user must authenticate afresh
+user_directory.on_change(token_cache.revoke_user)
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get the current user from the JWT token."""
+    user = token_cache.get(token)
+    if user is not None:
+        metrics.increment("auth.token_cache.hits")
+        return user
+    metrics.increment("auth.token_cache.misses")
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -107,9 +278,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(users_db, username=token_data.username)
+    user = get_user(token_data.username)
     if user is None:
         raise credentials_exception
+    if payload.get("exp") is not None:
+        token_cache.put(token, payload["exp"], user)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
@@ -118,19 +291,50 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
-def create_user(username: str, password: str, email: str, full_name: str, role: str = "user"):
-    """Create a new user in the database."""
-    if username in users_db:
+async def create_user(username: str, password: str, email: str, full_name: str, role: str = "user"):
+    """Create a new user in the database, hashing the password off the event loop."""
+    hashed_password = await password_hasher.ahash(password)
+
+    def insert():
+        db = SessionLocal()
+        try:
+            if models.get_user_by_username(db, username):
+                return False
+            models.create_user(db, username, email, None, full_name, role, hashed_password=hashed_password)
+            return True
+        finally:
+            db.close()
+
+    if not await run_in_threadpool(insert):
         return False
     
-    users_db[username] = {
-        "username": username,
-        "email": email,
-        "full_name": full_name,
-        "hashed_password": get_password_hash(password),
-        "disabled": False,
-        "role": role
-    }
-    
     system_logger.info(f"Created new user: {username} with role: {role}")
-    return True 
\ No newline at end of file
+    return True
+
+def disable_user(username: str, disabled: bool = True):
+    """Disable (or re-enable) a user. Their cached tokens are revoked by the directory update."""
+    db = SessionLocal()
+    try:
+        user = models.get_user_by_username(db, username)
+        if not user:
+            return False
+        models.update_user(db, user.id, disabled=disabled)
+        if disabled:
+            models.revoke_refresh_tokens(db, user_id=user.id)
+    finally:
+        db.close()
+    system_logger.info(f"{'Disabled' if disabled else 'Enabled'} user: {username}")
+    return True
+
+def delete_user(username: str):
+    """Delete a user. Their cached tokens are revoked by the directory update."""
+    db = SessionLocal()
+    try:
+        user = models.get_user_by_username(db, username)
+        if not user:
+            return False
+        models.delete_user(db, user.id)
+    finally:
+        db.close()
+    system_logger.info(f"Deleted user: {username}")
+    return True
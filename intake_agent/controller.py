@@ -1,25 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
-from intake_agent.langchain_service import agent
+from intake_agent.langchain_service import get_agent
 from logger import conversation_logger, system_logger
+from shared.rate_limit import llm_user
+from intake_agent.task_import import import_task_file, detect_format, IMPORT_FORMATS
+from intake_agent.intent_router import route_query
 from intake_agent.auth import (
-    Token, User, authenticate_user, create_access_token, 
-    get_current_active_user, users_db, ACCESS_TOKEN_EXPIRE_MINUTES
+    Token, User, RefreshRequest, authenticate_user, create_access_token,
+    get_current_active_user, issue_refresh_token, rotate_refresh_token, ACCESS_TOKEN_EXPIRE_MINUTES
 )
 import uuid
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Literal, Optional, Any
 from datetime import datetime, timedelta
 
 router = APIRouter()
 system_logger.info("Controller module initialized")
 
-# In-memory storage for conversation state
-# Format: {username: {session_id: [messages]}}
-user_conversation_store = {}
+# Conversations are kept in memory and written behind to the database
+from intake_agent.conversation_store import conversation_store, new_session_id
+from intake_agent.message_log import MessageLog
 
 class Message(BaseModel):
-    role: str
+    role: Literal["user", "assistant", "system"]
     content: str
 
 class QueryRequest(BaseModel):
@@ -37,7 +42,7 @@ class UserSession(BaseModel):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """Authenticate user and provide access token."""
-    user = authenticate_user(users_db, form_data.username, form_data.password)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -50,37 +55,54 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
     
+    refresh_token = await run_in_threadpool(issue_refresh_token, user.id)
+    
     system_logger.info(f"User {user.username} logged in successfully")
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+@router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest):
+    """Exchange a refresh token for a new access token and a new refresh token, without the password."""
+    rotated = await run_in_threadpool(rotate_refresh_token, request.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotated
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 def _get_or_create_session(username: str, session_id: Optional[str], new_conversation: bool, provided_messages: Optional[List[Message]]):
-    """Helper function to get or create a conversation session."""
-    # Initialize user's conversation store if it doesn't exist
-    if username not in user_conversation_store:
-        user_conversation_store[username] = {}
-    
+    """
+    Helper function to get or create a conversation session.
+
+    Sessions not in memory are loaded from the database. Also returns whether the
+    messages are the stored history, so that only the new exchange needs storing.
+    """
     # Generate a new session ID if needed
     if new_conversation or not session_id:
-        session_id = str(uuid.uuid4())[:8]
+        session_id = new_session_id()
         conversation_logger.info(f"[USER:{username}][SESSION:{session_id}] Starting new conversation")
-        messages = []
-    else:
-        conversation_logger.info(f"[USER:{username}][SESSION:{session_id}] Continuing existing conversation")
-        
-        # Use provided messages or retrieve existing ones
-        if provided_messages:
-            messages = [{"role": msg.role, "content": msg.content} for msg in provided_messages]
-        else:
-            user_sessions = user_conversation_store[username]
-            
-            if session_id not in user_sessions:
-                conversation_logger.warning(f"[USER:{username}][SESSION:{session_id}] Session not found, creating new")
-                session_id = str(uuid.uuid4())[:8]
-                messages = []
-            else:
-                messages = user_sessions[session_id]
+        return session_id, [], False
+    
+    conversation_logger.info(f"[USER:{username}][SESSION:{session_id}] Continuing existing conversation")
+    stored = conversation_store.get(username, session_id)
     
-    return session_id, messages
+    if stored is None:
+        # Unknown to this user, or another user's session: never reuse the ID
+        conversation_logger.warning(f"[USER:{username}][SESSION:{session_id}] Session not found, creating new")
+        session_id = new_session_id()
+    
+    # Use provided messages or retrieve existing ones
+    if provided_messages:
+        return session_id, [{"role": msg.role, "content": msg.content} for msg in provided_messages], False
+    if stored is None:
+        return session_id, [], False
+    return session_id, list(stored), True
 
 def _extract_ai_content(response):
     """Extract AI content from the agent's response."""
@@ -149,6 +171,9 @@ def _generate_session_title(messages):
 
 def _format_messages(messages):
     """Format messages for frontend display."""
+    if isinstance(messages, MessageLog):
+        # A view over the stored messages; nothing is copied until the response is rendered
+        return messages.formatted()
     formatted_messages = []
     for msg in messages:
         msg_type = "user" if msg["role"] == "user" else "ai"
@@ -161,7 +186,8 @@ async def query_llm(request: QueryRequest, current_user: User = Depends(get_curr
     username = current_user.username
     
     # Get or create session
-    session_id, messages = _get_or_create_session(
+    session_id, messages, stored = await run_in_threadpool(
+        _get_or_create_session,
         username,
         request.session_id,
         request.new_conversation,
@@ -175,25 +201,34 @@ async def query_llm(request: QueryRequest, current_user: User = Depends(get_curr
     messages.append({"role": "user", "content": request.input_text})
     
     try:
-        # Use the agent to process the input
-        response = agent.invoke(
-            {"messages": messages},
-            config={
-                "configurable": {
-                    "thread_id": f"{username}_{session_id}",
-                    "username": username  # Pass username to be used by tools
-                }
-            }
-        )
-        
-        # Extract the AI's response
-        ai_content = _extract_ai_content(response)
+        # Answer simple lookups straight from the database, without the LLM
+        routed = await run_in_threadpool(route_query, request.input_text, username, messages)
+        if routed:
+            ai_content = routed["reply"]
+        else:
+            # Use the agent to process the input, charging LLM calls to the user's quota
+            with llm_user(username):
+                response = await get_agent().ainvoke(
+                    {"messages": messages},
+                    config={
+                        "configurable": {
+                            "thread_id": f"{username}_{session_id}",
+                            "username": username  # Pass username to be used by tools
+                        }
+                    }
+                )
+            
+            # Extract the AI's response
+            ai_content = _extract_ai_content(response)
         
         # Add the AI's response to the conversation history
         messages.append({"role": "assistant", "content": ai_content})
         
-        # Store the updated conversation history
-        user_conversation_store[username][session_id] = messages
+        # Store the conversation; it is written to the database in the background
+        if stored:
+            await run_in_threadpool(conversation_store.append, username, session_id, *messages[-2:])
+        else:
+            await run_in_threadpool(conversation_store.save, username, session_id, messages)
         
         # Generate a title for new conversations
         session_title = None
@@ -212,7 +247,8 @@ async def query_llm(request: QueryRequest, current_user: User = Depends(get_curr
             "response": ai_content,
             "session_id": session_id,
             "messages": formatted_messages,
-            "title": session_title
+            "title": session_title,
+            "intent": routed["intent"] if routed else None
         }
     except Exception as e:
         conversation_logger.error(f"[USER:{username}][SESSION:{session_id}] Error: {str(e)}")
@@ -227,69 +263,79 @@ async def query_llm(request: QueryRequest, current_user: User = Depends(get_curr
         }
 
 @router.get("/sessions")
-async def get_user_sessions(current_user: User = Depends(get_current_active_user)):
-    """Retrieve all sessions for the current user."""
+async def get_user_sessions(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Retrieve the current user's sessions, most recently active first, one page at a time."""
     username = current_user.username
+    try:
+        sessions, next_cursor = await run_in_threadpool(conversation_store.list_sessions, username, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     
-    if username not in user_conversation_store:
-        return {"sessions": []}
-    
-    # Create a list of sessions with metadata
-    sessions = []
-    for session_id, messages in user_conversation_store[username].items():
-        # Generate a title based on the first user message
-        title = f"Session {session_id}"
-        if messages and len(messages) > 0:
-            try:
-                first_message = messages[0]["content"]
-                if len(first_message) > 30:
-                    title = first_message[:30] + "..."
-                else:
-                    title = first_message
-            except (KeyError, TypeError):
-                pass
-        
-        # Get last message preview if available
-        last_message_preview = None
-        if messages and len(messages) > 0 and "content" in messages[-1]:
-            content = messages[-1]["content"]
-            last_message_preview = content[:50] + "..." if len(content) > 50 else content
-        
-        sessions.append({
-            "session_id": session_id,
-            "title": title,
-            "message_count": len(messages),
-            "last_message": last_message_preview
-        })
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+@router.get("/sessions/search")
+async def search_sessions(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Search the current user's conversations, returning ranked snippets with their session IDs."""
+    username = current_user.username
+    results, next_offset = await run_in_threadpool(conversation_store.search, username, q, limit, offset)
     
-    return {"sessions": sessions}
+    return {"results": results, "next_offset": next_offset}
 
 @router.get("/sessions/{session_id}")
 async def get_session(session_id: str, current_user: User = Depends(get_current_active_user)):
     """Retrieve the conversation history for a specific session."""
     username = current_user.username
+    messages = await run_in_threadpool(conversation_store.get, username, session_id)
     
-    if username not in user_conversation_store or session_id not in user_conversation_store[username]:
+    if messages is None:
         raise HTTPException(status_code=404, detail="Session not found")
     
     # Format the messages for the frontend
-    messages = user_conversation_store[username][session_id]
     formatted_messages = _format_messages(messages)
     
-    return {
+    # Rendered directly, without re-encoding every message through jsonable_encoder
+    return JSONResponse({
         "session_id": session_id, 
-        "messages": formatted_messages
-    }
+        "messages": list(formatted_messages)
+    })
 
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str, current_user: User = Depends(get_current_active_user)):
     """Delete a session and its conversation history."""
     username = current_user.username
     
-    if username not in user_conversation_store or session_id not in user_conversation_store[username]:
+    if not await run_in_threadpool(conversation_store.delete, username, session_id):
         raise HTTPException(status_code=404, detail="Session not found")
     
-    del user_conversation_store[username][session_id]
     conversation_logger.info(f"[USER:{username}][SESSION:{session_id}] Session deleted")
     
-    return {"success": True, "message": "Session deleted", "session_id": session_id} 
\ No newline at end of file
+    return {"success": True, "message": "Session deleted", "session_id": session_id}
+
+@router.post("/tasks/import")
+async def import_tasks(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Import already structured tasks from a JSONL or CSV file without calling the LLM."""
+    username = current_user.username
+    fmt = (format or detect_format(file.filename, file.content_type) or "").lower()
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unsupported import format. Use a .jsonl or .csv file, or pass format={' or '.join(IMPORT_FORMATS)}"
+        )
+    
+    system_logger.info(f"User {username} importing tasks from {file.filename} ({fmt})")
+    # Parsing and inserting are blocking, so they run off the event loop
+    report = await run_in_threadpool(import_task_file, file.file, fmt, username)
+    return report
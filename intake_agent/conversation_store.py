@@ -0,0 +1,528 @@
+"""
+Write-behind persistence of intake conversations.
+
+Conversations are served from a hot tier, a session backend (see
+``session_backends``): the memory of the process, or Redis when several workers
+share the sessions. Every change is also queued and a background thread writes
+the queue to the ``conversation_sessions`` and ``messages`` tables in one
+transaction, once ``CONVERSATION_FLUSH_MAX_PENDING`` changes are waiting or
+every ``CONVERSATION_FLUSH_SECONDS``, and on shutdown. A reply therefore never
+waits for a commit.
+
+The database serves as the cold tier: a session that is not in the hot tier,
+after an eviction, an expiry or a restart, is paged back in the next time it is
+accessed.
+
+Every session also has a summary (title, message count, a preview of the last
+message and the time of the last activity) that is updated as messages are
+appended. Listing a user's sessions reads only the summaries, newest first, one
+page at a time with keyset cursors.
+"""
+
+import base64
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, delete, func, insert, text, update
+
+from intake_agent.message_log import MessageLog
+from intake_agent.session_backends import (
+    CONVERSATION_MEMORY_BUDGET_BYTES, PREVIEW_CHARS, SessionSummary, shorten, create_session_backend, message_bytes
+)
+from logger import conversation_logger
+from shared import metrics, models
+from shared.models import MESSAGE_SEARCH_STRIDE, ConversationSession, Message, User
+
+# How often and after how many changes conversations are written, and how many matches a search ranks
+CONVERSATION_FLUSH_SECONDS = float(os.getenv("CONVERSATION_FLUSH_SECONDS", "1.0"))
+CONVERSATION_FLUSH_MAX_PENDING = int(os.getenv("CONVERSATION_FLUSH_MAX_PENDING", "200"))
+CONVERSATION_SEARCH_CANDIDATES = int(os.getenv("CONVERSATION_SEARCH_CANDIDATES", "500"))
+# Failed writes of a session before its changes are set aside as dead letters
+CONVERSATION_FLUSH_MAX_ATTEMPTS = int(os.getenv("CONVERSATION_FLUSH_MAX_ATTEMPTS", "3"))
+
+# In memory messages use the agent's roles; the messages table uses "user" and "ai"
+ROLE_TO_TYPE = {"user": "user", "assistant": "ai"}
+TYPE_TO_ROLE = {"user": "user", "ai": "assistant"}
+
+
+# Marks around the matched words of a search snippet
+SNIPPET_OPEN = "["
+SNIPPET_CLOSE = "]"
+
+# Ranks the user's most recent matches, then joins the page with its message and session.
+# The score is the term frequency part of BM25 (k1 = 1.2, b = 0.75), with the
+# average length taken over the candidates. It leaves out the inverse document
+# frequency, which bm25() computes by reading every user's entries for each word,
+# so the cost of a search depends only on the user's own matches. Every result
+# contains every word of the query, which makes that weight matter little.
+_SEARCH_SQL = text("""
+    SELECT page.rowid, page.session_id, m.type, m.timestamp AS timestamp, s.title FROM (
+        SELECT rowid, session_id, tf * 2.2 / (tf + 1.2 * (0.25 + 0.75 * size / avg(size) OVER ())) AS score FROM (
+            SELECT rowid, session_id, length(content) AS size,
+                   length(highlight(messages_fts, 0, char(1), '')) - length(content) AS tf
+            FROM messages_fts
+            WHERE messages_fts MATCH :match AND rowid BETWEEN :low AND :high
+            ORDER BY rowid DESC LIMIT :candidates
+        ) ORDER BY score DESC, rowid DESC LIMIT :limit OFFSET :offset
+    ) AS page
+    JOIN messages m ON m.id = page.rowid - :low
+    JOIN conversation_sessions s ON s.session_id = page.session_id
+    ORDER BY page.score DESC, page.rowid DESC
+""").columns(timestamp=DateTime)
+
+_SNIPPET_SQL = text(
+    "SELECT rowid, snippet(messages_fts, 0, :open, :close, '...', 12) FROM messages_fts "
+    "WHERE messages_fts MATCH :match AND rowid IN :rowids"
+).bindparams(bindparam("rowids", expanding=True))
+
+
+def search_expression(query):
+    """Turn free text into an FTS5 query matching every word, or None if it has no words."""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words)
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def encode_cursor(summary):
+    """Return an opaque cursor that continues a listing after the given session."""
+    key = f"{summary.last_activity.isoformat()}|{summary.session_id}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the sort key encoded in a cursor. Raises ValueError for a malformed cursor."""
+    try:
+        last_activity, session_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return (datetime.fromisoformat(last_activity), session_id)
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class ConversationStore:
+    """
+    Conversations per user, served from a session backend and written behind to the database.
+
+    Args:
+        flush_seconds: Maximum time a change waits before it is written
+        flush_max_pending: Number of queued changes that triggers a write at once
+        memory_budget_bytes: Approximate memory allowed for the messages of resident sessions,
+            with the memory backend
+        backend: Session backend; by default the one selected by ``CONVERSATION_BACKEND``
+    """
+
+    def __init__(self, flush_seconds=CONVERSATION_FLUSH_SECONDS, flush_max_pending=CONVERSATION_FLUSH_MAX_PENDING,
+                 memory_budget_bytes=CONVERSATION_MEMORY_BUDGET_BYTES, backend=None):
+        self.flush_seconds = flush_seconds
+        self.flush_max_pending = flush_max_pending
+        self.memory_budget_bytes = memory_budget_bytes
+        self.backend = backend or create_session_backend(memory_budget_bytes=memory_budget_bytes)
+        self._pending = []
+        self._dirty = Counter()  # Queued or in-flight changes per session ID; such sessions stay resident
+        self._attempts = Counter()  # Failed writes per session ID
+        self.dead_letters = deque(maxlen=1000)  # (session ID, changes, error) that could not be written
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.backend.bind(is_dirty=lambda session_id: self._dirty[session_id] > 0, wake_writer=self._wake.set)
+
+    @property
+    def resident_bytes(self):
+        return getattr(self.backend, "resident_bytes", 0)
+
+    def _queue(self, op):
+        # Called with self._lock held; op[1] is always the session ID
+        self._pending.append(op)
+        self._dirty[op[1]] += 1
+        metrics.set_gauge("conversations.pending", len(self._pending))
+        if len(self._pending) >= self.flush_max_pending:
+            self._wake.set()
+
+    # Reading
+
+    def _load_session(self, username, session_id):
+        """Load a session of the user and its messages from the database, or return None."""
+        db = models.SessionLocal()
+        try:
+            row = db.query(ConversationSession.title, ConversationSession.last_updated).join(
+                User, ConversationSession.user_id == User.id
+            ).filter(User.username == username, ConversationSession.session_id == session_id).first()
+            if row is None:
+                return None
+            summary = SessionSummary(session_id, row.title)
+            messages = MessageLog()
+            for type_, content, timestamp in db.query(Message.type, Message.content, Message.timestamp).filter(
+                Message.session_id == session_id
+            ).order_by(Message.id):
+                messages.append(TYPE_TO_ROLE.get(type_, type_), content, timestamp or summary.last_activity)
+                summary.add(content, timestamp or summary.last_activity)
+            summary.last_activity = row.last_updated or summary.last_activity
+            return summary, messages
+        finally:
+            db.close()
+
+    def _load_summaries(self, username):
+        """Load the summaries of every session of the user, without the message bodies."""
+        db = models.SessionLocal()
+        try:
+            stats = db.query(
+                Message.session_id, func.count(Message.id).label("message_count"), func.max(Message.id).label("last_id")
+            ).group_by(Message.session_id).subquery()
+            rows = db.query(
+                ConversationSession.session_id, ConversationSession.title, ConversationSession.last_updated,
+                stats.c.message_count, func.substr(Message.content, 1, PREVIEW_CHARS + 1)
+            ).join(User, ConversationSession.user_id == User.id).outerjoin(
+                stats, stats.c.session_id == ConversationSession.session_id
+            ).outerjoin(Message, Message.id == stats.c.last_id).filter(User.username == username)
+            return {
+                session_id: SessionSummary(session_id, title, message_count or 0,
+                                           shorten(preview, PREVIEW_CHARS) if preview is not None else None, last_updated)
+                for session_id, title, last_updated, message_count, preview in rows
+            }
+        finally:
+            db.close()
+
+    def get(self, username, session_id):
+        """Return the messages of a session of the user, or None if there is no such session."""
+        messages = self.backend.get_messages(username, session_id)
+        if messages is not None:
+            return messages
+        if self.backend.is_deleted(session_id):
+            return None
+        if self.backend.is_complete(username) and self.backend.get_summary(username, session_id) is None:
+            return None
+        with self._lock:
+            unwritten = self._dirty[session_id]
+        if unwritten:
+            # Changes appended while the session was evicted must reach the database first
+            self.flush()
+        start = time.perf_counter()
+        loaded = self._load_session(username, session_id)
+        metrics.observe("conversations.page_in_seconds", time.perf_counter() - start)
+        if loaded is None:
+            return None
+        summary, messages = loaded
+        # The backend keeps what was created, changed or deleted meanwhile
+        messages, paged_in = self.backend.page_in(username, session_id, summary, messages)
+        if paged_in:
+            metrics.increment("conversations.page_ins")
+        return messages
+
+    def list_sessions(self, username, limit=50, cursor=None):
+        """
+        Return a page of the user's session summaries, most recently active first.
+
+        Args:
+            username: Owner of the sessions
+            limit: Maximum number of sessions returned
+            cursor: Cursor returned with the previous page, or None for the first page
+
+        Returns:
+            Tuple of the summaries as dictionaries and the cursor of the next page
+            (None on the last page)
+        """
+        after = decode_cursor(cursor) if cursor else None
+        if not self.backend.is_complete(username):
+            self.backend.add_summaries(username, self._load_summaries(username))
+        page = self.backend.page(username, after, limit + 1)
+        items = [summary.to_dict() for summary in page[:limit]]
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return items, next_cursor
+
+    def search(self, username, query, limit=20, offset=0):
+        """
+        Search the messages of the user's sessions, best matches first.
+
+        Every word of the query must appear in a message, after stemming. Only the
+        user's ``CONVERSATION_SEARCH_CANDIDATES`` most recent matching messages are
+        ranked, which bounds the cost of very common words. Messages become
+        searchable when they are written to the database.
+
+        Args:
+            username: Owner of the sessions
+            query: Free text
+            limit: Maximum number of results returned
+            offset: Number of results skipped, from the previous page
+
+        Returns:
+            Tuple of the results as dictionaries and the offset of the next page
+            (None on the last page)
+        """
+        match = search_expression(query)
+        if match is None:
+            return [], None
+        start = time.perf_counter()
+        db = models.SessionLocal()
+        try:
+            user_id = db.query(User.id).filter(User.username == username).scalar()
+            if user_id is None:
+                return [], None
+            low = user_id * MESSAGE_SEARCH_STRIDE
+            rows = db.execute(_SEARCH_SQL, {
+                "match": match, "low": low, "high": low + MESSAGE_SEARCH_STRIDE - 1,
+                "candidates": CONVERSATION_SEARCH_CANDIDATES, "limit": limit + 1, "offset": offset
+            }).all()
+            # Sessions deleted but not written yet are still in the index
+            page = [row for row in rows[:limit] if not self.backend.is_deleted(row.session_id)]
+            snippets = dict(db.execute(_SNIPPET_SQL, {
+                "match": match, "rowids": [row.rowid for row in page], "open": SNIPPET_OPEN, "close": SNIPPET_CLOSE
+            }).all()) if page else {}
+            results = [{
+                "session_id": session_id,
+                "title": title,
+                "type": type_,
+                "snippet": snippets.get(rowid),
+                "timestamp": timestamp.isoformat() if timestamp else None
+            } for rowid, session_id, type_, timestamp, title in page]
+        finally:
+            db.close()
+        metrics.observe("conversations.search_seconds", time.perf_counter() - start)
+        return results, offset + limit if len(rows) > limit else None
+
+    # Writing
+    #
+    # The backend is changed and the changes are queued under one lock, so that
+    # they are written in the order in which the backend saw them.
+
+    def _owner(self, session_id):
+        """Return the username that owns a session in the database, or None if there is no such session."""
+        db = models.SessionLocal()
+        try:
+            return db.query(User.username).join(ConversationSession, ConversationSession.user_id == User.id).filter(
+                ConversationSession.session_id == session_id
+            ).scalar()
+        finally:
+            db.close()
+
+    def save(self, username, session_id, messages):
+        """
+        Store the whole history of a session of the user, creating the session if it is new.
+
+        Returns False, storing nothing, if the session ID belongs to another user.
+        """
+        now = datetime.utcnow()
+        stored = self.backend.get_summary(username, session_id) is not None
+        if not stored:
+            owner = self._owner(session_id)
+            if owner is not None and owner != username:
+                conversation_logger.warning(f"[USER:{username}][SESSION:{session_id}] Not storing a session of another user")
+                return False
+            stored = owner == username
+        with self._lock:
+            summary = self.backend.save(username, session_id, messages, now)
+            if summary is None:
+                conversation_logger.warning(f"[USER:{username}][SESSION:{session_id}] Not storing a session of another user")
+                return False
+            if stored:
+                self._queue(("clear", session_id))
+            else:
+                self._queue(("create", session_id, username, now))
+            for message in messages:
+                self._queue(("message", session_id, message["role"], message["content"], now))
+            self._queue(("touch", session_id, summary.title, summary.last_activity))
+        return True
+
+    def append(self, username, session_id, *messages):
+        """Append messages ({"role", "content"} dicts) to a stored session of the user."""
+        if not messages:
+            return
+        now = datetime.utcnow()
+        with self._lock:
+            summary = self.backend.append(username, session_id, messages, now)
+            if summary is None:
+                conversation_logger.warning(f"[USER:{username}][SESSION:{session_id}] Not storing messages of a deleted session")
+                return
+            for message in messages:
+                self._queue(("message", session_id, message["role"], message["content"], now))
+            self._queue(("touch", session_id, summary.title, summary.last_activity))
+
+    def delete(self, username, session_id):
+        """Delete a session of the user. Returns False if there is no such session."""
+        if self.get(username, session_id) is None:
+            return False
+        with self._lock:
+            if self.backend.get_summary(username, session_id) is None:
+                return False
+            self.backend.delete(username, session_id)
+            self._queue(("delete", session_id))
+        return True
+
+    # Write-behind
+
+    def flush(self):
+        """
+        Write the queued changes in one transaction. Returns the number of changes written.
+
+        If the transaction fails, each session's changes are written on their own,
+        so that one session cannot hold back the others. The changes of a session
+        that still fail are queued again, ahead of the changes queued meanwhile.
+        After ``CONVERSATION_FLUSH_MAX_ATTEMPTS`` failures they are moved to
+        ``dead_letters`` instead. The first error is raised once the rest is written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+            if not ops:
+                return 0
+            start = time.perf_counter()
+            try:
+                self._commit(ops)
+                written, error = ops, None
+            except Exception as e:
+                written, error = self._commit_each_session(ops), e
+            self.backend.forget_deleted({op[1] for op in written if op[0] == "delete"})
+            with self._lock:
+                self._dirty -= Counter(op[1] for op in written)
+                metrics.set_gauge("conversations.pending", len(self._pending))
+            # Sessions that were only waiting to be written can be evicted now
+            self.backend.enforce_budget()
+            metrics.increment("conversations.flushes")
+            metrics.observe("conversations.flush_seconds", time.perf_counter() - start)
+            metrics.observe("conversations.flush_size", len(written))
+            if error is not None:
+                raise error
+            return len(written)
+
+    def _commit(self, ops):
+        db = models.SessionLocal()
+        try:
+            self._write(db, ops)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _commit_each_session(self, ops):
+        """Write the changes of each session in its own transaction. Returns the changes written."""
+        sessions = OrderedDict()
+        for op in ops:
+            sessions.setdefault(op[1], []).append(op)
+        written, retry = [], []
+        for session_id, session_ops in sessions.items():
+            try:
+                self._commit(session_ops)
+            except Exception as e:
+                with self._lock:
+                    self._attempts[session_id] += 1
+                    attempts = self._attempts[session_id]
+                if attempts < CONVERSATION_FLUSH_MAX_ATTEMPTS:
+                    retry.extend(session_ops)
+                    continue
+                conversation_logger.error(
+                    f"[SESSION:{session_id}] Giving up on {len(session_ops)} changes after {attempts} failed writes: {e}"
+                )
+                self.dead_letters.append((session_id, session_ops, str(e)))
+                metrics.increment("conversations.dead_letters")
+                with self._lock:
+                    del self._attempts[session_id]
+                    self._dirty -= Counter({session_id: len(session_ops)})
+                continue
+            written.extend(session_ops)
+            with self._lock:
+                self._attempts.pop(session_id, None)
+        with self._lock:
+            self._pending[:0] = retry
+        return written
+
+    def _write(self, db, ops):
+        """Apply ops in order, inserting runs of consecutive messages with one statement."""
+        message_rows = []
+        touched = {}
+
+        def write_messages():
+            if message_rows:
+                db.execute(insert(Message), message_rows)
+                message_rows.clear()
+
+        user_ids = {}
+        rejected = set()  # Sessions that turned out to belong to another user
+        for op in ops:
+            kind = op[0]
+            if op[1] in rejected:
+                continue
+            if kind == "message":
+                _, session_id, role, content, timestamp = op
+                message_rows.append({"session_id": session_id, "type": ROLE_TO_TYPE.get(role, role),
+                                     "content": content, "timestamp": timestamp})
+                continue
+            if kind == "touch":
+                # Only the latest title and activity time of a session are written
+                _, session_id, title, last_activity = op
+                touched[session_id] = (title, last_activity)
+                continue
+            write_messages()
+            if kind == "create":
+                _, session_id, username, created_at = op
+                if username not in user_ids:
+                    user_ids[username] = db.query(User.id).filter(User.username == username).scalar()
+                owner_id = db.query(ConversationSession.user_id).filter(ConversationSession.session_id == session_id).first()
+                if owner_id is not None:
+                    if owner_id[0] != user_ids[username]:
+                        # Created by another user since save() checked; never touch their session
+                        conversation_logger.error(f"[USER:{username}][SESSION:{session_id}] Session belongs to another user")
+                        metrics.increment("conversations.rejected")
+                        rejected.add(session_id)
+                        continue
+                    # Saved again by a worker that no longer had it, e.g. after a restart
+                    db.execute(delete(Message).where(Message.session_id == session_id))
+                    continue
+                db.add(ConversationSession(session_id=session_id, user_id=user_ids[username],
+                                           created_at=created_at, last_updated=created_at))
+                db.flush()
+            elif kind == "clear":
+                db.execute(delete(Message).where(Message.session_id == op[1]))
+            elif kind == "delete":
+                db.execute(delete(Message).where(Message.session_id == op[1]))
+                db.execute(delete(ConversationSession).where(ConversationSession.session_id == op[1]))
+                touched.pop(op[1], None)
+        write_messages()
+        if touched:
+            sessions = ConversationSession.__table__
+            db.execute(
+                update(sessions).where(sessions.c.session_id == bindparam("touched_id")).values(
+                    title=bindparam("touched_title"), last_updated=bindparam("touched_at")
+                ),
+                [{"touched_id": session_id, "touched_title": title or "New Conversation", "touched_at": at}
+                 for session_id, (title, at) in touched.items()]
+            )
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                conversation_logger.error(f"Writing conversations to the database failed: {e}")
+
+    def start(self):
+        """Start the background writer thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background writer thread and write what is still queued."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+# Shared by every intake request in the process
+conversation_store = ConversationStore()
@@ -0,0 +1,303 @@
+"""
+Intent router that answers simple lookup queries without the LLM.
+
+Messages such as "what tasks are assigned to me?" or "list high-priority tasks in
+project 2" are recognised by a small local classifier. It combines rules for the
+query's slots (task ID, project, priority) with a TF-IDF nearest-centroid model
+trained on a handful of example phrasings. Recognised lookups are answered with
+a direct database query and a templated reply. Anything else, and in particular
+any request to change data, falls through to the agent. So do messages that refer
+back to the conversation and replies to an assistant message that proposed tasks:
+"show the high priority ones" there is about the proposal, not the database.
+"""
+
+import math
+import os
+import re
+import time
+from collections import Counter
+
+from sqlalchemy import func
+
+from logger import conversation_logger
+from shared import metrics
+from shared.models import SessionLocal, Task, Assignment, User
+
+# Routing can be turned off; below the confidence threshold a message goes to the agent.
+# Routed answers list at most INTENT_ROUTER_MAX_ITEMS rows.
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+INTENT_ROUTER_MIN_CONFIDENCE = float(os.getenv("INTENT_ROUTER_MIN_CONFIDENCE", "0.35"))
+INTENT_ROUTER_MAX_ITEMS = int(os.getenv("INTENT_ROUTER_MAX_ITEMS", "20"))
+
+# Example phrasings per intent. "other" collects messages that belong to the agent.
+INTENT_EXAMPLES = {
+    "my_tasks": [
+        "what tasks are assigned to me",
+        "show my tasks",
+        "list my assigned tasks",
+        "what am I working on",
+        "which tasks do I have",
+        "what is on my plate",
+    ],
+    "list_tasks": [
+        "list high priority tasks in project 2",
+        "show all tasks",
+        "list all the tasks",
+        "which tasks are in project 3",
+        "tasks in project 2",
+        "show me the low priority tasks",
+        "list unassigned tasks",
+        "what tasks are there",
+        "show the medium priority tasks",
+        "what are the tasks",
+        "which tasks have high priority",
+    ],
+    "count_tasks": [
+        "how many tasks are there",
+        "how many high priority tasks are in project 1",
+        "count the tasks in project 2",
+        "number of unassigned tasks",
+        "how many tasks do we have",
+    ],
+    "task_details": [
+        "show task 12",
+        "details of task 5",
+        "what is task 7 about",
+        "tell me about task 3",
+        "describe task 9",
+    ],
+    "other": [
+        "create a task for the login page",
+        "break this feature down into tasks",
+        "we need to build a payment system",
+        "hello there",
+        "thanks",
+        "the deadline is next friday",
+        "yes please save them",
+        "plan the next sprint for the mobile app",
+        "what should the deadline be for the api work",
+        "can you help me with a website",
+    ],
+}
+
+# Any of these words means the user wants something done or decided, which is the agent's job
+ACTION_WORDS = {
+    "create", "add", "make", "build", "delete", "remove", "update", "change", "edit", "assign",
+    "reassign", "save", "set", "move", "rename", "break", "split", "plan", "generate", "write", "draft",
+    "should", "suggest", "recommend", "estimate", "prioritise", "prioritize",
+}
+
+# Words that refer back to the conversation ("the ones you just listed"), which only the agent can resolve
+CONTEXT_WORDS = {
+    "you", "your", "we", "us", "our", "just", "ones", "those", "these", "them", "they", "above", "earlier", "previous",
+}
+
+# Confidence added for each lookup slot found by the rules
+SLOT_BOOST = 0.1
+
+_TASK_ID = re.compile(r"\b(?:task|ticket)\s*(?:#|id\s*|number\s*)?(\d+)\b|#(\d+)\b")
+_PROJECT = re.compile(r"\bproject\s*(?:#|id\s*|number\s*)?(\d+)\b")
+_PRIORITY = re.compile(r"\b(high|medium|low)[\s-]*priority\b|\bpriority\s*(?:is\s*|of\s*)?(high|medium|low)\b")
+_UNASSIGNED = re.compile(r"\b(?:unassigned|not\s+assigned|without\s+an?\s+assignee)\b")
+# A task in a proposal: a JSON task, or a list item or heading that is not one of the router's "- #12 ..." rows
+_PROPOSED_TASK = re.compile(r'"title"\s*:|^\s*(?:\d+[.)]|[-*\u2022]|#{1,4})\s+(?!#\d)', re.MULTILINE)
+
+
+def _tokens(text):
+    words = re.findall(r"[a-z]+|\d+", text.lower())
+    # Numbers only matter as slots, so they share one token
+    words = ["<num>" if word.isdigit() else word for word in words]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentClassifier:
+    """
+    TF-IDF nearest-centroid classifier over example phrasings.
+
+    Args:
+        examples: Dictionary of intent name to example messages
+    """
+
+    def __init__(self, examples=INTENT_EXAMPLES):
+        documents = [(intent, Counter(_tokens(text))) for intent, texts in examples.items() for text in texts]
+        df = Counter(term for _, counts in documents for term in counts)
+        self.idf = {term: math.log((1 + len(documents)) / (1 + n)) + 1 for term, n in df.items()}
+        self.centroids = {}
+        for intent, counts in documents:
+            centroid = self.centroids.setdefault(intent, Counter())
+            for term, weight in self._vector(counts).items():
+                centroid[term] += weight
+        self.centroids = {intent: self._normalize(centroid) for intent, centroid in self.centroids.items()}
+
+    def _vector(self, counts):
+        # Terms never seen in the examples carry no signal for any intent
+        return self._normalize({term: (1 + math.log(n)) * self.idf[term] for term, n in counts.items() if term in self.idf})
+
+    @staticmethod
+    def _normalize(vector):
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def predict(self, text):
+        """Return the best matching intent and its cosine similarity."""
+        vector = self._vector(Counter(_tokens(text)))
+        scores = {
+            intent: sum(weight * centroid.get(term, 0.0) for term, weight in vector.items())
+            for intent, centroid in self.centroids.items()
+        }
+        intent = max(scores, key=scores.get)
+        return intent, scores[intent]
+
+
+_classifier = IntentClassifier()
+
+
+def proposes_tasks(message):
+    """Return True if an assistant message lays out several tasks, e.g. a breakdown awaiting confirmation."""
+    return "task" in message.lower() and len(_PROPOSED_TASK.findall(message)) >= 2
+
+
+def _last_reply(history):
+    for message in reversed(history):
+        if message["role"] == "assistant":
+            return message["content"]
+    return None
+
+
+def classify(text, history=()):
+    """
+    Classify a message as a lookup intent with its slots.
+
+    Args:
+        text: The user's message
+        history: Earlier messages of the conversation, as role/content dictionaries
+
+    Returns:
+        Tuple of the intent name (None when the message belongs to the agent),
+        the classifier confidence and a dictionary of extracted slots
+    """
+    lowered = text.lower()
+    words = set(re.findall(r"[a-z]+", lowered))
+    intent, confidence = _classifier.predict(text)
+    slots = {}
+    if match := _TASK_ID.search(lowered):
+        slots["task_id"] = int(match.group(1) or match.group(2))
+    if match := _PROJECT.search(lowered):
+        slots["project_id"] = int(match.group(1))
+    if match := _PRIORITY.search(lowered):
+        slots["priority"] = match.group(1) or match.group(2)
+    if _UNASSIGNED.search(lowered):
+        slots["unassigned"] = True
+
+    if intent != "other":
+        confidence = min(1.0, confidence + SLOT_BOOST * len(slots))
+    if words & ACTION_WORDS or intent == "other" or confidence < INTENT_ROUTER_MIN_CONFIDENCE:
+        return None, confidence, slots
+    if words & CONTEXT_WORDS:
+        return None, confidence, slots
+    last_reply = _last_reply(history)
+    if last_reply and proposes_tasks(last_reply):
+        return None, confidence, slots
+    if intent == "task_details" and "task_id" not in slots:
+        return None, confidence, slots
+    return intent, confidence, slots
+
+
+def _describe(task):
+    details = [f"{task.priority} priority" if task.priority else None, f"project {task.project_id}" if task.project_id else None]
+    if task.deadline:
+        details.append(f"due {task.deadline.date().isoformat()}")
+    details = ", ".join(detail for detail in details if detail)
+    return f"- #{task.id} {task.title}" + (f" ({details})" if details else "")
+
+
+def _task_list(query, total, heading, empty):
+    if not total:
+        return empty
+    tasks = query.order_by(Task.id).limit(INTENT_ROUTER_MAX_ITEMS).all()
+    lines = [heading.format(total=total, s="" if total == 1 else "s")] + [_describe(task) for task in tasks]
+    if total > len(tasks):
+        lines.append(f"...and {total - len(tasks)} more.")
+    return "\n".join(lines)
+
+
+def _filtered_tasks(db, slots):
+    query = db.query(Task)
+    if "project_id" in slots:
+        query = query.filter(Task.project_id == slots["project_id"])
+    if "priority" in slots:
+        query = query.filter(func.lower(Task.priority) == slots["priority"])
+    if slots.get("unassigned"):
+        query = query.filter(~Task.id.in_(db.query(Assignment.task_id)))
+    return query
+
+
+def _filter_description(slots):
+    words = [f"{slots['priority']}-priority" if "priority" in slots else None, "unassigned" if slots.get("unassigned") else None]
+    description = " ".join(word for word in words if word)
+    description = f"{description} task" if description else "task"
+    where = f" in project {slots['project_id']}" if "project_id" in slots else ""
+    return description, where
+
+
+def answer(intent, slots, username):
+    """Answer a recognised lookup intent with a direct query and a templated reply."""
+    db = SessionLocal()
+    try:
+        if intent == "my_tasks":
+            query = db.query(Task).join(Assignment, Assignment.task_id == Task.id).join(User, User.id == Assignment.user_id).filter(User.username == username)
+            return _task_list(query, query.count(), "You have {total} task{s} assigned:", "You have no tasks assigned.")
+
+        if intent == "task_details":
+            task = db.get(Task, slots["task_id"])
+            if task is None:
+                return f"There is no task with ID {slots['task_id']}."
+            assignees = [name for (name,) in db.query(User.username).join(Assignment, Assignment.user_id == User.id).filter(Assignment.task_id == task.id)]
+            lines = [
+                f"Task #{task.id}: {task.title}",
+                f"Description: {task.description or '(none)'}",
+                f"Project: {task.project_id}",
+                f"Priority: {task.priority}",
+                f"Role required: {task.role_required}",
+                f"Deadline: {task.deadline.date().isoformat() if task.deadline else 'none'}",
+                f"Assigned to: {', '.join(assignees) if assignees else 'nobody'}",
+            ]
+            return "\n".join(lines)
+
+        description, where = _filter_description(slots)
+        query = _filtered_tasks(db, slots)
+        total = query.count()
+        if intent == "count_tasks":
+            return f"There {'is' if total == 1 else 'are'} {total} {description}{'' if total == 1 else 's'}{where}."
+        return _task_list(query, total, f"Found {{total}} {description}{{s}}{where}:", f"There are no {description}s{where}.")
+    finally:
+        db.close()
+
+
+def route_query(text, username, history=()):
+    """
+    Answer a message directly if it is a recognised lookup.
+
+    Args:
+        text: The user's message
+        username: The user asking, for "my tasks"
+        history: Earlier messages of the conversation, as role/content dictionaries
+
+    Returns:
+        Dictionary with the intent, its confidence and the reply, or None when the
+        message should go to the agent
+    """
+    if not INTENT_ROUTER_ENABLED:
+        return None
+    start = time.perf_counter()
+    intent, confidence, slots = classify(text, history)
+    reply = answer(intent, slots, username) if intent else None
+    elapsed = time.perf_counter() - start
+    metrics.observe("intent_router.seconds", elapsed)
+    if intent is None:
+        metrics.increment("intent_router.fallthrough")
+        conversation_logger.info(f"[USER:{username}] Intent router passed query to the agent (confidence {confidence:.2f}, {elapsed * 1e3:.1f}ms)")
+        return None
+    metrics.increment(f"intent_router.routed.{intent}")
+    conversation_logger.info(f"[USER:{username}] Intent router answered '{intent}' {slots} (confidence {confidence:.2f}, {elapsed * 1e3:.1f}ms)")
+    return {"intent": intent, "confidence": round(confidence, 3), "reply": reply}
@@ -1,12 +1,19 @@
 from langchain_core.runnables import RunnableSequence
-from langchain.chat_models import init_chat_model
-from langchain.prompts import PromptTemplate
-from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import InMemorySaver
+from langchain_core.prompts import PromptTemplate
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from shared.models import create_task, SessionLocal, delete_task, get_tasks
-from datetime import datetime
+from shared.models import (
+    create_task, SessionLocal, delete_task, get_tasks_by_ids, search_tasks, update_tasks as update_tasks_in_db,
+    delete_tasks as delete_tasks_in_db, TASK_UPDATABLE_FIELDS
+)
+from shared.checkpoint import SQLiteCheckpointSaver
+from shared.rate_limit import llm_rate_limiter, INTERACTIVE
+from shared.resilience import ResilientChatModel, llm_circuit_breaker
+from shared.tool_results import project, shape_results, TOOL_RESULT_MAX_ITEMS
+from shared.dedup import get_task_index
+from shared.vector_index import get_vector_index
+from intake_agent.task_import import normalize_task, normalize_task_fields
 from logger import db_logger, agent_logger
 
 # Load environment variables from .env file
@@ -15,23 +22,41 @@ load_dotenv()
 # Access the OpenAI API key
 openai_api_key = os.getenv('OPENAI_API_KEY')
 
-# Initialize the chat model compatible with Langraph
-llm = init_chat_model(
-    model="gpt-4o-mini",
-    api_key=openai_api_key
-)
-
 # Define a simple prompt template
 prompt_template = PromptTemplate.from_template("""
 You are a project manager. Respond to the following query:
 {input_text}
 """)
 
-# Create a runnable sequence with the prompt and llm
-llm_chain = RunnableSequence(prompt_template, llm)
+# The chat model, checkpointer and agent graph are built on first use rather than at
+# import time, so scripts, tests and workers that never call the LLM don't pay for them.
+@lru_cache(maxsize=None)
+def get_llm():
+    """Return the chat model compatible with Langraph, behind the resilience layer and shared rate limiter."""
+    from langchain.chat_models import init_chat_model
+
+    return ResilientChatModel(
+        # Retries are handled by the resilience layer, not by the client
+        model=init_chat_model(
+            model="gpt-4o-mini",
+            api_key=openai_api_key,
+            max_retries=0
+        ),
+        breaker=llm_circuit_breaker,
+        # Every attempt, retries and hedges included, is charged to the shared rate limiter
+        limiter=llm_rate_limiter,
+        lane=INTERACTIVE
+    )
 
-# Create the agent with memory
-checkpointer = InMemorySaver()
+@lru_cache(maxsize=None)
+def get_llm_chain():
+    """Return a runnable sequence with the prompt and llm."""
+    return RunnableSequence(prompt_template, get_llm())
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """Return the durable, pruned memory of the agent."""
+    return SQLiteCheckpointSaver()
 
 # Import the system prompt from a separate file
 from .system_prompt import system_prompt
@@ -41,15 +66,22 @@ def save_tasks_to_db(tasks, username=None, config=None):
     """
     Save a list of tasks to the database using the create_task function.
     
+    Tasks that are near-duplicates of an existing task in the same project are
+    skipped (or saved and flagged, depending on DEDUP_MODE) and reported back.
+    
     Args:
         tasks: List of task dictionaries to save
         username: Optional username of the current user, used for created_by if not specified
         config: Configuration passed from agent, may contain username
+        
+    Returns:
+        Dictionary with the IDs of the saved tasks and the duplicates that were found
     """
     # Extract username from config if provided
     if not username and config and 'username' in config:
         username = config['username']
     
+    result = {"saved": [], "duplicates": []}
     db = SessionLocal()
     try:
         # Validate that we received a list
@@ -57,50 +89,31 @@ def save_tasks_to_db(tasks, username=None, config=None):
             error_msg = f"Expected a list of tasks, but received: {type(tasks)}"
             db_logger.error(error_msg)
             raise ValueError(error_msg)
-            
+        
+        index = get_task_index()
+        # Pick up the tasks other workers saved or deleted since this one last looked
+        index.refresh(db)
         for i, task in enumerate(tasks):
             try:
-                # Verify required fields are present (except created_by which can be set from username)
-                required_fields = ['title', 'description', 'user_id', 'project_id', 
-                                  'priority', 'role_required']
-                missing_fields = [field for field in required_fields if field not in task]
+                # Validate the task with the same rules as the bulk import
+                values = normalize_task(task, username)
                 
-                if missing_fields:
-                    error_msg = f"Missing required fields: {', '.join(missing_fields)}"
-                    db_logger.error(f"Task {i+1}: {error_msg}")
-                    raise KeyError(error_msg)
+                # Look for near-duplicates already saved in the same project
+                duplicates = []
+                if index.mode != "off":
+                    duplicates = index.find_duplicates(values['project_id'], values['title'], values['description'])
+                if duplicates:
+                    duplicate_id, score = duplicates[0]
+                    result["duplicates"].append({"title": values['title'], "duplicate_of": duplicate_id, "similarity": round(score, 2)})
+                    db_logger.info(f"Task {i+1} '{values['title']}' is a near-duplicate of task {duplicate_id} ({score:.2f})")
+                    if index.mode == "merge":
+                        continue
                 
-                # Set created_by to username if not specified in task
-                if 'created_by' not in task or not task['created_by']:
-                    if username:
-                        task['created_by'] = username
-                        db_logger.info(f"Setting created_by to current user: {username}")
-                    else:
-                        task['created_by'] = 'system'
-                        
-                # Convert deadline string to datetime object if it exists
-                deadline = None
-                if 'deadline' in task and task['deadline']:
-                    try:
-                        # Parse ISO format date string (YYYY-MM-DD)
-                        deadline = datetime.strptime(task['deadline'], '%Y-%m-%d').date()
-                    except ValueError as e:
-                        error_msg = f"Invalid deadline format in task {i+1}: {task['deadline']}"
-                        db_logger.error(f"{error_msg}. Deadline should be in YYYY-MM-DD format")
-                        raise ValueError(f"Invalid deadline format: {e}")
-                
-                # Create the task with provided values
-                create_task(
-                    db,
-                    title=task['title'],
-                    description=task['description'],
-                    user_id=task['user_id'],
-                    project_id=task['project_id'],
-                    priority=task['priority'],
-                    role_required=task['role_required'],
-                    deadline=deadline,  # Now a properly converted datetime object
-                    created_by=task['created_by']
-                )
+                new_task = create_task(db, **values)
+                index.add(db, new_task.id, new_task.project_id, new_task.title, new_task.description)
+                db.commit()
+                result["saved"].append(new_task.id)
+                get_vector_index().upsert([(new_task.id, new_task.title, new_task.description)])
                 db_logger.info(f"Successfully saved task {i+1}: {task['title']}")
             except KeyError as ke:
                 db_logger.error(f"Error in task {i+1}: {ke}")
@@ -116,8 +129,10 @@ def save_tasks_to_db(tasks, username=None, config=None):
     except Exception as e:
         db_logger.error(f"An error occurred while saving tasks: {e}")
         db.rollback()  # Rollback any pending transactions
+        result["error"] = str(e)
     finally:
         db.close()
+    return result
 
 # Function to delete a task by ID
 def delete_task_by_id(task_id):
@@ -126,25 +141,184 @@ def delete_task_by_id(task_id):
     try:
         db_logger.info(f"Attempting to delete task with ID: {task_id}")
         delete_task(db, task_id)
+        get_task_index().remove(db, [task_id])
+        db.commit()
+        get_vector_index().remove([task_id])
         db_logger.info(f"Successfully deleted task with ID: {task_id}")
     except Exception as e:
         db_logger.error(f"An error occurred while deleting task ID {task_id}: {e}")
     finally:
         db.close()
 
+def _serialize_task(task):
+    """Convert a Task row into a plain dictionary for the agent."""
+    return {
+        "id": task.id,
+        "project_id": task.project_id,
+        "title": task.title,
+        "description": task.description,
+        "priority": task.priority,
+        "role_required": task.role_required,
+        "deadline": task.deadline.strftime('%Y-%m-%d') if task.deadline else None,
+        "created_by": task.created_by,
+        "user_id": task.user_id
+    }
+
+# Function to delete several tasks at once
+def delete_tasks(task_ids):
+    """
+    Delete several tasks from the database by ID in a single transaction.
+    
+    Args:
+        task_ids: List of task IDs to delete
+        
+    Returns:
+        Dictionary with the deleted IDs and the IDs that were not found
+    """
+    db = SessionLocal()
+    try:
+        db_logger.info(f"Attempting to delete tasks with IDs: {task_ids}")
+        deleted = delete_tasks_in_db(db, task_ids)
+        get_task_index().remove(db, deleted)
+        db.commit()
+        get_vector_index().remove(deleted)
+        not_found = [task_id for task_id in task_ids if task_id not in deleted]
+        db_logger.info(f"Deleted {len(deleted)} tasks, {len(not_found)} not found")
+        return {"deleted": deleted, "not_found": not_found}
+    except Exception as e:
+        db_logger.error(f"An error occurred while deleting tasks {task_ids}: {e}")
+        db.rollback()
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Function to update several tasks at once
+def update_tasks(updates):
+    """
+    Apply partial updates to several tasks in a single transaction.
+    
+    Args:
+        updates: List of dictionaries, each with the task "id" and only the fields to change
+            (title, description, priority, role_required, deadline as YYYY-MM-DD, project_id, user_id)
+            
+    Returns:
+        Dictionary with the updated IDs and the IDs that were not found, or the validation errors
+    """
+    if not isinstance(updates, list):
+        return {"error": f"Expected a list of updates, but received: {type(updates)}"}
+    
+    # Validate every patch before touching the database so the batch is all-or-nothing
+    patches, errors = [], []
+    for i, update in enumerate(updates):
+        if not isinstance(update, dict):
+            errors.append(f"Update {i+1}: expected an object with the task id and the fields to change, got: {type(update).__name__}")
+            continue
+        if "id" not in update:
+            errors.append(f"Update {i+1}: missing task id")
+            continue
+        unknown_fields = set(update) - TASK_UPDATABLE_FIELDS - {"id"}
+        if unknown_fields:
+            errors.append(f"Update {i+1}: unknown fields {', '.join(sorted(unknown_fields))}")
+            continue
+        # The same checks as for a new task, applied to the fields being changed
+        try:
+            patches.append(normalize_task_fields(update))
+        except (TypeError, ValueError) as e:
+            errors.append(f"Update {i+1}: {e}")
+    if errors:
+        db_logger.error(f"Rejected task updates: {errors}")
+        return {"error": "Invalid updates, nothing was changed", "details": errors}
+    
+    db = SessionLocal()
+    try:
+        updated = update_tasks_in_db(db, patches)
+        # Re-index tasks whose text or project changed
+        reindex = [patch["id"] for patch in patches if patch["id"] in updated and {"title", "description", "project_id"} & set(patch)]
+        if reindex:
+            index = get_task_index()
+            changed = get_tasks_by_ids(db, reindex)
+            for task in changed:
+                index.add(db, task.id, task.project_id, task.title, task.description)
+            get_vector_index().upsert([(task.id, task.title, task.description) for task in changed])
+            db.commit()
+        not_found = [patch["id"] for patch in patches if patch["id"] not in updated]
+        db_logger.info(f"Updated {len(updated)} tasks, {len(not_found)} not found")
+        return {"updated": updated, "not_found": not_found}
+    except Exception as e:
+        db_logger.error(f"An error occurred while updating tasks: {e}")
+        db.rollback()
+        return {"error": str(e)}
+    finally:
+        db.close()
+
+# Function to retrieve several tasks at once
+def get_tasks_by_id_list(task_ids, fields=None):
+    """
+    Retrieve several tasks from the database by ID in a single query.
+    
+    Args:
+        task_ids: List of task IDs to retrieve
+        fields: Optional list of fields to return (e.g. ["id", "title", "priority"]); all fields by default
+        
+    Returns:
+        List of tasks with their full descriptions
+    """
+    db = SessionLocal()
+    try:
+        tasks = get_tasks_by_ids(db, task_ids)
+        db_logger.info(f"Retrieved {len(tasks)} of {len(task_ids)} requested tasks")
+        return [project(_serialize_task(task), fields, truncate_fields=()) for task in tasks]
+    except Exception as e:
+        db_logger.error(f"An error occurred while retrieving tasks {task_ids}: {e}")
+        return []
+    finally:
+        db.close()
+
+def _ranked_search(db, search_term, fields, offset, limit):
+    """Rank tasks by semantic similarity to the search term using the local vector index."""
+    total, hits = get_vector_index().search(search_term, k=limit, offset=offset)
+    tasks_by_id = {task.id: task for task in get_tasks_by_ids(db, [task_id for task_id, _ in hits])}
+    records = [
+        {**_serialize_task(tasks_by_id[task_id]), "score": round(score, 3)}
+        for task_id, score in hits if task_id in tasks_by_id
+    ]
+    shaped = shape_results(records, total=total, offset=offset, fields=fields and [*fields, "score"], limit=limit)
+    shaped["mode"] = "ranked"
+    return shaped
+
 # Function to retrieve tasks by name or description
-def retrieve_tasks_by_name_or_description(search_term):
-    """Retrieve tasks from the database that match the given name or description."""
+def retrieve_tasks_by_name_or_description(search_term, fields=None, offset=0, limit=TOOL_RESULT_MAX_ITEMS, mode="substring"):
+    """
+    Retrieve tasks from the database that match the given name or description.
+    
+    Args:
+        search_term: Text to look for in task titles and descriptions
+        fields: Optional list of fields to return (e.g. ["id", "title"]); all fields by default
+        offset: Number of matches to skip, use the "next_offset" of a previous call to see more
+        limit: Maximum number of tasks to return
+        mode: "substring" for exact text matches, or "ranked" for tasks ordered by meaning
+            (finds paraphrases such as "auth" for "login"). A substring search with no matches
+            falls back to ranked results.
+        
+    Returns:
+        Dictionary with the matching tasks (long descriptions truncated), the total number of
+        matches, how many more were not shown and the next offset when there are more
+    """
     db = SessionLocal()
     try:
-        db_logger.info(f"Searching for tasks with term: '{search_term}'")
-        tasks = get_tasks(db)
-        matching_tasks = [task for task in tasks if search_term.lower() in task.title.lower() or search_term.lower() in task.description.lower()]
-        db_logger.info(f"Found {len(matching_tasks)} tasks matching '{search_term}'")
-        return matching_tasks
+        db_logger.info(f"Searching for tasks with term: '{search_term}' ({mode})")
+        limit = max(1, min(limit, TOOL_RESULT_MAX_ITEMS))
+        if mode == "ranked":
+            return _ranked_search(db, search_term, fields, offset, limit)
+        total, matching_tasks = search_tasks(db, search_term, offset=offset, limit=limit)
+        db_logger.info(f"Found {total} tasks matching '{search_term}'")
+        if total == 0 and offset == 0:
+            # Save the agent a second call when the wording differs from the stored tasks
+            return _ranked_search(db, search_term, fields, offset, limit)
+        return shape_results([_serialize_task(task) for task in matching_tasks], total=total, offset=offset, fields=fields, limit=limit)
     except Exception as e:
         db_logger.error(f"An error occurred while retrieving tasks with search term '{search_term}': {e}")
-        return []
+        return {"results": [], "total": 0, "more": 0, "error": str(e)}
     finally:
         db.close()
 
@@ -152,18 +326,47 @@ def retrieve_tasks_by_name_or_description(search_term):
 tools = [
     save_tasks_to_db,
     delete_task_by_id,
+    delete_tasks,
+    update_tasks,
+    get_tasks_by_id_list,
     retrieve_tasks_by_name_or_description
 ]
 
-# Log agent initialization
-agent_logger.info("Initializing ReAct agent with tools and system prompt")
+# Tools that change tasks
+WRITE_TOOLS = {"save_tasks_to_db", "delete_task_by_id", "delete_tasks", "update_tasks"}
 
-# Create the agent
-agent = create_react_agent(
-    model=llm,
-    tools=tools,
-    prompt=system_prompt,
-    checkpointer=checkpointer
-)
+@lru_cache(maxsize=None)
+def get_agent():
+    """Return the ReAct agent, creating it on first use."""
+    from langgraph.prebuilt import create_react_agent
+    from shared.tool_executor import ConcurrentToolNode
+
+    # Log agent initialization
+    agent_logger.info("Initializing ReAct agent with tools and system prompt")
+
+    # Create the agent
+    agent = create_react_agent(
+        model=get_llm(),
+        # Independent tool calls of one turn run concurrently, each with its own deadline. Writes have
+        # none, since a write abandoned halfway may still complete, and run one at a time because they
+        # share the SQLite database and the duplicate index
+        tools=ConcurrentToolNode(tools, write_tools=WRITE_TOOLS, serial_tools=WRITE_TOOLS),
+        prompt=system_prompt,
+        checkpointer=get_checkpointer()
+    )
+
+    agent_logger.info("Agent initialization complete")
+    return agent
+
+_LAZY_ATTRIBUTES = {
+    "agent": get_agent,
+    "llm": get_llm,
+    "llm_chain": get_llm_chain,
+    "checkpointer": get_checkpointer
+}
 
-agent_logger.info("Agent initialization complete")
\ No newline at end of file
+def __getattr__(name):
+    """Keep `from intake_agent.langchain_service import agent` working, built on first access."""
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,125 @@
+"""
+Compact in-memory history of a session.
+
+A list of ``{"role", "content"}`` dicts costs a few hundred bytes per message
+before the content. ``MessageLog`` stores the same history in three parallel
+columns instead: role codes in a byte array (each role string exists once per
+process), the content strings in a list, and the timestamps as seconds in a
+double array. That is about 17 bytes per message besides the content.
+
+The log is a read-only sequence of ``{"role", "content"}`` dicts built on
+access, so callers that iterate histories keep working. ``formatted()`` is a
+view in the ``{"type", "content"}`` shape of the API, also built on access, so
+formatting a history copies no content and builds no intermediate list.
+"""
+
+import sys
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timezone
+
+# Role strings by code. The table is fixed, so client input can never grow it
+ROLES = ("user", "assistant", "system", "tool")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+# Message type shown by the API per role code: "user" for the user, "ai" for anything else
+_ROLE_TYPES = ("user", "ai", "ai", "ai")
+# Other roles are kept as assistant messages, which is how the database stores them too
+_FALLBACK_ROLE_CODE = _ROLE_CODES["assistant"]
+
+# Memory per message besides its content: the list slot, the role code and the timestamp
+MESSAGE_OVERHEAD_BYTES = 8 + 1 + 8
+
+
+def _role_code(role):
+    return _ROLE_CODES.get(role, _FALLBACK_ROLE_CODE)
+
+
+def _seconds(when):
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+
+class MessageLog(Sequence):
+    """
+    Messages of a session in columns: role codes, contents and timestamps.
+
+    Args:
+        messages: Initial messages, as {"role", "content"} dicts
+        timestamp: Time given to the initial messages; defaults to now
+    """
+
+    __slots__ = ("_roles", "_contents", "_timestamps")
+
+    def __init__(self, messages=(), timestamp=None):
+        self._roles = array("B")
+        self._contents = []
+        self._timestamps = array("d")
+        self.extend(messages, timestamp)
+
+    def append(self, role, content, timestamp=None):
+        """Append a message; timestamp is a naive UTC datetime and defaults to now."""
+        self._roles.append(_role_code(role))
+        self._contents.append(content)
+        self._timestamps.append(_seconds(timestamp or datetime.utcnow()))
+
+    def extend(self, messages, timestamp=None):
+        """Append {"role", "content"} dicts, all with the same timestamp."""
+        seconds = _seconds(timestamp or datetime.utcnow())
+        for message in messages:
+            self._roles.append(_role_code(message["role"]))
+            self._contents.append(message["content"])
+            self._timestamps.append(seconds)
+
+    def __len__(self):
+        return len(self._contents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {"role": ROLES[self._roles[index]], "content": self._contents[index]}
+
+    def __iter__(self):
+        for code, content in zip(self._roles, self._contents):
+            yield {"role": ROLES[code], "content": content}
+
+    def __eq__(self, other):
+        if not isinstance(other, (MessageLog, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"MessageLog({list(self)!r})"
+
+    def timestamp(self, index):
+        """Return the time of a message as a naive UTC datetime."""
+        return datetime.fromtimestamp(self._timestamps[index], timezone.utc).replace(tzinfo=None)
+
+    def nbytes(self):
+        """Approximate memory held by the messages."""
+        return sum(map(sys.getsizeof, self._contents)) + len(self._contents) * MESSAGE_OVERHEAD_BYTES
+
+    def formatted(self):
+        """Return a view of the messages as the API shows them."""
+        return FormattedMessages(self)
+
+
+class FormattedMessages(Sequence):
+    """Read-only view of a MessageLog as {"type", "content"} dicts, built on access."""
+
+    __slots__ = ("_log",)
+
+    def __init__(self, log):
+        self._log = log
+
+    def __len__(self):
+        return len(self._log)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {"type": _ROLE_TYPES[self._log._roles[index]], "content": self._log._contents[index]}
+
+    def __iter__(self):
+        for code, content in zip(self._log._roles, self._log._contents):
+            yield {"type": _ROLE_TYPES[code], "content": content}
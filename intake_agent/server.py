@@ -1,13 +1,19 @@
 from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from intake_agent.controller import router as intake_router
+from intake_agent.conversation_store import conversation_store
 from intake_agent.auth import (
-    Token, User, authenticate_user, create_access_token, 
-    get_current_active_user, ACCESS_TOKEN_EXPIRE_MINUTES, users_db
+    Token, User, RefreshRequest, authenticate_user, create_access_token,
+    get_current_active_user, issue_refresh_token, rotate_refresh_token, ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from datetime import timedelta
+import threading
 from logger import system_logger
+from shared import metrics
+from shared.models import SessionLocal, init_default_users
+from shared.last_login import last_login_recorder
 
 def create_app():
     """Create and configure the FastAPI application."""
@@ -25,10 +31,47 @@ def create_app():
     # Include the intake agent router
     app.include_router(intake_router, prefix="/intake", tags=["intake"])
     
+    @app.on_event("startup")
+    def warm_task_indexes():
+        """Load the near-duplicate and search indexes in the background so the first request does not wait for them."""
+        from shared.dedup import get_task_index
+        from shared.vector_index import get_vector_index
+        for load in (get_task_index, get_vector_index):
+            threading.Thread(target=load, name=f"{load.__name__}-warmup", daemon=True).start()
+    
+    @app.on_event("startup")
+    def seed_default_users():
+        """Create the default accounts on first run, so a fresh database can be logged into."""
+        db = SessionLocal()
+        try:
+            init_default_users(db)
+        finally:
+            db.close()
+    
+    @app.on_event("startup")
+    def start_last_login_recorder():
+        """Write login times in batches rather than one commit per login."""
+        last_login_recorder.start()
+    
+    @app.on_event("shutdown")
+    def flush_last_logins():
+        """Write the login times that are still pending."""
+        last_login_recorder.stop()
+    
+    @app.on_event("startup")
+    def start_conversation_writer():
+        """Write conversations to the database in the background, in batches."""
+        conversation_store.start()
+    
+    @app.on_event("shutdown")
+    def flush_conversations():
+        """Write the conversation changes that are still queued."""
+        conversation_store.stop()
+    
     @app.post("/token", response_model=Token)
     async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
         """Authenticate user and provide access token."""
-        user = authenticate_user(users_db, form_data.username, form_data.password)
+        user = await authenticate_user(form_data.username, form_data.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -41,8 +84,26 @@ def create_app():
             data={"sub": user.username}, expires_delta=access_token_expires
         )
         
+        refresh_token = await run_in_threadpool(issue_refresh_token, user.id)
+        
         system_logger.info(f"User {user.username} logged in successfully")
-        return {"access_token": access_token, "token_type": "bearer"}
+        return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+    
+    @app.post("/token/refresh", response_model=Token)
+    async def refresh_access_token(request: RefreshRequest):
+        """Exchange a refresh token for a new access token and a new refresh token, without the password."""
+        rotated = await run_in_threadpool(rotate_refresh_token, request.refresh_token)
+        if rotated is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired refresh token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        user, refresh_token = rotated
+        access_token = create_access_token(
+            data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        )
+        return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
     
     @app.get("/users/me", response_model=User)
     async def read_users_me(current_user: User = Depends(get_current_active_user)):
@@ -50,6 +111,11 @@ def create_app():
         system_logger.info(f"User {current_user.username} retrieved their profile")
         return current_user
     
+    @app.get("/metrics")
+    async def read_metrics(current_user: User = Depends(get_current_active_user)):
+        """Get in-process service metrics (LLM queue wait times, request counts)."""
+        return metrics.snapshot()
+    
     @app.get("/")
     async def root():
         """Root endpoint."""
@@ -0,0 +1,490 @@
+"""
+Hot tier of the conversation store: where recent sessions are kept.
+
+``MemorySessionBackend`` keeps sessions in the memory of the process, within a
+budget. It suits development and a single worker. ``RedisSessionBackend`` keeps
+them in Redis, so that every worker and replica sees the same sessions. Each
+message is a single list entry (a role code followed by the content), appended
+with RPUSH, and every key of a session expires after
+``CONVERSATION_REDIS_TTL_SECONDS`` without use.
+
+Both backends serve the same operations to ``ConversationStore``, which pages
+sessions in from the database when they are not in the hot tier. The backend is
+chosen with ``CONVERSATION_BACKEND`` (``memory`` or ``redis``).
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from intake_agent.message_log import MESSAGE_OVERHEAD_BYTES, MessageLog
+from shared import metrics
+
+# Where sessions are kept: memory (with its budget) or Redis (with its URL and key lifetime)
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory")
+CONVERSATION_MEMORY_BUDGET_BYTES = int(os.getenv("CONVERSATION_MEMORY_BUDGET_BYTES", str(64 * 1024 * 1024)))
+CONVERSATION_REDIS_URL = os.getenv("CONVERSATION_REDIS_URL", "redis://localhost:6379/0")
+CONVERSATION_REDIS_TTL_SECONDS = int(os.getenv("CONVERSATION_REDIS_TTL_SECONDS", str(24 * 3600)))
+
+# Length of session titles and last-message previews
+TITLE_CHARS = 30
+PREVIEW_CHARS = 50
+
+def message_bytes(content):
+    """Approximate memory held by a stored message."""
+    return sys.getsizeof(content) + MESSAGE_OVERHEAD_BYTES
+
+
+def shorten(text, limit):
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+class SessionSummary:
+    """What the session list shows about a session, kept up to date on every append."""
+
+    __slots__ = ("session_id", "title", "message_count", "last_message", "last_activity")
+
+    def __init__(self, session_id, title=None, message_count=0, last_message=None, last_activity=None):
+        self.session_id = session_id
+        self.title = title
+        self.message_count = message_count
+        self.last_message = last_message
+        self.last_activity = last_activity or datetime.utcnow()
+
+    def add(self, content, when):
+        if self.title is None:
+            self.title = shorten(content, TITLE_CHARS)
+        self.message_count += 1
+        self.last_message = shorten(content, PREVIEW_CHARS)
+        self.last_activity = when
+
+    def sort_key(self):
+        # Newest first; the session ID breaks ties so that the order is total
+        return (self.last_activity, self.session_id)
+
+    def to_dict(self):
+        return {
+            "session_id": self.session_id,
+            "title": self.title or f"Session {self.session_id}",
+            "message_count": self.message_count,
+            "last_message": self.last_message,
+            "last_activity": self.last_activity.isoformat()
+        }
+
+
+class MemorySessionBackend:
+    """
+    Sessions in the memory of this process, within a budget.
+
+    The messages of each session are a compact ``MessageLog``. Least recently
+    used sessions are evicted when their messages take more than the budget,
+    unless the store still has to write them. Summaries are small and
+    are never evicted.
+
+    Args:
+        memory_budget_bytes: Approximate memory allowed for the messages of resident sessions
+    """
+
+    def __init__(self, memory_budget_bytes=CONVERSATION_MEMORY_BUDGET_BYTES):
+        self.memory_budget_bytes = memory_budget_bytes
+        self._resident = OrderedDict()  # {(username, session_id): MessageLog}, least recently used first
+        self._resident_bytes = {}  # {(username, session_id): approximate bytes}
+        self._total_bytes = 0
+        self._summaries = {}  # {username: {session_id: SessionSummary}}
+        self._complete = set()  # Users whose every summary is in memory
+        self._deleted = set()  # Deleted session IDs whose deletion is not written yet
+        self._lock = threading.Lock()
+        self._is_dirty = lambda session_id: False
+        self._wake_writer = lambda: None
+
+    def bind(self, is_dirty, wake_writer):
+        """Connect to the store: is_dirty(session_id) tells whether a session still has to be written."""
+        self._is_dirty = is_dirty
+        self._wake_writer = wake_writer
+
+    @property
+    def resident_bytes(self):
+        return self._total_bytes
+
+    # Memory budget; called with self._lock held
+
+    def _make_resident(self, key, messages):
+        self._discard(key)
+        self._resident[key] = messages
+        self._resident_bytes[key] = messages.nbytes()
+        self._total_bytes += self._resident_bytes[key]
+
+    def _discard(self, key):
+        if self._resident.pop(key, None) is not None:
+            self._total_bytes -= self._resident_bytes.pop(key)
+
+    def _enforce_budget(self, keep=None):
+        """Evict least recently used written sessions until the budget is met."""
+        if self._total_bytes > self.memory_budget_bytes:
+            for key in list(self._resident):
+                if self._total_bytes <= self.memory_budget_bytes:
+                    break
+                if key == keep or self._is_dirty(key[1]):
+                    continue
+                self._discard(key)
+                metrics.increment("conversations.evictions")
+            if self._total_bytes > self.memory_budget_bytes:
+                # What is left is waiting to be written; write it so it can be evicted
+                self._wake_writer()
+        metrics.set_gauge("conversations.resident_bytes", self._total_bytes)
+        metrics.set_gauge("conversations.resident_sessions", len(self._resident))
+
+    def enforce_budget(self):
+        with self._lock:
+            self._enforce_budget()
+
+    # Reading
+
+    def get_messages(self, username, session_id):
+        key = (username, session_id)
+        with self._lock:
+            messages = self._resident.get(key)
+            if messages is not None:
+                self._resident.move_to_end(key)
+            return messages
+
+    def get_summary(self, username, session_id):
+        with self._lock:
+            return self._summaries.get(username, {}).get(session_id)
+
+    def is_deleted(self, session_id):
+        return session_id in self._deleted
+
+    def is_complete(self, username):
+        return username in self._complete
+
+    def page(self, username, after, count):
+        """Return up to count summaries of the user that sort before after (None for the first page), newest first."""
+        with self._lock:
+            candidates = list(self._summaries.get(username, {}).values())
+        if after is not None:
+            candidates = [summary for summary in candidates if summary.sort_key() < after]
+        candidates.sort(key=SessionSummary.sort_key, reverse=True)
+        return candidates[:count]
+
+    # Writing
+
+    def page_in(self, username, session_id, summary, messages):
+        """Make a session loaded from the database resident, unless it was deleted or paged in meanwhile."""
+        key = (username, session_id)
+        with self._lock:
+            if session_id in self._deleted:
+                return None, False
+            if key in self._resident:
+                return self._resident[key], False
+            if not isinstance(messages, MessageLog):
+                messages = MessageLog(messages, summary.last_activity)
+            self._make_resident(key, messages)
+            self._summaries.setdefault(username, {}).setdefault(session_id, summary)
+            self._enforce_budget(keep=key)
+            return messages, True
+
+    def add_summaries(self, username, summaries):
+        """Add summaries loaded from the database and mark the user's list complete."""
+        with self._lock:
+            known = self._summaries.setdefault(username, {})
+            for session_id, summary in summaries.items():
+                if session_id not in self._deleted:
+                    known.setdefault(session_id, summary)
+            self._complete.add(username)
+
+    def save(self, username, session_id, messages, now):
+        """Replace the history of a session of the user; returns its summary."""
+        key = (username, session_id)
+        summary = SessionSummary(session_id, last_activity=now)
+        for message in messages:
+            summary.add(message["content"], now)
+        with self._lock:
+            self._make_resident(key, MessageLog(messages, now))
+            self._summaries.setdefault(username, {})[session_id] = summary
+            self._enforce_budget(keep=key)
+        return summary
+
+    def append(self, username, session_id, messages, now):
+        """Append messages to a session; returns its updated summary, or None if the session is unknown."""
+        key = (username, session_id)
+        with self._lock:
+            summary = self._summaries.get(username, {}).get(session_id)
+            if summary is None:
+                return None
+            # An evicted session is not paged in just to append to it
+            history = self._resident.get(key)
+            for message in messages:
+                summary.add(message["content"], now)
+                if history is not None:
+                    history.append(message["role"], message["content"], now)
+                    self._resident_bytes[key] += message_bytes(message["content"])
+                    self._total_bytes += message_bytes(message["content"])
+            if history is not None:
+                self._resident.move_to_end(key)
+                self._enforce_budget(keep=key)
+            return summary
+
+    def delete(self, username, session_id):
+        with self._lock:
+            self._summaries.get(username, {}).pop(session_id, None)
+            self._discard((username, session_id))
+            self._deleted.add(session_id)
+
+    def forget_deleted(self, session_ids):
+        """Forget deletions once they are written to the database."""
+        with self._lock:
+            self._deleted -= set(session_ids)
+
+
+# Messages are stored in Redis lists as a one-character role code followed by the content
+ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+CODE_ROLES = {code: role for role, code in ROLE_CODES.items()}
+
+
+def encode_message(message):
+    code = ROLE_CODES.get(message["role"])
+    if code is None:
+        return f"x{message['role']}\x00{message['content']}"
+    return code + message["content"]
+
+
+def decode_message(entry):
+    entry = entry.decode() if isinstance(entry, bytes) else entry
+    if entry[0] == "x":
+        role, content = entry[1:].split("\x00", 1)
+        return {"role": role, "content": content}
+    return {"role": CODE_ROLES[entry[0]], "content": entry[1:]}
+
+
+def _score(when):
+    return when.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RedisSessionBackend:
+    """
+    Sessions in Redis, shared by every worker and replica.
+
+    Per session there is a list of messages and a hash with its owner and
+    summary. Per user there is a sorted set of session IDs by last activity.
+    Every key expires after ttl_seconds without use.
+
+    Args:
+        client: Redis client; by default one is connected to ``CONVERSATION_REDIS_URL``
+        ttl_seconds: Time after which an unused session is dropped from Redis
+        prefix: Prefix of every key
+    """
+
+    def __init__(self, client=None, ttl_seconds=CONVERSATION_REDIS_TTL_SECONDS, prefix="conv"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(CONVERSATION_REDIS_URL)
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def bind(self, is_dirty, wake_writer):
+        # Redis bounds its own memory through the TTL
+        pass
+
+    def _messages_key(self, session_id):
+        return f"{self.prefix}:session:{session_id}:messages"
+
+    def _summary_key(self, session_id):
+        return f"{self.prefix}:session:{session_id}:summary"
+
+    def _deleted_key(self, session_id):
+        return f"{self.prefix}:session:{session_id}:deleted"
+
+    def _sessions_key(self, username):
+        return f"{self.prefix}:user:{username}:sessions"
+
+    def _complete_key(self, username):
+        return f"{self.prefix}:user:{username}:complete"
+
+    @staticmethod
+    def _summary_mapping(username, summary):
+        mapping = {"user": username, "count": summary.message_count, "ts": summary.last_activity.isoformat()}
+        if summary.title is not None:
+            mapping["title"] = summary.title
+        if summary.last_message is not None:
+            mapping["last"] = summary.last_message
+        return mapping
+
+    @staticmethod
+    def _summary_from(session_id, fields):
+        fields = {key.decode(): value.decode() for key, value in fields.items()}
+        return SessionSummary(session_id, fields.get("title"), int(fields.get("count", 0)),
+                              fields.get("last"), datetime.fromisoformat(fields["ts"]))
+
+    def _touch(self, pipe, username, session_id):
+        for key in (self._messages_key(session_id), self._summary_key(session_id), self._sessions_key(username)):
+            pipe.expire(key, self.ttl_seconds)
+
+    # Reading
+
+    def get_messages(self, username, session_id):
+        pipe = self.client.pipeline()
+        pipe.exists(self._messages_key(session_id))
+        pipe.lrange(self._messages_key(session_id), 0, -1)
+        pipe.hget(self._summary_key(session_id), "user")
+        self._touch(pipe, username, session_id)
+        exists, entries, owner = pipe.execute()[:3]
+        if not exists or owner is None or owner.decode() != username:
+            return None
+        return [decode_message(entry) for entry in entries]
+
+    def get_summary(self, username, session_id):
+        fields = self.client.hgetall(self._summary_key(session_id))
+        if not fields or fields.get(b"user", b"").decode() != username:
+            return None
+        return self._summary_from(session_id, fields)
+
+    def is_deleted(self, session_id):
+        return bool(self.client.exists(self._deleted_key(session_id)))
+
+    def is_complete(self, username):
+        return bool(self.client.exists(self._complete_key(username)))
+
+    def page(self, username, after, count):
+        """Return up to count summaries of the user that sort before after (None for the first page), newest first."""
+        key = self._sessions_key(username)
+        max_score = "+inf" if after is None else _score(after[0])
+        page, offset = [], 0
+        while len(page) < count:
+            session_ids = self.client.zrevrangebyscore(key, max_score, "-inf", start=offset, num=count)
+            if not session_ids:
+                break
+            offset += len(session_ids)
+            pipe = self.client.pipeline()
+            for session_id in session_ids:
+                pipe.hgetall(self._summary_key(session_id.decode()))
+            for session_id, fields in zip(session_ids, pipe.execute()):
+                if not fields:
+                    self._forget_expired(username, session_id)
+                    continue
+                summary = self._summary_from(session_id.decode(), fields)
+                # Sessions with the cursor's own timestamp are compared by the full sort key
+                if after is None or summary.sort_key() < after:
+                    page.append(summary)
+            if len(session_ids) < count:
+                break
+        page.sort(key=SessionSummary.sort_key, reverse=True)
+        return page[:count]
+
+    def _forget_expired(self, username, session_id):
+        # The summary expired before the user's session list: reload the list from the database next time
+        pipe = self.client.pipeline()
+        pipe.zrem(self._sessions_key(username), session_id)
+        pipe.delete(self._complete_key(username))
+        pipe.execute()
+
+    # Writing
+
+    def page_in(self, username, session_id, summary, messages):
+        """Store a session loaded from the database, unless it was deleted or paged in meanwhile."""
+        pipe = self.client.pipeline()
+        pipe.exists(self._deleted_key(session_id))
+        pipe.exists(self._messages_key(session_id))
+        deleted, resident = pipe.execute()
+        if deleted:
+            return None, False
+        if resident:
+            return self.get_messages(username, session_id), False
+        pipe = self.client.pipeline()
+        if messages:
+            pipe.rpush(self._messages_key(session_id), *(encode_message(m) for m in messages))
+        pipe.hsetnx(self._summary_key(session_id), "user", username)
+        for field, value in self._summary_mapping(username, summary).items():
+            pipe.hsetnx(self._summary_key(session_id), field, value)
+        pipe.zadd(self._sessions_key(username), {session_id: _score(summary.last_activity)}, nx=True)
+        self._touch(pipe, username, session_id)
+        pipe.execute()
+        return messages, True
+
+    def add_summaries(self, username, summaries):
+        """Add summaries loaded from the database and mark the user's list complete."""
+        pipe = self.client.pipeline()
+        for session_id, summary in summaries.items():
+            pipe.exists(self._deleted_key(session_id))
+        deleted = pipe.execute()
+        pipe = self.client.pipeline()
+        for (session_id, summary), is_deleted in zip(summaries.items(), deleted):
+            if is_deleted:
+                continue
+            for field, value in self._summary_mapping(username, summary).items():
+                pipe.hsetnx(self._summary_key(session_id), field, value)
+            pipe.expire(self._summary_key(session_id), self.ttl_seconds)
+            pipe.zadd(self._sessions_key(username), {session_id: _score(summary.last_activity)}, nx=True)
+        pipe.expire(self._sessions_key(username), self.ttl_seconds)
+        pipe.set(self._complete_key(username), 1, ex=self.ttl_seconds)
+        pipe.execute()
+
+    def save(self, username, session_id, messages, now):
+        """Replace the history of a session; returns its summary, or None if the session belongs to another user."""
+        summary_key = self._summary_key(session_id)
+        # Claims a new session for the user atomically; an existing one keeps its owner
+        pipe = self.client.pipeline()
+        pipe.hsetnx(summary_key, "user", username)
+        pipe.hget(summary_key, "user")
+        owner = pipe.execute()[1]
+        if owner is not None and owner.decode() != username:
+            return None
+        summary = SessionSummary(session_id, last_activity=now)
+        for message in messages:
+            summary.add(message["content"], now)
+        pipe = self.client.pipeline()
+        pipe.delete(self._messages_key(session_id), self._summary_key(session_id))
+        if messages:
+            pipe.rpush(self._messages_key(session_id), *(encode_message(m) for m in messages))
+        pipe.hset(self._summary_key(session_id), mapping=self._summary_mapping(username, summary))
+        pipe.zadd(self._sessions_key(username), {session_id: _score(now)})
+        self._touch(pipe, username, session_id)
+        pipe.execute()
+        return summary
+
+    def append(self, username, session_id, messages, now):
+        """Append messages to a session; returns its updated summary, or None if the session is unknown."""
+        summary_key = self._summary_key(session_id)
+        owner = self.client.hget(summary_key, "user")
+        if owner is None or owner.decode() != username:
+            return None
+        pipe = self.client.pipeline()
+        # A session whose messages expired is not recreated with only the new ones
+        pipe.rpushx(self._messages_key(session_id), *(encode_message(m) for m in messages))
+        pipe.hsetnx(summary_key, "title", shorten(messages[0]["content"], TITLE_CHARS))
+        pipe.hincrby(summary_key, "count", len(messages))
+        pipe.hset(summary_key, mapping={"last": shorten(messages[-1]["content"], PREVIEW_CHARS), "ts": now.isoformat()})
+        pipe.hgetall(summary_key)
+        pipe.zadd(self._sessions_key(username), {session_id: _score(now)})
+        self._touch(pipe, username, session_id)
+        fields = pipe.execute()[4]
+        return self._summary_from(session_id, fields)
+
+    def delete(self, username, session_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._messages_key(session_id), self._summary_key(session_id))
+        pipe.zrem(self._sessions_key(username), session_id)
+        # Keeps other workers from paging the session in before its deletion is written
+        pipe.set(self._deleted_key(session_id), 1, ex=self.ttl_seconds)
+        pipe.execute()
+
+    def forget_deleted(self, session_ids):
+        """Forget deletions once they are written to the database."""
+        if session_ids:
+            self.client.delete(*(self._deleted_key(session_id) for session_id in session_ids))
+
+    def enforce_budget(self):
+        pass
+
+
+def create_session_backend(kind=None, memory_budget_bytes=CONVERSATION_MEMORY_BUDGET_BYTES):
+    """Create the session backend selected by ``CONVERSATION_BACKEND``."""
+    kind = (kind or CONVERSATION_BACKEND).lower()
+    if kind == "memory":
+        return MemorySessionBackend(memory_budget_bytes)
+    if kind == "redis":
+        return RedisSessionBackend()
+    raise ValueError(f"Unknown conversation backend: {kind}")
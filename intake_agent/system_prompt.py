@@ -42,6 +42,9 @@ IMPORTANT NOTES:
 - ALL fields listed above are REQUIRED except for "deadline" which is optional.
 - "deadline" MUST be in YYYY-MM-DD format (e.g., "2023-12-31"), as it will be converted to a datetime object.
 - Valid priority values are: "low", "medium", "high"
+- WHEN CHANGING, READING OR DELETING SEVERAL TASKS, USE THE BULK TOOLS (update_tasks, get_tasks_by_id_list, delete_tasks) IN ONE CALL INSTEAD OF ONE CALL PER TASK. update_tasks TAKES A LIST OF {"id": ..., <only the fields to change>} PATCHES.
+- SEARCH RESULTS ARE PAGED AND LONG DESCRIPTIONS ARE SHORTENED. PASS "fields" TO REQUEST ONLY THE FIELDS YOU NEED, AND PASS THE RETURNED "next_offset" AS "offset" ONLY IF YOU NEED THE "more" REMAINING MATCHES. USE get_tasks_by_id_list FOR A TASK'S FULL DETAILS.
+- WHEN THE USER DESCRIBES TASKS IN THEIR OWN WORDS (E.G. "THE AUTH WORK"), SEARCH WITH mode="ranked" TO FIND TASKS BY MEANING RATHER THAN EXACT TEXT.
 
 ---
 
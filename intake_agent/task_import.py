@@ -0,0 +1,227 @@
+"""
+LLM-free bulk task import.
+
+Tasks already in the format described in the system prompt can be uploaded as
+JSONL (one JSON object per line) or CSV (one task per row, with a header). Rows
+are parsed one at a time and inserted in chunked transactions, so memory stays
+bounded however large the file is.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from logger import db_logger
+from shared.dedup import get_task_index
+from shared.models import SessionLocal, Task
+from shared.vector_index import get_vector_index
+
+# Rows saved per transaction and the number of row errors reported before an import stops
+TASK_IMPORT_CHUNK_SIZE = int(os.getenv("TASK_IMPORT_CHUNK_SIZE", "1000"))
+TASK_IMPORT_MAX_ERRORS = int(os.getenv("TASK_IMPORT_MAX_ERRORS", "1000"))
+
+REQUIRED_TASK_FIELDS = ['title', 'description', 'user_id', 'project_id', 'priority', 'role_required']
+TASK_TEXT_FIELDS = ('title', 'description', 'priority', 'role_required')
+TASK_ID_FIELDS = ('id', 'user_id', 'project_id')
+IMPORT_FORMATS = ("jsonl", "csv")
+
+
+def _integer(field, value):
+    # bool is an int, but never a valid ID
+    if isinstance(value, bool):
+        raise ValueError(f"{field} must be an integer, got: {value}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer, got: {value}")
+
+
+def normalize_task_fields(fields):
+    """
+    Validate and convert the task fields present in a dictionary, as given for a new task or a partial update.
+
+    Args:
+        fields: Dictionary of task fields; fields other than the IDs, text fields and deadline are kept as they are
+
+    Returns:
+        Dictionary with the same keys and the converted column values
+
+    Raises:
+        ValueError: If a text field is not a string, an ID is not an integer or the deadline is not in YYYY-MM-DD format
+    """
+    values = dict(fields)
+    for field, value in fields.items():
+        if field in TASK_TEXT_FIELDS and not isinstance(value, str):
+            raise ValueError(f"{field} must be a string, got: {value}")
+        if field in TASK_ID_FIELDS:
+            values[field] = _integer(field, value)
+        elif field == 'deadline':
+            # An empty deadline means no deadline
+            try:
+                values[field] = datetime.strptime(value, '%Y-%m-%d') if value else None
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid deadline format: {value}. Deadline should be in YYYY-MM-DD format")
+    return values
+
+
+def normalize_task(task, username=None):
+    """
+    Validate a task dictionary and convert it into the values of a Task row.
+
+    Args:
+        task: Task dictionary in the format described in the system prompt
+        username: Used for created_by when the task does not specify it
+
+    Returns:
+        Dictionary of Task column values
+
+    Raises:
+        KeyError: If required fields are missing
+        ValueError: If a field has the wrong type or the deadline is not in YYYY-MM-DD format
+    """
+    if not isinstance(task, dict):
+        raise ValueError(f"Expected a task object, but received: {type(task).__name__}")
+
+    missing_fields = [field for field in REQUIRED_TASK_FIELDS if field not in task]
+    if missing_fields:
+        raise KeyError(f"Missing required fields: {', '.join(missing_fields)}")
+
+    values = normalize_task_fields({field: task[field] for field in REQUIRED_TASK_FIELDS})
+    values['deadline'] = normalize_task_fields({'deadline': task.get('deadline')})['deadline']
+    values['created_by'] = task.get('created_by') or username or 'system'
+    return values
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the import format from the upload's file name or content type."""
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    return None
+
+
+def iter_rows(stream, fmt):
+    """
+    Parse a text stream lazily into (row number, task or parse error) pairs.
+
+    Args:
+        stream: Text stream of the uploaded file
+        fmt: "jsonl" or "csv"
+
+    Yields:
+        Tuples of the 1-based data row number and the task dictionary, or the
+        exception raised while parsing that row
+    """
+    if fmt == "csv":
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            # Empty cells count as missing values
+            yield row_number, {key: value for key, value in row.items() if key and value not in (None, "")}
+        return
+
+    row_number = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+
+
+def import_tasks(stream, fmt, username=None, chunk_size=TASK_IMPORT_CHUNK_SIZE, max_errors=TASK_IMPORT_MAX_ERRORS):
+    """
+    Validate and insert the tasks of an uploaded file without involving the agent.
+
+    Each chunk of valid rows is inserted and committed in its own transaction, so a
+    failure only loses the current chunk. Invalid rows are skipped and reported.
+
+    Args:
+        stream: Text stream of the uploaded file
+        fmt: "jsonl" or "csv"
+        username: Used for created_by when a task does not specify it
+        chunk_size: Number of rows inserted per transaction
+        max_errors: Maximum number of row errors included in the report
+
+    Returns:
+        Dictionary with the number of imported and failed rows and the row errors
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}. Use one of: {', '.join(IMPORT_FORMATS)}")
+
+    report = {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+
+    def record_error(row_number, error):
+        report["failed"] += 1
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"row": row_number, "error": str(error).strip("'\"")})
+        else:
+            report["errors_truncated"] = True
+
+    db = SessionLocal()
+    chunk = []
+
+    def flush():
+        index, task_ids = get_task_index(), []
+        try:
+            rows = [values for _, values in chunk]
+            task_ids = db.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), rows).all()
+            # Keep the near-duplicate index in step, in the same transaction
+            index.add_many(db, (
+                (task_id, values['project_id'], values['title'], values['description'])
+                for task_id, values in zip(task_ids, rows)
+            ))
+            db.commit()
+            report["imported"] += len(chunk)
+        except Exception as e:
+            db.rollback()
+            index.forget(task_ids)
+            db_logger.error(f"Failed to import rows {chunk[0][0]}-{chunk[-1][0]}: {e}")
+            for row_number, _ in chunk:
+                record_error(row_number, f"Database error: {e}")
+        else:
+            # The rows are committed, so a failure here only leaves the search index behind until the next sync
+            try:
+                get_vector_index().upsert((task_id, values['title'], values['description']) for task_id, values in zip(task_ids, rows))
+            except Exception as e:
+                db_logger.error(f"Failed to index imported rows {chunk[0][0]}-{chunk[-1][0]}: {e}")
+        chunk.clear()
+
+    try:
+        for row_number, task in iter_rows(stream, fmt):
+            try:
+                if isinstance(task, Exception):
+                    raise task
+                chunk.append((row_number, normalize_task(task, username)))
+            except (KeyError, ValueError) as e:
+                record_error(row_number, e)
+                continue
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        db_logger.error(f"Task import stopped, the file could not be read: {e}")
+        report["error"] = f"The file could not be read: {e}"
+    finally:
+        db.close()
+
+    db_logger.info(f"Imported {report['imported']} tasks ({report['failed']} rows failed) for {username or 'system'}")
+    return report
+
+
+def import_task_file(binary_file, fmt, username=None, **kwargs):
+    """Import tasks from a binary file object such as an upload's spooled file."""
+    stream = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    try:
+        return import_tasks(stream, fmt, username=username, **kwargs)
+    finally:
+        # Leave the underlying file open for its owner
+        stream.detach()
@@ -0,0 +1,452 @@
+"""
+Durable SQLite checkpointer for the LangGraph agents.
+
+Replaces ``InMemorySaver``, which keeps every checkpoint of every thread for the
+lifetime of the process. This saver writes checkpoints to a SQLite file, keeps
+only the most recent checkpoints of each thread, expires threads that have been
+idle longer than a TTL and periodically compacts the database file in a
+background thread.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from logger import system_logger
+
+# Checkpoint database file and how many checkpoints are kept, and for how long
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH", "checkpoints.db")
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "10"))
+CHECKPOINT_THREAD_TTL_SECONDS = int(os.getenv("CHECKPOINT_THREAD_TTL_SECONDS", str(7 * 24 * 3600)))
+CHECKPOINT_COMPACT_INTERVAL_SECONDS = int(os.getenv("CHECKPOINT_COMPACT_INTERVAL_SECONDS", "300"))
+
+# Payloads larger than this are zlib-compressed on top of the msgpack encoding
+COMPRESSION_THRESHOLD_BYTES = 512
+COMPRESSED_SUFFIX = "+zlib"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_threads_last_access ON threads (last_access);
+"""
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[int]):
+    """
+    A pruned, TTL-expiring checkpoint saver backed by a SQLite file.
+
+    Args:
+        path: Path to the SQLite file (":memory:" keeps it in RAM, for tests)
+        max_checkpoints_per_thread: Number of checkpoints kept per thread and namespace
+        thread_ttl_seconds: Threads idle for longer than this are deleted on compaction
+        compact_interval_seconds: Interval of the background compaction thread, 0 disables it
+        serde: Optional serializer, defaults to LangGraph's msgpack serializer
+    """
+
+    def __init__(
+        self,
+        path: str = CHECKPOINT_DB_PATH,
+        max_checkpoints_per_thread: int = CHECKPOINT_MAX_PER_THREAD,
+        thread_ttl_seconds: Optional[float] = CHECKPOINT_THREAD_TTL_SECONDS,
+        compact_interval_seconds: float = CHECKPOINT_COMPACT_INTERVAL_SECONDS,
+        serde=None,
+    ):
+        super().__init__(serde=serde)
+        self.path = path
+        self.max_checkpoints_per_thread = max(1, max_checkpoints_per_thread)
+        self.thread_ttl_seconds = thread_ttl_seconds
+        self.compact_interval_seconds = compact_interval_seconds
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # auto_vacuum must be set before the first table is created to take effect
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        self._stop_event = threading.Event()
+        self._compactor = None
+        if compact_interval_seconds and compact_interval_seconds > 0:
+            self._compactor = threading.Thread(
+                target=self._compaction_loop, name="checkpoint-compactor", daemon=True
+            )
+            self._compactor.start()
+
+        system_logger.info(
+            f"SQLite checkpointer ready at {path} "
+            f"(keep={self.max_checkpoints_per_thread}, ttl={thread_ttl_seconds}s)"
+        )
+
+    # Serialization helpers
+    def _dump(self, obj: Any):
+        """Serialize an object with the serde, compressing large payloads."""
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) > COMPRESSION_THRESHOLD_BYTES:
+            return type_ + COMPRESSED_SUFFIX, zlib.compress(data, 6)
+        return type_, data
+
+    def _load(self, type_: str, data: bytes) -> Any:
+        """Deserialize a payload written by ``_dump``."""
+        if type_.endswith(COMPRESSED_SUFFIX):
+            type_ = type_[: -len(COMPRESSED_SUFFIX)]
+            data = zlib.decompress(data)
+        return self.serde.loads_typed((type_, data))
+
+    def _touch(self, thread_id: str):
+        """Record activity on a thread so that it is not expired."""
+        self._conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _build_tuple(self, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        """Assemble a CheckpointTuple from a checkpoints row and its pending writes."""
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self._load(type_, checkpoint),
+            metadata=self._load(metadata_type, metadata),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self._load(w_type, value))
+                for task_id, channel, w_type, value in writes
+            ],
+        )
+
+    # BaseCheckpointSaver interface
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Get the requested checkpoint, or the latest one of the thread."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            return self._build_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List stored checkpoints, newest first."""
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, "
+            "type, checkpoint, metadata_type, metadata FROM checkpoints"
+        )
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            checkpoint_ns = config["configurable"].get("checkpoint_ns")
+            if checkpoint_ns is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                checkpoint_tuple = self._build_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(
+                    checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()
+                ):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Store a checkpoint and prune the thread down to the retention limit."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, data = self._dump(checkpoint)
+        metadata_type, metadata_data = self._dump(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+                    "parent_checkpoint_id, type, checkpoint, metadata_type, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        data,
+                        metadata_type,
+                        metadata_data,
+                    ),
+                )
+                self._prune_thread(thread_id, checkpoint_ns)
+                self._touch(thread_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Store the intermediate writes of a task for a checkpoint."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special writes (errors, interrupts) overwrite, regular writes are kept once
+        replace_rows, insert_rows = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dump(value)
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel, type_, data, task_path)
+            (replace_rows if write_idx < 0 else insert_rows).append(row)
+        columns = "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)"
+        placeholders = "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(f"INSERT OR REPLACE INTO writes {columns} {placeholders}", replace_rows)
+                self._conn.executemany(f"INSERT OR IGNORE INTO writes {columns} {placeholders}", insert_rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint and write of a thread."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._delete_threads([thread_id])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # Async variants run the blocking SQLite calls in the default executor
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await _run_in_executor(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        results = await _run_in_executor(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in results:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await _run_in_executor(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path="") -> None:
+        return await _run_in_executor(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await _run_in_executor(self.delete_thread, thread_id)
+
+    # Retention and compaction
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str):
+        """Drop all but the newest checkpoints of a thread, with their writes."""
+        stale = self._conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_checkpoints_per_thread),
+        ).fetchall()
+        if not stale:
+            return
+        params = [(thread_id, checkpoint_ns, checkpoint_id) for (checkpoint_id,) in stale]
+        self._conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            params,
+        )
+        self._conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            params,
+        )
+
+    def _delete_threads(self, thread_ids):
+        params = [(thread_id,) for thread_id in thread_ids]
+        self._conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", params)
+        self._conn.executemany("DELETE FROM writes WHERE thread_id = ?", params)
+        self._conn.executemany("DELETE FROM threads WHERE thread_id = ?", params)
+
+    def expire_idle_threads(self, now: Optional[float] = None) -> int:
+        """
+        Delete threads that have not been read or written within the TTL.
+
+        Args:
+            now: Optional reference timestamp, defaults to the current time
+
+        Returns:
+            Number of threads deleted
+        """
+        if not self.thread_ttl_seconds:
+            return 0
+        cutoff = (now if now is not None else time.time()) - self.thread_ttl_seconds
+        with self._lock:
+            expired = [
+                thread_id for (thread_id,) in self._conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access < ?", (cutoff,)
+                )
+            ]
+            if expired:
+                self._conn.execute("BEGIN")
+                try:
+                    self._delete_threads(expired)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        return len(expired)
+
+    def compact(self) -> dict:
+        """
+        Expire idle threads and return freed pages to the filesystem.
+
+        Returns:
+            Dictionary with the number of expired threads and the file size after compaction
+        """
+        expired = self.expire_idle_threads()
+        with self._lock:
+            self._conn.execute("PRAGMA incremental_vacuum")
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        stats = {"expired_threads": expired, "size_bytes": self.size_bytes()}
+        if expired:
+            system_logger.info(f"Checkpoint compaction expired {expired} idle threads")
+        return stats
+
+    def size_bytes(self) -> int:
+        """Return the on-disk size of the checkpoint database in bytes."""
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def _compaction_loop(self):
+        while not self._stop_event.wait(self.compact_interval_seconds):
+            try:
+                self.compact()
+            except Exception as e:
+                system_logger.error(f"Checkpoint compaction failed: {e}")
+
+    def close(self):
+        """Stop the compaction thread and close the database connection."""
+        self._stop_event.set()
+        if self._compactor is not None:
+            self._compactor.join(timeout=5)
+        with self._lock:
+            self._conn.close()
+
+
+async def _run_in_executor(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
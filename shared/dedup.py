@@ -0,0 +1,345 @@
+"""
+Near-duplicate task detection with MinHash signatures and an LSH index.
+
+Each task's title and description are reduced to character shingles, hashed
+into a MinHash signature and bucketed per project by LSH bands. Candidates that
+share a band are confirmed by the fraction of matching signature values, which
+estimates the Jaccard similarity of their shingle sets.
+
+Signatures are stored in the task_signatures table next to the tasks, so the
+index is rebuilt on startup from stored signatures instead of rehashing text.
+Each process keeps its own index. Every write or delete of a signature is also
+logged in task_signature_changes, and refresh() replays the entries logged since
+the last load or refresh, so tasks saved by other workers are seen before a check.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+from logger import db_logger
+from shared import metrics
+from shared.models import SessionLocal, Task, TaskSignature, TaskSignatureChange
+
+# Similarity above which two tasks are duplicates, and what to do with them
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.7"))
+DEDUP_MODE = os.getenv("DEDUP_MODE", "merge")  # merge: skip duplicates, flag: save and report, off: disabled
+# Entries kept in the change log; a process that falls further behind reloads the whole index
+DEDUP_CHANGE_LOG_SIZE = int(os.getenv("DEDUP_CHANGE_LOG_SIZE", "100000"))
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 4
+INITIAL_CAPACITY = 1024
+# Tasks buffered before their bucket keys are merged into the sorted key array
+MERGE_SIZE = 2048
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, (1 << 32) - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, (1 << 32) - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_BAND_SALT = np.arange(BANDS, dtype=np.uint64) << np.uint64(48)
+_KEY_MULTIPLIERS = np.array(
+    [0x9E3779B97F4A7C15, 0xBF58476D1CE4E5B9, 0x94D049BB133111EB, 0xD6E8FEB86659FD93, 0xA0761D6478BD642F], dtype=np.uint64
+)
+_EMPTY_SIGNATURE = np.full(NUM_PERMUTATIONS, _MAX_HASH, dtype=np.uint32)
+
+
+def shingles(title, description=None):
+    """Return the set of character shingles of a task's normalized title and description."""
+    text = " ".join(re.findall(r"\w+", f"{title or ''} {description or ''}".lower()))
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(title, description=None):
+    """Compute the MinHash signature of a task as an array of NUM_PERMUTATIONS uint32 values."""
+    tokens = shingles(title, description)
+    if not tokens:
+        return _EMPTY_SIGNATURE.copy()
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(token.encode(), digest_size=4).digest(), "little") for token in tokens),
+        dtype=np.uint64, count=len(tokens)
+    )
+    # a and the hashes are below 2**32, so a * h + b stays within uint64
+    permuted = ((hashes[:, None] * _PERM_A + _PERM_B) % _MERSENNE_PRIME) & _MAX_HASH
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def similarity(first, second):
+    """Estimate the Jaccard similarity of two signatures."""
+    return float(np.count_nonzero(first == second)) / NUM_PERMUTATIONS
+
+
+def band_keys(project_ids, signatures):
+    """Return the (tasks, BANDS) bucket keys of signatures, each mixing the band, its values and the task's project."""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS_PER_BAND).astype(np.uint64)
+    # Project IDs stay far below 2**48, so the band number in the top bits keeps the bands apart
+    keys = np.asarray(project_ids, dtype=np.uint64)[:, None] ^ _BAND_SALT
+    for i in range(ROWS_PER_BAND):
+        # uint64 arithmetic wraps around, which is what a multiplicative hash wants
+        keys = (keys * _KEY_MULTIPLIERS[i]) ^ bands[:, :, i]
+    return (keys * _KEY_MULTIPLIERS[ROWS_PER_BAND]).view(np.int64)
+
+
+class DuplicateIndex:
+    """
+    In-memory LSH index of task signatures, partitioned by project.
+
+    Signatures live in one uint32 matrix with a row per task, and the bucket keys
+    of all bands in one sorted array that maps them to rows, so a task costs under
+    1 KB of memory. Tasks added since the last merge wait in a small dict of bucket
+    keys. Removing a task only frees its row; the bucket entries it leaves behind
+    are filtered out on lookup and dropped when the sorted array is rebuilt.
+
+    Args:
+        threshold: Minimum estimated similarity for a task to count as a duplicate
+        mode: What saving a duplicate does: "merge" skips it, "flag" saves and reports it, "off" disables checks
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, mode=DEDUP_MODE):
+        self.threshold = threshold
+        self.mode = mode
+        self._lock = threading.RLock()
+        self._reset()
+        self._seen_change = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, task_id):
+        return task_id in self._rows
+
+    def _reset(self):
+        self._rows = {}  # task_id -> row
+        self._free = []
+        self._size = 0
+        # Task IDs start at 1, so 0 marks a free row
+        self._task_ids = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._projects = np.zeros(INITIAL_CAPACITY, dtype=np.int64)
+        self._signatures = np.zeros((INITIAL_CAPACITY, NUM_PERMUTATIONS), dtype=np.uint32)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._key_rows = np.zeros(0, dtype=np.int32)
+        self._stale = 0
+        self._recent = {}  # bucket key -> rows, for tasks added since the last merge
+        self._recent_tasks = 0
+
+    def _place(self, task_id, project_id, signature):
+        """Store a task's signature in a free row, without adding its bucket keys."""
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._size == len(self._task_ids):
+                for name in ("_task_ids", "_projects", "_signatures"):
+                    old = getattr(self, name)
+                    grown = np.zeros((2 * len(old),) + old.shape[1:], dtype=old.dtype)
+                    grown[:self._size] = old
+                    setattr(self, name, grown)
+            row = self._size
+            self._size += 1
+        self._task_ids[row] = task_id
+        self._projects[row] = project_id or 0
+        self._signatures[row] = signature
+        self._rows[task_id] = row
+        return row
+
+    def _insert(self, task_id, project_id, signature):
+        self._remove(task_id)
+        row = self._place(task_id, project_id, signature)
+        for key in band_keys([project_id or 0], signature[None])[0].tolist():
+            self._recent.setdefault(key, []).append(row)
+        self._recent_tasks += 1
+        if self._recent_tasks == MERGE_SIZE:
+            self._merge()
+
+    def _remove(self, task_id):
+        row = self._rows.pop(task_id, None)
+        if row is None:
+            return
+        self._task_ids[row] = 0
+        self._free.append(row)
+        self._stale += BANDS
+
+    def _merge(self):
+        """Move the buffered bucket keys into the sorted array."""
+        if self._stale > len(self._keys) // 4:
+            self._rebuild()
+            return
+        keys = np.array([key for key, rows in self._recent.items() for _ in rows], dtype=np.int64)
+        rows = np.array([row for rows in self._recent.values() for row in rows], dtype=np.int32)
+        order = np.argsort(keys, kind="stable")
+        at = np.searchsorted(self._keys, keys[order])
+        self._keys = np.insert(self._keys, at, keys[order])
+        self._key_rows = np.insert(self._key_rows, at, rows[order])
+        self._recent, self._recent_tasks = {}, 0
+
+    def _rebuild(self, chunk_size=65536):
+        """Sort the bucket keys of every indexed task, dropping the entries left by removed tasks."""
+        live = np.flatnonzero(self._task_ids[:self._size]).astype(np.int32)
+        keys = np.concatenate([np.zeros(0, dtype=np.int64)] + [
+            band_keys(self._projects[live[i:i + chunk_size]], self._signatures[live[i:i + chunk_size]]).ravel()
+            for i in range(0, len(live), chunk_size)
+        ])
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._key_rows = np.repeat(live, BANDS)[order]
+        self._stale = 0
+        self._recent, self._recent_tasks = {}, 0
+
+    def find_duplicates(self, project_id, title, description=None, signature=None, exclude=None):
+        """
+        Find indexed tasks of the same project that are near-duplicates of the given text.
+
+        Returns:
+            List of (task_id, similarity) pairs, most similar first
+        """
+        start = time.perf_counter()
+        signature = minhash(title, description) if signature is None else signature
+        keys = band_keys([project_id or 0], signature[None])[0]
+        with self._lock:
+            found = [np.array([row for key in keys.tolist() for row in self._recent.get(key, ())], dtype=np.int32)]
+            lows, highs = self._keys.searchsorted(keys), self._keys.searchsorted(keys, side="right")
+            found += [self._key_rows[low:high] for low, high in zip(lows.tolist(), highs.tolist()) if high > low]
+            rows = np.unique(np.concatenate(found))
+            # Bucket keys are hashes and removed tasks leave theirs behind, so candidates are checked
+            task_ids = self._task_ids[rows]
+            rows = rows[(task_ids != 0) & (task_ids != (exclude or 0)) & (self._projects[rows] == (project_id or 0))]
+            scores = np.count_nonzero(self._signatures[rows] == signature, axis=1) / NUM_PERMUTATIONS
+            matches = [
+                (task_id, score)
+                for task_id, score in zip(self._task_ids[rows].tolist(), scores.tolist()) if score >= self.threshold
+            ]
+        metrics.observe("dedup.lookup_seconds", time.perf_counter() - start)
+        return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+    def add(self, db, task_id, project_id, title, description=None, signature=None):
+        """Index a task and persist its signature in the caller's session (committed by the caller)."""
+        signature = minhash(title, description) if signature is None else signature
+        db.merge(TaskSignature(task_id=task_id, project_id=project_id, signature=signature.tobytes()))
+        self._log_changes(db, [task_id])
+        with self._lock:
+            self._insert(task_id, project_id, signature)
+        return signature
+
+    def add_many(self, db, tasks):
+        """Index several new tasks given as (task_id, project_id, title, description) tuples."""
+        rows = []
+        with self._lock:
+            for task_id, project_id, title, description in tasks:
+                signature = minhash(title, description)
+                self._insert(task_id, project_id, signature)
+                rows.append({"task_id": task_id, "project_id": project_id, "signature": signature.tobytes()})
+        if rows:
+            db.execute(insert(TaskSignature), rows)
+            self._log_changes(db, [row["task_id"] for row in rows])
+
+    def forget(self, task_ids):
+        """Drop tasks from the in-memory index only, e.g. after their transaction was rolled back."""
+        with self._lock:
+            for task_id in task_ids:
+                self._remove(task_id)
+
+    def remove(self, db, task_ids):
+        """Drop tasks from the index and delete their stored signatures (committed by the caller)."""
+        task_ids = list(task_ids)
+        self.forget(task_ids)
+        if task_ids:
+            db.execute(delete(TaskSignature).where(TaskSignature.task_id.in_(task_ids)))
+            self._log_changes(db, task_ids)
+
+    @staticmethod
+    def _log_changes(db, task_ids):
+        """Log changed signatures for the other processes, in the caller's session, and trim the log."""
+        db.execute(insert(TaskSignatureChange), [{"task_id": task_id} for task_id in task_ids])
+        newest = db.scalar(select(func.max(TaskSignatureChange.id)))
+        db.execute(delete(TaskSignatureChange).where(TaskSignatureChange.id <= newest - DEDUP_CHANGE_LOG_SIZE))
+
+    def refresh(self, db):
+        """Apply the signatures written or deleted by other processes since the last load or refresh."""
+        changes = db.execute(
+            select(TaskSignatureChange.id, TaskSignatureChange.task_id)
+            .where(TaskSignatureChange.id > self._seen_change).order_by(TaskSignatureChange.id)
+        ).all()
+        if not changes:
+            return
+        if changes[0].id != self._seen_change + 1 and db.scalar(select(func.min(TaskSignatureChange.id))) == changes[0].id:
+            # The entries this process has not seen yet were trimmed from the log
+            db_logger.info("Duplicate index fell behind the change log, reloading it")
+            self.load(db)
+            return
+        task_ids = {change.task_id for change in changes}
+        stored = db.execute(
+            select(TaskSignature.task_id, TaskSignature.project_id, TaskSignature.signature)
+            .where(TaskSignature.task_id.in_(task_ids))
+        ).all()
+        with self._lock:
+            for task_id, project_id, blob in stored:
+                signature = np.frombuffer(blob, dtype=np.uint32)
+                row = self._rows.get(task_id)
+                # Changes made by this process are already in the index
+                if row is None or self._projects[row] != (project_id or 0) or not np.array_equal(self._signatures[row], signature):
+                    self._insert(task_id, project_id, signature)
+            for task_id in task_ids - {row.task_id for row in stored}:
+                self._remove(task_id)
+            self._seen_change = max(self._seen_change, changes[-1].id)
+        metrics.increment("dedup.refreshed_tasks", len(task_ids))
+
+    def load(self, db, batch_size=5000):
+        """
+        Rebuild the index from the stored signatures, then reconcile it with the tasks table:
+        signatures of deleted tasks are dropped and tasks created elsewhere are hashed.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._reset()
+            # Changes logged while the index loads are replayed by the next refresh
+            self._seen_change = db.scalar(select(func.max(TaskSignatureChange.id))) or 0
+            stored = db.execute(
+                select(TaskSignature.task_id, TaskSignature.project_id, TaskSignature.signature)
+                .execution_options(yield_per=batch_size)
+            )
+            for task_id, project_id, blob in stored:
+                self._place(task_id, project_id, np.frombuffer(blob, dtype=np.uint32))
+            self._rebuild()
+
+            task_ids = {task_id for (task_id,) in db.execute(select(Task.id))}
+            stale = [task_id for task_id in self._rows if task_id not in task_ids]
+            missing = db.execute(
+                select(Task.id, Task.project_id, Task.title, Task.description)
+                .where(Task.id.not_in(select(TaskSignature.task_id)))
+            ).all()
+        self.remove(db, stale)
+        self.add_many(db, missing)
+        db.commit()
+        db_logger.info(
+            f"Loaded duplicate index with {len(self)} tasks in {time.perf_counter() - start:.3f}s "
+            f"({len(missing)} hashed, {len(stale)} stale)"
+        )
+
+
+_load_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _load_task_index():
+    index = DuplicateIndex()
+    db = SessionLocal()
+    try:
+        index.load(db)
+    finally:
+        db.close()
+    return index
+
+def get_task_index():
+    """Return the process-wide duplicate index, loading it from the database on first use."""
+    with _load_lock:
+        return _load_task_index()
@@ -0,0 +1,174 @@
+"""
+Streaming export of tasks, assignments and assignment decisions as NDJSON or CSV.
+
+Rows are read through server-side cursors in fixed-size batches and written out
+one at a time, so memory use does not depend on the size of the tables.
+"""
+
+import csv
+import io
+import json
+import os
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import select
+
+from shared.logger import DECISION_LOG_PATH
+from shared.models import SessionLocal, Task, Assignment, User
+
+# Rows read from the database per batch while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_KINDS = ("tasks", "assignments", "decisions")
+EXPORT_FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+TASK_FIELDS = ["id", "project_id", "title", "description", "priority", "role_required", "deadline", "created_by", "user_id"]
+ASSIGNMENT_FIELDS = ["assignment_id", "task_id", "project_id", "task_title", "priority", "deadline",
+                     "developer_id", "developer_username", "developer_name", "developer_role"]
+DECISION_FIELDS = ["timestamp", "decision", "task_id", "developer_id"]
+
+
+def _date_bounds(since=None, until=None):
+    """Turn an inclusive date range into datetime bounds [start, end)."""
+    start = datetime.combine(since, time.min) if since else None
+    end = datetime.combine(until + timedelta(days=1), time.min) if until else None
+    return start, end
+
+
+def _stream(db, statement, batch_size):
+    """Execute a statement through a server-side cursor, fetching batch_size rows at a time."""
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    for row in result:
+        yield row._asdict()
+
+
+def iter_tasks(db, project_id=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield tasks as dictionaries, filtered by project and deadline date range."""
+    statement = select(*(getattr(Task, field) for field in TASK_FIELDS)).order_by(Task.id)
+    start, end = _date_bounds(since, until)
+    if project_id is not None:
+        statement = statement.where(Task.project_id == project_id)
+    if start:
+        statement = statement.where(Task.deadline >= start)
+    if end:
+        statement = statement.where(Task.deadline < end)
+    return _stream(db, statement, batch_size)
+
+
+def iter_assignments(db, project_id=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield assignments joined to their task and developer in a single query."""
+    statement = (
+        select(
+            Assignment.id.label("assignment_id"),
+            Task.id.label("task_id"),
+            Task.project_id,
+            Task.title.label("task_title"),
+            Task.priority,
+            Task.deadline,
+            User.id.label("developer_id"),
+            User.username.label("developer_username"),
+            User.full_name.label("developer_name"),
+            User.role.label("developer_role"),
+        )
+        .join(Task, Assignment.task_id == Task.id)
+        .outerjoin(User, Assignment.user_id == User.id)
+        .order_by(Assignment.id)
+    )
+    start, end = _date_bounds(since, until)
+    if project_id is not None:
+        statement = statement.where(Task.project_id == project_id)
+    if start:
+        statement = statement.where(Task.deadline >= start)
+    if end:
+        statement = statement.where(Task.deadline < end)
+    return _stream(db, statement, batch_size)
+
+
+def iter_decisions(since=None, until=None, path=DECISION_LOG_PATH):
+    """Yield assignment decisions from the decision log, filtered by date range."""
+    if not os.path.exists(path):
+        return
+    start, end = _date_bounds(since, until)
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                decision = json.loads(line)
+                timestamp = datetime.fromisoformat(decision["timestamp"])
+            except (ValueError, KeyError):
+                continue
+            if (start and timestamp < start) or (end and timestamp >= end):
+                continue
+            yield decision
+
+
+def _format_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def write_ndjson(rows):
+    """Encode rows as NDJSON lines."""
+    for row in rows:
+        yield json.dumps({key: _format_value(value) for key, value in row.items()}, default=str) + "\n"
+
+
+def write_csv(rows, fieldnames, batch_size=EXPORT_BATCH_SIZE):
+    """Encode rows as CSV, header first, emitting one chunk per batch_size rows."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow({key: _format_value(value) for key, value in row.items()})
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export(kind, fmt="ndjson", project_id=None, since=None, until=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream an export as text chunks.
+
+    The database session is opened lazily and held only while the export is consumed,
+    which makes the generator suitable for a StreamingResponse.
+
+    Args:
+        kind: "tasks", "assignments" or "decisions"
+        fmt: "ndjson" or "csv"
+        project_id: Only export rows of this project (tasks and assignments)
+        since: First deadline date (tasks and assignments) or decision date to include
+        until: Last deadline date or decision date to include
+        batch_size: Rows fetched per round trip and per CSV chunk
+
+    Yields:
+        Text chunks of the export
+    """
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Unknown export: {kind}. Use one of: {', '.join(EXPORT_KINDS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}. Use one of: {', '.join(EXPORT_FORMATS)}")
+
+    def generate():
+        db = SessionLocal() if kind != "decisions" else None
+        try:
+            if kind == "tasks":
+                rows, fieldnames = iter_tasks(db, project_id, since, until, batch_size), TASK_FIELDS
+            elif kind == "assignments":
+                rows, fieldnames = iter_assignments(db, project_id, since, until, batch_size), ASSIGNMENT_FIELDS
+            else:
+                rows, fieldnames = iter_decisions(since, until), DECISION_FIELDS
+            if fmt == "csv":
+                yield from write_csv(rows, fieldnames, batch_size)
+            else:
+                yield from write_ndjson(rows)
+        finally:
+            if db is not None:
+                db.close()
+
+    return generate()
@@ -0,0 +1,87 @@
+"""
+Batched last_login updates.
+
+A login only notes its time in memory. A background thread writes the noted
+times every ``LAST_LOGIN_FLUSH_SECONDS`` with one executemany UPDATE, so a burst
+of logins costs one commit rather than one per login. Times still pending are
+written on shutdown.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from logger import system_logger
+from shared import metrics
+
+# How often pending login times are written
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv("LAST_LOGIN_FLUSH_SECONDS", "30"))
+
+
+class LastLoginRecorder:
+    """
+    Collects login times per user and writes them in batches.
+
+    Args:
+        flush_seconds: Interval between writes of the pending login times
+    """
+
+    def __init__(self, flush_seconds=LAST_LOGIN_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def record(self, username, when=None):
+        """Note a login; only the latest time per user is kept."""
+        with self._lock:
+            self._pending[username] = when or datetime.utcnow()
+
+    def flush(self):
+        """Write the pending login times. Returns the number of users updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        from shared import models
+
+        db = models.SessionLocal()
+        try:
+            models.record_logins(db, pending)
+        except Exception:
+            # Keep the times for the next flush, unless a newer login replaced them
+            with self._lock:
+                for username, when in pending.items():
+                    self._pending.setdefault(username, when)
+            raise
+        finally:
+            db.close()
+        metrics.increment("auth.last_login.flushes")
+        metrics.observe("auth.last_login.batch_size", len(pending))
+        return len(pending)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_seconds):
+            try:
+                self.flush()
+            except Exception as e:
+                system_logger.error(f"Writing last_login times failed: {e}")
+
+    def start(self):
+        """Start the background flush thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="last-login-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background flush thread and write what is still pending."""
+        self._stop.set()
+        self.flush()
+
+
+# Shared by every login in the process
+last_login_recorder = LastLoginRecorder()
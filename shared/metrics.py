@@ -0,0 +1,96 @@
+"""
+In-process metrics registry for the Clara PM services.
+
+Counters and latency histograms are kept in memory and exposed as a plain
+dictionary through ``snapshot()`` for the ``/metrics`` endpoints.
+"""
+
+import threading
+from collections import deque
+
+# Number of most recent observations kept per histogram for percentiles
+HISTOGRAM_WINDOW = 2048
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+
+
+class Histogram:
+    """Running count/sum/max plus a sliding window of recent observations."""
+
+    def __init__(self, window=HISTOGRAM_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def summary(self):
+        recent = sorted(self.recent)
+
+        def percentile(pct):
+            if not recent:
+                return 0.0
+            return recent[min(len(recent) - 1, int(len(recent) * pct / 100))]
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else 0.0,
+            "max": round(self.max, 6),
+            "p50": round(percentile(50), 6),
+            "p95": round(percentile(95), 6),
+            "p99": round(percentile(99), 6)
+        }
+
+
+def increment(name, value=1):
+    """Increment a counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Set a gauge to its current value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name, value):
+    """Record an observation (typically a duration in seconds) in a histogram."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.observe(value)
+
+
+def get_counter(name):
+    """Return the current value of a counter."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot():
+    """Return all metrics as a JSON-serializable dictionary."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {name: h.summary() for name, h in _histograms.items()}
+        }
+
+
+def reset():
+    """Clear all metrics (used by tests)."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
@@ -1,18 +1,31 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, ForeignKey, DateTime, Boolean, LargeBinary, update, bindparam
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
-from datetime import datetime
-from passlib.context import CryptContext
-
-# Password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from datetime import datetime, timedelta
+from functools import lru_cache
+# Passwords are hashed on a bounded worker pool with a configurable cost factor
+from shared.passwords import pwd_context, password_hasher
 
 # Define the SQLite database
 DATABASE_URL = "sqlite:///clara_pm.db"
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Create the database tables on first use rather than at import time
+@lru_cache(maxsize=None)
+def init_db():
+    """Create any missing tables. Runs once per process."""
+    Base.metadata.create_all(bind=engine)
+
+class LazySchemaSessionmaker(sessionmaker):
+    """Session factory that makes sure the tables exist before the first session is opened."""
+    def __call__(self, **local_kw):
+        init_db()
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySchemaSessionmaker(autocommit=False, autoflush=False, bind=engine)
+
 # Define the Task model
 class Task(Base):
     __tablename__ = "tasks"
@@ -29,6 +42,23 @@ class Task(Base):
 
     user = relationship("User", back_populates="tasks")
 
+# Define the TaskSignature model: persisted MinHash signatures for near-duplicate detection
+class TaskSignature(Base):
+    __tablename__ = "task_signatures"
+
+    task_id = Column(Integer, primary_key=True)
+    project_id = Column(Integer, index=True)
+    signature = Column(LargeBinary, nullable=False)
+
+# Define the TaskSignatureChange model: the task IDs whose signature was written or deleted, in order,
+# so that every process can bring its duplicate index up to date
+class TaskSignatureChange(Base):
+    __tablename__ = "task_signature_changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(Integer, nullable=False)
+
 # Define the User model with authentication fields
 class User(Base):
     __tablename__ = "users"
@@ -45,6 +75,20 @@ class User(Base):
 
     tasks = relationship("Task", back_populates="user")
 
+# Define the RefreshToken model: rotating refresh tokens, stored only as digests
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, unique=True, index=True, nullable=False)
+    family_id = Column(String, index=True, nullable=False)  # Shared by every token rotated from one login
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)  # Set once the token has been used or revoked
+
+    user = relationship("User")
+
 # Define the Assignment model
 class Assignment(Base):
     __tablename__ = "assignments"
@@ -56,6 +100,16 @@ class Assignment(Base):
     task = relationship("Task")
     user = relationship("User")
 
+# Define the AssignmentAnalysis model: behavior tree analyses precomputed for new tasks
+class AssignmentAnalysis(Base):
+    __tablename__ = "assignment_analyses"
+
+    task_id = Column(Integer, primary_key=True)
+    developer_id = Column(Integer, primary_key=True)
+    data_version = Column(String, nullable=False)  # Digest of the inputs the analysis was computed from
+    analysis = Column(String, nullable=False)  # JSON
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
 # Define the TaskSpec model
 class TaskSpec(Base):
     __tablename__ = "task_specs"
@@ -84,22 +138,86 @@ class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(String, ForeignKey("conversation_sessions.session_id"))
+    session_id = Column(String, ForeignKey("conversation_sessions.session_id"), index=True)
     type = Column(String)  # "user" or "ai"
     content = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     session = relationship("ConversationSession", back_populates="messages")
 
-# Create the database tables
-Base.metadata.create_all(bind=engine)
+# Full-text index of message contents, for searching a user's conversations.
+# The rowid of an entry is user_id * MESSAGE_SEARCH_STRIDE + the message ID, so
+# the messages of a user are one rowid range and a search never reads the
+# entries of other users. Triggers keep the index in step with the messages table.
+MESSAGE_SEARCH_STRIDE = 1 << 40
+
+_MESSAGE_SEARCH_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content, session_id)
+        SELECT user_id * {MESSAGE_SEARCH_STRIDE} + new.id, new.content, new.session_id
+        FROM conversation_sessions WHERE session_id = new.session_id AND user_id IS NOT NULL;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        UPDATE messages_fts SET content = new.content WHERE rowid = (
+            SELECT user_id * {MESSAGE_SEARCH_STRIDE} + old.id FROM conversation_sessions WHERE session_id = old.session_id
+        );
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        DELETE FROM messages_fts WHERE rowid = (
+            SELECT user_id * {MESSAGE_SEARCH_STRIDE} + old.id FROM conversation_sessions WHERE session_id = old.session_id
+        );
+    END""",
+    # Covers messages whose session is deleted before them
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_session_delete BEFORE DELETE ON conversation_sessions BEGIN
+        DELETE FROM messages_fts WHERE rowid IN (
+            SELECT old.user_id * {MESSAGE_SEARCH_STRIDE} + id FROM messages WHERE session_id = old.session_id
+        );
+    END""",
+]
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_message_search(target, connection, **kw):
+    """Create the message search index and its triggers, indexing the messages already stored."""
+    if connection.dialect.name != "sqlite":
+        return
+    if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").first() is None:
+        try:
+            connection.exec_driver_sql(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5(content, session_id UNINDEXED, tokenize='porter unicode61')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5; conversation search is unavailable
+            return
+        connection.exec_driver_sql(
+            f"""INSERT INTO messages_fts(rowid, content, session_id)
+            SELECT s.user_id * {MESSAGE_SEARCH_STRIDE} + m.id, m.content, m.session_id
+            FROM messages m JOIN conversation_sessions s ON s.session_id = m.session_id
+            WHERE s.user_id IS NOT NULL"""
+        )
+    for trigger in _MESSAGE_SEARCH_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+@event.listens_for(Base.metadata, "before_drop")
+def _drop_message_search(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql("DROP TABLE IF EXISTS messages_fts")
+
+# The cached user directory used for authentication, kept in step with user writes
+def _user_directory():
+    from shared.user_directory import user_directory
+    return user_directory
+
+# Logins are noted in memory and their last_login times written in batches
+def _last_login_recorder():
+    from shared.last_login import last_login_recorder
+    return last_login_recorder
 
 # Password hashing and verification
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_and_update(plain_password, hashed_password)[0]
 
 # Create a new task with additional fields
 def create_task(db: Session, title: str, description: str, user_id: int, project_id: int, priority: str, role_required: str, deadline: datetime, created_by: str):
@@ -129,6 +247,47 @@ def update_task(db: Session, task_id: int, title: str = None, description: str =
         db.refresh(task)
     return task
 
+# Search tasks by title or description, returning the total count and one page of matches
+def search_tasks(db: Session, search_term: str, offset: int = 0, limit: int = None):
+    pattern = f"%{search_term}%"
+    query = db.query(Task).filter(Task.title.ilike(pattern) | Task.description.ilike(pattern))
+    total = query.count()
+    page = query.order_by(Task.id).offset(offset)
+    if limit is not None:
+        page = page.limit(limit)
+    return total, page.all()
+
+# Fields that may be patched on an existing task
+TASK_UPDATABLE_FIELDS = {"title", "description", "priority", "role_required", "deadline", "project_id", "user_id"}
+
+# Get several tasks by ID in one query
+def get_tasks_by_ids(db: Session, task_ids):
+    if not task_ids:
+        return []
+    return db.query(Task).filter(Task.id.in_(task_ids)).order_by(Task.id).all()
+
+# Apply partial updates to several tasks in one transaction
+def update_tasks(db: Session, patches):
+    """
+    Each patch is a dict with the task "id" plus the fields to change.
+    Returns the IDs of the tasks that exist and were updated.
+    """
+    existing_ids = {task_id for (task_id,) in db.query(Task.id).filter(Task.id.in_([p["id"] for p in patches]))}
+    rows = [patch for patch in patches if patch["id"] in existing_ids]
+    if rows:
+        db.execute(update(Task), rows)
+    db.commit()
+    return [patch["id"] for patch in rows]
+
+# Delete several tasks in one transaction
+def delete_tasks(db: Session, task_ids):
+    """Returns the IDs of the tasks that existed and were deleted."""
+    existing_ids = [task_id for (task_id,) in db.query(Task.id).filter(Task.id.in_(task_ids))]
+    if existing_ids:
+        db.query(Task).filter(Task.id.in_(existing_ids)).delete(synchronize_session=False)
+    db.commit()
+    return existing_ids
+
 # Delete a task
 def delete_task(db: Session, task_id: int):
     task = get_task(db, task_id)
@@ -138,8 +297,10 @@ def delete_task(db: Session, task_id: int):
     return task
 
 # Create a new user with authentication
-def create_user(db: Session, username: str, email: str, password: str, full_name: str, role: str = "user"):
-    hashed_password = get_password_hash(password)
+def create_user(db: Session, username: str, email: str, password: str, full_name: str, role: str = "user", hashed_password: str = None):
+    # Callers on an event loop hash the password beforehand
+    if hashed_password is None:
+        hashed_password = get_password_hash(password)
     new_user = User(
         username=username,
         email=email,
@@ -150,6 +311,7 @@ def create_user(db: Session, username: str, email: str, password: str, full_name
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    _user_directory().put(new_user)
     return new_user
 
 # Get a user by ID
@@ -180,14 +342,17 @@ def update_user(db: Session, user_id: int, **kwargs):
         user.last_login = datetime.utcnow()
         db.commit()
         db.refresh(user)
+        _user_directory().put(user)
     return user
 
 # Delete a user
 def delete_user(db: Session, user_id: int):
     user = get_user(db, user_id)
     if user:
+        db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete(synchronize_session=False)
         db.delete(user)
         db.commit()
+        _user_directory().invalidate(user.username)
     return user
 
 # Authenticate user
@@ -195,11 +360,76 @@ def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return False
-    update_user(db, user.id)  # Update last_login
+    if new_hash:
+        # Upgrade a hash made with an outdated cost factor (this also sets last_login)
+        update_user(db, user.id, hashed_password=new_hash)
+    else:
+        _last_login_recorder().record(username)
     return user
 
+# Write batched last_login times in one statement
+def record_logins(db: Session, logins: dict):
+    users = User.__table__
+    db.execute(
+        update(users).where(users.c.username == bindparam("login_username")).values(last_login=bindparam("login_at")),
+        [{"login_username": username, "login_at": login_at} for username, login_at in logins.items()]
+    )
+    db.commit()
+
+# Store a new refresh token, dropping the user's expired ones
+def create_refresh_token(db: Session, user_id: int, token_hash: str, family_id: str, expires_at: datetime):
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id, RefreshToken.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    token = RefreshToken(token_hash=token_hash, family_id=family_id, user_id=user_id, expires_at=expires_at)
+    db.add(token)
+    db.commit()
+    return token
+
+# Get a refresh token by the digest of its value
+def get_refresh_token(db: Session, token_hash: str):
+    return db.query(RefreshToken).filter(RefreshToken.token_hash == token_hash).first()
+
+# Revoke a refresh token and store its successor in one transaction
+def rotate_refresh_token(db: Session, token: RefreshToken, token_hash: str, expires_at: datetime):
+    # Conditional update, so that of two concurrent rotations only one succeeds
+    revoked = db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == token.id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not revoked:
+        db.rollback()
+        return None
+    successor = RefreshToken(token_hash=token_hash, family_id=token.family_id, user_id=token.user_id, expires_at=expires_at)
+    db.add(successor)
+    db.commit()
+    return successor
+
+# Whether a token was rotated in the last grace_seconds and its login has not been revoked since
+def recently_rotated(db: Session, token: RefreshToken, grace_seconds: float):
+    if token.revoked_at is None or token.revoked_at < datetime.utcnow() - timedelta(seconds=grace_seconds):
+        return False
+    live = db.query(RefreshToken.id).filter(
+        RefreshToken.family_id == token.family_id, RefreshToken.revoked_at.is_(None)
+    ).first()
+    return live is not None
+
+# Revoke every unrevoked refresh token of a family or of a user
+def revoke_refresh_tokens(db: Session, family_id: str = None, user_id: int = None):
+    query = update(RefreshToken).where(RefreshToken.revoked_at.is_(None))
+    if family_id is not None:
+        query = query.where(RefreshToken.family_id == family_id)
+    if user_id is not None:
+        query = query.where(RefreshToken.user_id == user_id)
+    revoked = db.execute(query.values(revoked_at=datetime.utcnow()).execution_options(synchronize_session=False)).rowcount
+    db.commit()
+    return revoked
+
 # Initialize some default users if they don't exist
 def init_default_users(db: Session):
     # Check if admin user exists
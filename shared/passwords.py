@@ -0,0 +1,101 @@
+"""
+Password hashing on a bounded worker pool, off the event loop.
+
+bcrypt costs 100-300 ms of CPU per hash or verification at the default cost, so
+it never runs on the event loop. Every hash and verification goes through one
+small thread pool, whose size caps the CPU that logins can take. bcrypt releases
+the GIL while hashing, so threads run in parallel without a process pool.
+Callers beyond the cap wait in the pool's queue, and the wait is recorded.
+
+The cost factor is configured per environment with ``BCRYPT_ROUNDS``. A stored
+hash made with a different cost is upgraded on the next successful login.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+from passlib.context import CryptContext
+
+from shared import metrics
+
+# bcrypt cost factor and the number of hashes computed at once, from the environment or defaults
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Hashes with any other cost factor are reported as needing an update
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+class PasswordHasher:
+    """
+    Runs password hashing and verification on a bounded thread pool.
+
+    Args:
+        context: passlib CryptContext with the hashing policy
+        max_workers: Maximum number of hashes computed at once
+    """
+
+    def __init__(self, context=pwd_context, max_workers=PASSWORD_HASH_WORKERS):
+        self.context = context
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def _track(self, name, fn, *args):
+        """Wrap fn so that its queue wait and run time are recorded."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+            metrics.set_gauge("passwords.queued", self._queued)
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                metrics.set_gauge("passwords.queued", self._queued)
+                metrics.set_gauge("passwords.running", self._running)
+            metrics.observe("passwords.queue_wait_seconds", started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                metrics.observe(f"passwords.{name}_seconds", time.perf_counter() - started)
+                with self._lock:
+                    self._running -= 1
+                    metrics.set_gauge("passwords.running", self._running)
+
+        return run
+
+    def _submit(self, name, fn, *args):
+        return self._executor.submit(self._track(name, fn, *args))
+
+    def hash(self, password):
+        """Hash a password, blocking the calling thread until a worker has done it."""
+        return self._submit("hash", self.context.hash, password).result()
+
+    def verify_and_update(self, password, hashed_password):
+        """
+        Verify a password, blocking the calling thread until a worker has done it.
+
+        Returns:
+            Tuple of whether the password matches and, when the stored hash uses
+            an outdated cost factor, a replacement hash (else None)
+        """
+        return self._submit("verify", self.context.verify_and_update, password, hashed_password).result()
+
+    async def ahash(self, password):
+        """Hash a password without blocking the event loop."""
+        return await asyncio.wrap_future(self._submit("hash", self.context.hash, password))
+
+    async def averify_and_update(self, password, hashed_password):
+        """Verify a password without blocking the event loop; see verify_and_update."""
+        return await asyncio.wrap_future(self._submit("verify", self.context.verify_and_update, password, hashed_password))
+
+
+# Shared by every login and user creation in the process
+password_hasher = PasswordHasher()
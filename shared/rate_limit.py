@@ -0,0 +1,477 @@
+"""
+Token-bucket rate limiting for LLM calls.
+
+A single limiter per process sits in front of every chat model. It enforces
+deployment-wide requests/min and tokens/min buckets, per-user quotas keyed on
+the authenticated username, and priority lanes so that interactive intake
+traffic is always served before background assignment work. The buckets live
+in the process by default; with the Redis backend the intake and assignment
+services share them, and the interactive lane goes first across processes.
+"""
+
+import asyncio
+import contextvars
+import itertools
+import math
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List
+
+from shared import metrics
+
+# Priority lanes, served in this order
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANE_RANKS = {INTERACTIVE: 0, BACKGROUND: 1}
+
+# Default limits, overridable through the environment
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_USER_REQUESTS_PER_MINUTE = int(os.getenv("LLM_USER_REQUESTS_PER_MINUTE", "30"))
+LLM_USER_TOKENS_PER_MINUTE = int(os.getenv("LLM_USER_TOKENS_PER_MINUTE", "40000"))
+LLM_EXPECTED_COMPLETION_TOKENS = int(os.getenv("LLM_EXPECTED_COMPLETION_TOKENS", "500"))
+LLM_USER_BUCKETS_MAX = int(os.getenv("LLM_USER_BUCKETS_MAX", "10000"))
+
+# Where the buckets live: "memory" for this process only, "redis" to share them between processes
+LLM_RATE_LIMIT_BACKEND = os.getenv("LLM_RATE_LIMIT_BACKEND", "memory")
+LLM_RATE_LIMIT_REDIS_URL = os.getenv("LLM_RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+# How long an interactive waiter holds back background calls in other processes without polling again
+LLM_RATE_LIMIT_WAITER_TTL_SECONDS = float(os.getenv("LLM_RATE_LIMIT_WAITER_TTL_SECONDS", "1"))
+
+# Longest a waiter sleeps before re-checking the queue
+MAX_POLL_SECONDS = 0.05
+
+# Names this host's waiters in the shared Redis queue, together with the process ID
+_HOSTNAME = socket.gethostname()
+
+# Username of the request on whose behalf LLM calls are made
+current_llm_user = contextvars.ContextVar("current_llm_user", default=None)
+
+
+@contextmanager
+def llm_user(username):
+    """Attribute LLM calls made inside the block to a user's quota."""
+    token = current_llm_user.set(username)
+    try:
+        yield
+    finally:
+        current_llm_user.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously up to its capacity."""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.updated)
+        self.level = min(self.capacity, self.level + elapsed * self.refill_per_second)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` tokens are available (requests larger than the bucket wait for a full bucket)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return (amount - self.level) / self.refill_per_second
+
+    def consume(self, amount, now):
+        """Take tokens out of the bucket, possibly going into debt."""
+        self._refill(now)
+        self.level -= amount
+
+
+class _Ticket:
+    __slots__ = ("rank", "seq", "user", "tokens", "lane", "key", "user_ready_at")
+
+    def __init__(self, rank, seq, user, tokens, lane):
+        self.rank = rank
+        self.seq = seq
+        self.user = user
+        self.tokens = tokens
+        self.lane = lane
+        self.key = f"{_HOSTNAME}:{os.getpid()}:{seq}"
+        # When the user's own quota last allowed this call; waiters still over quota do not hold up the queue
+        self.user_ready_at = 0.0
+
+
+class MemoryBudget:
+    """
+    Token buckets of one process: a global pair and a pair per user, least recently used users dropped first.
+
+    Args:
+        requests_per_minute: Deployment-wide request budget
+        tokens_per_minute: Deployment-wide token budget
+        user_requests_per_minute: Request budget of each user
+        user_tokens_per_minute: Token budget of each user
+        max_users: Users whose buckets are kept; a dropped user starts again with full buckets
+    """
+
+    # Charging never waits on I/O, so it may run on the event loop
+    blocking = False
+
+    def __init__(self, requests_per_minute, tokens_per_minute, user_requests_per_minute, user_tokens_per_minute,
+                 max_users=LLM_USER_BUCKETS_MAX):
+        self.user_requests_per_minute = user_requests_per_minute
+        self.user_tokens_per_minute = user_tokens_per_minute
+        self.max_users = max_users
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0)
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
+        self._user_buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, user):
+        buckets = self._user_buckets.get(user)
+        if buckets is None:
+            buckets = self._user_buckets[user] = (
+                TokenBucket(self.user_requests_per_minute, self.user_requests_per_minute / 60.0),
+                TokenBucket(self.user_tokens_per_minute, self.user_tokens_per_minute / 60.0),
+            )
+            # The least recently used bucket has most likely refilled anyway
+            while len(self._user_buckets) > self.max_users:
+                self._user_buckets.popitem(last=False)
+        else:
+            self._user_buckets.move_to_end(user)
+        return buckets
+
+    def take(self, ticket):
+        """Charge the ticket if every bucket allows it; return (seconds to wait, seconds the user's quota adds)."""
+        now = time.monotonic()
+        with self._lock:
+            user_wait = 0.0
+            if ticket.user is not None:
+                requests, tokens = self._buckets_for(ticket.user)
+                user_wait = max(requests.wait_time(1, now), tokens.wait_time(ticket.tokens, now))
+            wait = max(user_wait, self._requests.wait_time(1, now), self._tokens.wait_time(ticket.tokens, now))
+            if wait > 0:
+                return wait, user_wait
+            self._requests.consume(1, now)
+            self._tokens.consume(ticket.tokens, now)
+            if ticket.user is not None:
+                requests.consume(1, now)
+                tokens.consume(ticket.tokens, now)
+            return 0.0, 0.0
+
+    def release(self, ticket):
+        pass
+
+    def settle(self, user, delta):
+        now = time.monotonic()
+        with self._lock:
+            self._tokens.consume(delta, now)
+            if user is not None:
+                self._buckets_for(user)[1].consume(delta, now)
+
+
+class RedisBudget:
+    """
+    Token buckets shared by every process through Redis, so that the intake and
+    assignment services draw on one budget and background calls anywhere wait
+    for interactive ones.
+
+    The global buckets and each user's buckets are a hash of levels and the time
+    they were last updated, read and written in one WATCH transaction per grant.
+    Interactive calls that wait on the global budget are kept in a sorted set by
+    expiry; while it holds a live entry, background calls are not granted. Each
+    key expires once its buckets would have refilled, so idle users cost nothing.
+
+    Args:
+        requests_per_minute: Deployment-wide request budget
+        tokens_per_minute: Deployment-wide token budget
+        user_requests_per_minute: Request budget of each user
+        user_tokens_per_minute: Token budget of each user
+        client: Redis client; by default one is connected to ``LLM_RATE_LIMIT_REDIS_URL``
+        prefix: Prefix of every key
+    """
+
+    # Every charge is a Redis round trip, which async callers make in a worker thread
+    blocking = True
+
+    def __init__(self, requests_per_minute, tokens_per_minute, user_requests_per_minute, user_tokens_per_minute,
+                 client=None, prefix="llm_rate"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(LLM_RATE_LIMIT_REDIS_URL)
+        self.client = client
+        self.prefix = prefix
+        self.limits = (requests_per_minute, tokens_per_minute)
+        self.user_limits = (user_requests_per_minute, user_tokens_per_minute)
+        self._waiters_key = f"{prefix}:interactive"
+
+    def _key(self, user):
+        return f"{self.prefix}:global" if user is None else f"{self.prefix}:user:{user}"
+
+    @staticmethod
+    def _now(pipe):
+        seconds, microseconds = pipe.time()
+        return seconds + microseconds / 1e6
+
+    @staticmethod
+    def _load(pipe, key, limits, now):
+        """Return the (requests, tokens) buckets stored under key, full if it has expired."""
+        buckets = tuple(TokenBucket(limit, limit / 60.0) for limit in limits)
+        state = pipe.hgetall(key)
+        for bucket, field in zip(buckets, (b"requests", b"tokens")):
+            bucket.level = float(state[field]) if state else bucket.capacity
+            bucket.updated = float(state[b"updated"]) if state else now
+        return buckets
+
+    @staticmethod
+    def _store(pipe, key, buckets, now):
+        pipe.hset(key, mapping={"requests": buckets[0].level, "tokens": buckets[1].level, "updated": now})
+        if all(bucket.refill_per_second > 0 for bucket in buckets):
+            refilled = max((bucket.capacity - bucket.level) / bucket.refill_per_second for bucket in buckets)
+            pipe.expire(key, max(1, math.ceil(refilled)))
+
+    def take(self, ticket):
+        """Charge the ticket if every bucket allows it; return (seconds to wait, seconds the user's quota adds)."""
+        keys = [self._key(None), self._waiters_key] + ([self._key(ticket.user)] if ticket.user is not None else [])
+
+        def attempt(pipe):
+            now = self._now(pipe)
+            requests, tokens = self._load(pipe, keys[0], self.limits, now)
+            user_wait = 0.0
+            if ticket.user is not None:
+                user_buckets = self._load(pipe, keys[2], self.user_limits, now)
+                user_wait = max(user_buckets[0].wait_time(1, now), user_buckets[1].wait_time(ticket.tokens, now))
+            wait = max(user_wait, requests.wait_time(1, now), tokens.wait_time(ticket.tokens, now))
+            if ticket.lane != INTERACTIVE and pipe.zcount(self._waiters_key, now, "+inf"):
+                wait = max(wait, MAX_POLL_SECONDS)
+            pipe.multi()
+            pipe.zremrangebyscore(self._waiters_key, "-inf", now)
+            if wait > 0:
+                if ticket.lane == INTERACTIVE and user_wait == 0:
+                    pipe.zadd(self._waiters_key, {ticket.key: now + LLM_RATE_LIMIT_WAITER_TTL_SECONDS})
+                return wait, user_wait
+            requests.consume(1, now)
+            tokens.consume(ticket.tokens, now)
+            self._store(pipe, keys[0], (requests, tokens), now)
+            if ticket.user is not None:
+                user_buckets[0].consume(1, now)
+                user_buckets[1].consume(ticket.tokens, now)
+                self._store(pipe, keys[2], user_buckets, now)
+            pipe.zrem(self._waiters_key, ticket.key)
+            return 0.0, 0.0
+
+        return self.client.transaction(attempt, *keys, value_from_callable=True)
+
+    def release(self, ticket):
+        if ticket.lane == INTERACTIVE:
+            self.client.zrem(self._waiters_key, ticket.key)
+
+    def settle(self, user, delta):
+        for key, limits in [(self._key(None), self.limits)] + ([(self._key(user), self.user_limits)] if user is not None else []):
+            def attempt(pipe, key=key, limits=limits):
+                now = self._now(pipe)
+                buckets = self._load(pipe, key, limits, now)
+                buckets[1].consume(delta, now)
+                pipe.multi()
+                self._store(pipe, key, buckets, now)
+
+            self.client.transaction(attempt, key)
+
+
+def create_budget(kind=None, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                  user_requests_per_minute=LLM_USER_REQUESTS_PER_MINUTE, user_tokens_per_minute=LLM_USER_TOKENS_PER_MINUTE):
+    """Create the token buckets selected by ``LLM_RATE_LIMIT_BACKEND``."""
+    kind = (kind or LLM_RATE_LIMIT_BACKEND).lower()
+    limits = (requests_per_minute, tokens_per_minute, user_requests_per_minute, user_tokens_per_minute)
+    if kind == "memory":
+        return MemoryBudget(*limits)
+    if kind == "redis":
+        return RedisBudget(*limits)
+    raise ValueError(f"Unknown LLM rate limit backend: {kind}")
+
+
+class LLMRateLimiter:
+    """
+    Limiter for LLM calls that queues them by lane and charges them to global and per-user token buckets.
+
+    Args:
+        requests_per_minute: Deployment-wide request budget
+        tokens_per_minute: Deployment-wide token budget
+        user_requests_per_minute: Request budget of each user
+        user_tokens_per_minute: Token budget of each user
+        budget: Token buckets to charge; by default created by create_budget with these limits
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+        user_requests_per_minute=LLM_USER_REQUESTS_PER_MINUTE,
+        user_tokens_per_minute=LLM_USER_TOKENS_PER_MINUTE,
+        budget=None,
+    ):
+        self.budget = budget or create_budget(
+            None, requests_per_minute, tokens_per_minute, user_requests_per_minute, user_tokens_per_minute
+        )
+        self._waiting: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enqueue(self, user, tokens, lane):
+        ticket = _Ticket(LANE_RANKS.get(lane, LANE_RANKS[BACKGROUND]), next(self._seq), user, tokens, lane)
+        with self._lock:
+            self._waiting.append(ticket)
+            self._waiting.sort(key=lambda t: (t.rank, t.seq))
+        return ticket
+
+    def _try_grant(self, ticket, now):
+        """Grant the ticket if it is next in line; otherwise return how long to wait."""
+        with self._lock:
+            # A waiter ahead of us (higher lane or earlier) whose own quota allows it goes first;
+            # users over quota do not hold up everyone else.
+            for other in self._waiting:
+                if other is ticket:
+                    break
+                if other.user_ready_at <= now:
+                    return MAX_POLL_SECONDS
+        # The budget may be remote, so the queue is not locked while it is charged
+        wait, user_wait = self.budget.take(ticket)
+        with self._lock:
+            ticket.user_ready_at = now + user_wait
+            if wait > 0:
+                return wait
+            self._waiting.remove(ticket)
+            return 0.0
+
+    def _discard(self, ticket):
+        with self._lock:
+            if ticket not in self._waiting:
+                return
+            self._waiting.remove(ticket)
+        self.budget.release(ticket)
+
+    async def _off_loop(self, func, *args):
+        """Call func without blocking the event loop on a remote budget."""
+        if self.budget.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    def _record(self, lane, waited):
+        metrics.observe(f"llm.queue_wait_seconds.{lane}", waited)
+        metrics.increment(f"llm.requests.{lane}")
+        with self._lock:
+            metrics.set_gauge("llm.queue_depth", len(self._waiting))
+
+    def acquire(self, user=None, tokens=1, lane=BACKGROUND):
+        """
+        Block until a call may be issued.
+
+        Args:
+            user: Username whose quota is charged, None for system work
+            tokens: Estimated tokens of the call
+            lane: Priority lane (INTERACTIVE or BACKGROUND)
+
+        Returns:
+            Seconds spent waiting in the queue
+        """
+        start = time.monotonic()
+        ticket = self._enqueue(user, tokens, lane)
+        try:
+            while True:
+                wait = self._try_grant(ticket, time.monotonic())
+                if wait == 0:
+                    break
+                time.sleep(min(wait, MAX_POLL_SECONDS))
+        finally:
+            self._discard(ticket)
+        waited = time.monotonic() - start
+        self._record(lane, waited)
+        return waited
+
+    async def aacquire(self, user=None, tokens=1, lane=BACKGROUND):
+        """Asynchronous version of acquire."""
+        start = time.monotonic()
+        ticket = self._enqueue(user, tokens, lane)
+        try:
+            while True:
+                wait = await self._off_loop(self._try_grant, ticket, time.monotonic())
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, MAX_POLL_SECONDS))
+        finally:
+            await self._off_loop(self._discard, ticket)
+        waited = time.monotonic() - start
+        self._record(lane, waited)
+        return waited
+
+    def settle(self, user, estimated_tokens, actual_tokens):
+        """Correct the token buckets once the real usage of a call is known."""
+        if actual_tokens is None:
+            return
+        metrics.increment("llm.tokens", actual_tokens)
+        delta = actual_tokens - estimated_tokens
+        if delta == 0:
+            return
+        self.budget.settle(user, delta)
+
+    def admit(self, messages, lane=BACKGROUND):
+        """Wait until a call with these messages may be issued for the current user; return what settle_call needs."""
+        user, estimated = current_llm_user.get(), estimate_tokens(messages)
+        self.acquire(user, estimated, lane)
+        return user, estimated
+
+    async def aadmit(self, messages, lane=BACKGROUND):
+        """Asynchronous version of admit."""
+        user, estimated = current_llm_user.get(), estimate_tokens(messages)
+        await self.aacquire(user, estimated, lane)
+        return user, estimated
+
+    def try_admit(self, messages, lane=BACKGROUND):
+        """Admit a call only if it may be issued without waiting, e.g. a hedged duplicate request; return None otherwise."""
+        user, estimated = current_llm_user.get(), estimate_tokens(messages)
+        ticket = self._enqueue(user, estimated, lane)
+        try:
+            granted = self._try_grant(ticket, time.monotonic()) == 0
+        finally:
+            self._discard(ticket)
+        if not granted:
+            return None
+        self._record(lane, 0.0)
+        return user, estimated
+
+    async def atry_admit(self, messages, lane=BACKGROUND):
+        """Asynchronous version of try_admit."""
+        return await self._off_loop(self.try_admit, messages, lane)
+
+    def settle_call(self, admission, result):
+        """Settle an admitted call with the usage reported in its result."""
+        user, estimated = admission
+        self.settle(user, estimated, _usage_tokens(result))
+
+    async def asettle_call(self, admission, result):
+        """Asynchronous version of settle_call."""
+        await self._off_loop(self.settle_call, admission, result)
+
+
+def estimate_tokens(messages):
+    """Rough token estimate of a prompt (about four characters per token) plus the expected completion."""
+    characters = sum(len(str(message.content)) for message in messages)
+    return characters // 4 + LLM_EXPECTED_COMPLETION_TOKENS
+
+
+def _usage_tokens(result):
+    """Extract the total tokens reported by the provider, if any."""
+    for generation in result.generations:
+        usage = getattr(generation.message, "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens")
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+# Process-wide limiter shared by every chat model
+llm_rate_limiter = LLMRateLimiter()
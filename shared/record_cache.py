@@ -0,0 +1,201 @@
+"""
+Two-level cache of serialized task and developer records for the agent tools.
+
+Within one agent run the same tasks and developers are looked up again and
+again, and hot records are fetched again by later runs. Lookups first consult a
+memo scoped to the current run, then a process-wide LRU, and only then query the
+database. Entries are invalidated from SQLAlchemy ``after_commit`` events on
+Task, User and Assignment, and expire after a TTL to bound staleness from writes
+made by other processes. Hit ratios are exported through ``shared.metrics``.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import chain
+from weakref import WeakSet
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from shared import metrics
+from shared.models import Assignment, Task, User
+
+# Size and lifetime of the cached records
+RECORD_CACHE_MAX_ENTRIES = int(os.getenv("RECORD_CACHE_MAX_ENTRIES", "4096"))
+RECORD_CACHE_TTL_SECONDS = float(os.getenv("RECORD_CACHE_TTL_SECONDS", "30"))
+
+# Record kinds that depend on each model: a developer record includes its assignment count
+MODEL_KINDS = {Task: "task", User: "developer", Assignment: "developer"}
+
+_CHANGES_KEY = "record_cache_changes"
+_ALL = "*"
+
+
+class RunMemo(dict):
+    """Records memoized for one agent run, tracked by identity while the run is active."""
+
+    __hash__ = object.__hash__
+
+
+_run_memo = contextvars.ContextVar("record_cache_run_memo", default=None)
+
+
+class RecordCache:
+    """
+    Process-wide LRU of serialized records keyed by (kind, id), in front of a per-run memo.
+
+    Args:
+        max_entries: Maximum number of records kept process-wide
+        ttl_seconds: Age after which a record is loaded again
+    """
+
+    def __init__(self, max_entries=RECORD_CACHE_MAX_ENTRIES, ttl_seconds=RECORD_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._memos = WeakSet()
+        # Bumped on every invalidation so a load racing a commit is not stored
+        self._generation = 0
+        self._hits = {"run": 0, "process": 0}
+        self._misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @contextmanager
+    def run_scope(self):
+        """Memoize lookups made within the block, including by tools on worker threads."""
+        memo = RunMemo()
+        with self._lock:
+            self._memos.add(memo)
+        token = _run_memo.set(memo)
+        try:
+            yield memo
+        finally:
+            _run_memo.reset(token)
+
+    def _record(self, level):
+        """Count a lookup at the given level ("run", "process" or None for a miss)."""
+        with self._lock:
+            if level:
+                self._hits[level] += 1
+            else:
+                self._misses += 1
+            lookups = self._hits["run"] + self._hits["process"] + self._misses
+            ratio = (lookups - self._misses) / lookups
+        metrics.increment(f"record_cache.{level}_hits" if level else "record_cache.misses")
+        metrics.set_gauge("record_cache.hit_ratio", round(ratio, 4))
+
+    def get_or_load(self, kind, record_id, loader):
+        """
+        Return the cached record, calling loader() to fetch it on a miss.
+
+        A loader result of None (record not found) is returned but not cached.
+        A copy is returned, so callers may modify it freely.
+        """
+        key = (kind, record_id)
+        memo = _run_memo.get()
+        if memo is not None and key in memo:
+            self._record("run")
+            return dict(memo[key])
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                value = entry[1]
+            else:
+                value = None
+            generation = self._generation
+        if value is not None:
+            self._record("process")
+        else:
+            self._record(None)
+            value = loader()
+            if value is None:
+                return None
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[key] = (now, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            metrics.set_gauge("record_cache.entries", len(self._entries))
+        if memo is not None:
+            memo[key] = value
+        return dict(value)
+
+    def invalidate(self, keys):
+        """Drop (kind, id) keys, or every record of a kind given as (kind, "*")."""
+        if not keys:
+            return
+        kinds = {kind for kind, record_id in keys if record_id == _ALL}
+        with self._lock:
+            self._generation += 1
+            for store in chain([self._entries], list(self._memos)):
+                if kinds:
+                    for key in [key for key in store if key[0] in kinds]:
+                        del store[key]
+                for key in keys:
+                    store.pop(key, None)
+        metrics.increment("record_cache.invalidations", len(keys))
+
+    def clear(self):
+        """Drop every record."""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            for memo in list(self._memos):
+                memo.clear()
+
+
+def _keys_for(obj):
+    """Return the cache keys affected by a change to a Task, User or Assignment."""
+    if isinstance(obj, Task):
+        return {("task", obj.id)}
+    if isinstance(obj, User):
+        return {("developer", obj.id)}
+    if isinstance(obj, Assignment):
+        # A reassigned row changes the counts of both the old and the new developer
+        history = inspect(obj).attrs.user_id.history
+        return {("developer", user_id) for user_id in chain([obj.user_id], history.deleted or ()) if user_id is not None}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flushed_changes(session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        changes |= _keys_for(obj)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_changes(orm_execute_state):
+    # Bulk UPDATE/DELETE statements bypass the identity map, so drop the whole kind
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    # New task and user IDs cannot be cached yet, but inserted assignments change counts
+    if model in MODEL_KINDS and (model is Assignment or not orm_execute_state.is_insert):
+        orm_execute_state.session.info.setdefault(_CHANGES_KEY, set()).add((MODEL_KINDS[model], _ALL))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_changes(session):
+    record_cache.invalidate(session.info.pop(_CHANGES_KEY, None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop(_CHANGES_KEY, None)
+
+
+# Shared by every agent tool in the process
+record_cache = RecordCache()
@@ -0,0 +1,306 @@
+"""
+Resilience layer for LLM calls: per-call deadlines, jittered retries, optional
+hedged attempts and a circuit breaker that fails fast while the provider is unhealthy.
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import ConfigDict
+
+from logger import system_logger
+from shared import metrics
+from shared.rate_limit import BACKGROUND, LLMRateLimiter
+
+# Timeouts, retries, hedging and circuit breaker thresholds for LLM calls, from the environment or defaults
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+LLM_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_MAX_SECONDS", "8"))
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0"))  # 0 disables hedging
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RECOVERY_SECONDS = float(os.getenv("LLM_BREAKER_RECOVERY_SECONDS", "30"))
+
+# HTTP statuses worth retrying: throttling and server-side errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Threads used to enforce deadlines and hedge synchronous calls
+_sync_executor = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-call")
+
+
+class LLMUnavailableError(Exception):
+    """The LLM provider could not produce a response within the retry budget."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open and calls are rejected without reaching the provider."""
+
+
+def is_retryable(error):
+    """Return True for timeouts, connection problems, throttling and 5xx responses."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker.
+
+    Args:
+        failure_threshold: Consecutive failures that open the circuit
+        recovery_seconds: Time the circuit stays open before a trial call is let through
+        name: Name used in logs and metrics
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds=LLM_BREAKER_RECOVERY_SECONDS, name="llm"):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            system_logger.warning(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+            self.state = state
+            metrics.set_gauge(f"{self.name}.breaker_state", state)
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may proceed."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_seconds:
+                    metrics.increment(f"{self.name}.breaker_rejections")
+                    raise CircuitOpenError(f"LLM circuit breaker '{self.name}' is open; the provider is unavailable")
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    metrics.increment(f"{self.name}.breaker_rejections")
+                    raise CircuitOpenError(f"LLM circuit breaker '{self.name}' is probing the provider")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def release(self):
+        """Free the trial slot of a call that ended without an outcome, e.g. because it was cancelled."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+    @property
+    def is_open(self):
+        """True while calls are being rejected (open and not yet due for a trial call)."""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.recovery_seconds
+
+
+def backoff_delay(attempt, base=LLM_RETRY_BACKOFF_SECONDS, cap=LLM_RETRY_BACKOFF_MAX_SECONDS):
+    """Full-jitter exponential backoff for the given retry attempt (1-based)."""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
+
+
+class ResilientChatModel(BaseChatModel):
+    """
+    Chat model wrapper adding deadlines, retries, hedging and a circuit breaker.
+
+    With a limiter, every attempt is a separate request to it: retries wait for
+    their own rate limit tokens before their deadline starts, and a hedged attempt
+    is only sent if the limiter lets it through at once.
+    """
+
+    model: BaseChatModel
+    breaker: CircuitBreaker
+    limiter: Optional[LLMRateLimiter] = None
+    lane: str = BACKGROUND
+    timeout_seconds: float = LLM_TIMEOUT_SECONDS
+    max_retries: int = LLM_MAX_RETRIES
+    backoff_seconds: float = LLM_RETRY_BACKOFF_SECONDS
+    hedge_after_seconds: float = LLM_HEDGE_AFTER_SECONDS
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"resilient-{self.model._llm_type}"
+
+    def bind_tools(self, tools, **kwargs):
+        bound = self.model.bind_tools(tools, **kwargs)
+        return self.bind(**bound.kwargs)
+
+    def _on_error(self, error, attempt):
+        """Record a failed attempt; return True if it should be retried."""
+        retryable = is_retryable(error)
+        if retryable:
+            self.breaker.record_failure()
+            if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+                metrics.increment("llm.timeouts")
+        else:
+            # The provider answered (e.g. a 400), so it is healthy even though the call failed
+            self.breaker.record_success()
+        system_logger.warning(f"LLM call attempt {attempt + 1} failed: {type(error).__name__}: {error}")
+        return retryable and attempt < self.max_retries
+
+    def _admit_hedge(self, messages, admissions):
+        """Return True if a hedged attempt may be sent, adding its admission to those to settle."""
+        if self.limiter is None:
+            return True
+        admission = self.limiter.try_admit(messages, self.lane)
+        if admission is None:
+            return False
+        admissions.append(admission)
+        return True
+
+    async def _aadmit_hedge(self, messages, admissions):
+        if self.limiter is None:
+            return True
+        admission = await self.limiter.atry_admit(messages, self.lane)
+        if admission is None:
+            return False
+        admissions.append(admission)
+        return True
+
+    # Synchronous path: run attempts in worker threads so deadlines can be enforced
+    def _sync_attempt(self, call, messages, admissions):
+        deadline = time.monotonic() + self.timeout_seconds
+        futures = [_sync_executor.submit(call)]
+        if self.hedge_after_seconds and self.hedge_after_seconds < self.timeout_seconds:
+            done, _ = concurrent.futures.wait(futures, timeout=self.hedge_after_seconds)
+            if not done and self._admit_hedge(messages, admissions):
+                metrics.increment("llm.hedged_requests")
+                futures.append(_sync_executor.submit(call))
+        error = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+        if pending:
+            raise TimeoutError(f"LLM call exceeded its {self.timeout_seconds}s deadline")
+        raise error
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        call = lambda: self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            try:
+                admissions = [self.limiter.admit(messages, self.lane)] if self.limiter else []
+                result = self._sync_attempt(call, messages, admissions)
+                self.breaker.record_success()
+                # A hedged duplicate costs about as much as the attempt that won
+                for admission in admissions:
+                    self.limiter.settle_call(admission, result)
+                return result
+            except Exception as error:
+                if not self._on_error(error, attempt):
+                    if is_retryable(error):
+                        raise LLMUnavailableError(f"LLM call failed after {attempt + 1} attempts: {error}") from error
+                    raise
+            except BaseException:
+                # Cancelled or interrupted: the state stays as it is, but a half-open trial must not hold its slot
+                self.breaker.release()
+                raise
+            attempt += 1
+            metrics.increment("llm.retries")
+            time.sleep(backoff_delay(attempt, self.backoff_seconds))
+
+    # Asynchronous path
+    async def _async_attempt(self, call, messages, admissions):
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            if self.hedge_after_seconds and self.hedge_after_seconds < self.timeout_seconds:
+                done, _ = await asyncio.wait(tasks, timeout=self.hedge_after_seconds)
+                if not done and await self._aadmit_hedge(messages, admissions):
+                    metrics.increment("llm.hedged_requests")
+                    tasks.append(asyncio.ensure_future(call()))
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        call = lambda: self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        attempt = 0
+        while True:
+            self.breaker.allow()
+            try:
+                admissions = [await self.limiter.aadmit(messages, self.lane)] if self.limiter else []
+                result = await asyncio.wait_for(self._async_attempt(call, messages, admissions), timeout=self.timeout_seconds)
+                self.breaker.record_success()
+                for admission in admissions:
+                    await self.limiter.asettle_call(admission, result)
+                return result
+            except Exception as error:
+                if not self._on_error(error, attempt):
+                    if is_retryable(error):
+                        raise LLMUnavailableError(f"LLM call failed after {attempt + 1} attempts: {error}") from error
+                    raise
+            except BaseException:
+                # Cancelled or interrupted: the state stays as it is, but a half-open trial must not hold its slot
+                self.breaker.release()
+                raise
+            attempt += 1
+            metrics.increment("llm.retries")
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_seconds))
+
+
+# Process-wide breaker shared by the chat models of a service
+llm_circuit_breaker = CircuitBreaker()
@@ -0,0 +1,167 @@
+"""
+Concurrent tool execution for the ReAct agents.
+
+When the model emits several tool calls in one turn they are run side by side in a
+bounded thread pool, each with its own deadline, and their results are returned in
+the order the calls were made. Results are re-encoded as compact JSON. Per-turn
+wall-clock savings and per-tool result sizes are recorded as metrics.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables.config import get_config_list
+from langgraph.prebuilt import ToolNode
+from langgraph.store.base import BaseStore
+
+from logger import system_logger
+from shared import metrics
+from shared.tool_results import compact_content, estimate_tokens
+
+# Number of tool calls run at once and the time each one is given
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "8"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "15"))
+
+
+class ConcurrentToolNode(ToolNode):
+    """
+    ToolNode that runs the tool calls of a turn concurrently with per-tool timeouts.
+
+    A tool that misses its deadline is answered with an error ToolMessage so the
+    model can react; its worker thread is left to finish in the background. Tools
+    that change data have no deadline: a write abandoned halfway would leave the
+    model retrying something that may still succeed. Calls to the serial tools, such
+    as tools that are not reentrant or that write the same rows, never overlap one
+    another, while the other calls of the turn proceed.
+
+    Args:
+        tools: Tools (or plain functions) available to the agent
+        max_concurrency: Size of the worker pool shared by all turns of this node
+        timeout_seconds: Default deadline for one tool call
+        tool_timeouts: Per-tool deadlines by tool name, overriding the default
+        write_tools: Names of the tools that change data, run without a deadline
+        serial_tools: Names of the tools whose calls must not overlap, with each other included
+    """
+
+    def __init__(self, tools, *, max_concurrency=TOOL_MAX_CONCURRENCY, timeout_seconds=TOOL_TIMEOUT_SECONDS,
+                 tool_timeouts: Optional[Dict[str, float]] = None, write_tools: Iterable[str] = (),
+                 serial_tools: Iterable[str] = (), **kwargs):
+        super().__init__(tools, **kwargs)
+        self.timeout_seconds = timeout_seconds
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self.write_tools = frozenset(write_tools)
+        self.serial_tools = frozenset(serial_tools)
+        self._serial_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="agent-tool"
+        )
+
+    def timeout_for(self, tool_name):
+        """Return the deadline in seconds for the named tool, or None if it has none."""
+        if tool_name in self.write_tools:
+            return None
+        return self.tool_timeouts.get(tool_name, self.timeout_seconds)
+
+    def _timed_out(self, call):
+        timeout = self.timeout_for(call["name"])
+        metrics.increment("tools.timeouts")
+        system_logger.warning(f"Tool '{call['name']}' exceeded its {timeout}s deadline")
+        return ToolMessage(
+            content=f"Error: tool '{call['name']}' timed out after {timeout}s. Try again or continue without it.",
+            name=call["name"],
+            tool_call_id=call["id"],
+            status="error",
+        )
+
+    def _compact(self, call, output):
+        """Re-encode a tool result compactly and record its size in prompt tokens."""
+        if isinstance(output, ToolMessage):
+            output.content = compact_content(output.content)
+            metrics.observe(f"tools.result_tokens.{call['name']}", estimate_tokens(output.content))
+        return output
+
+    def _timed_call(self, durations, index, call, input_type, config):
+        """Run one call on a worker thread, recording how long it took."""
+        start = time.monotonic()
+        try:
+            if call["name"] not in self.serial_tools:
+                return self._compact(call, self._run_one(call, input_type, config))
+            with self._serial_lock:
+                return self._compact(call, self._run_one(call, input_type, config))
+        finally:
+            durations[index] = time.monotonic() - start
+            metrics.observe(f"tools.duration_seconds.{call['name']}", durations[index])
+
+    def _record_turn(self, tool_calls, durations, wall):
+        """Record the wall-clock time of a turn against the time a sequential run would take."""
+        sequential = sum(durations)
+        metrics.increment("tools.calls", len(tool_calls))
+        metrics.observe("tools.turn_wall_seconds", wall)
+        if len(tool_calls) > 1:
+            metrics.observe("tools.turn_saved_seconds", max(0.0, sequential - wall))
+            system_logger.info(
+                f"Ran {len(tool_calls)} tool calls concurrently in {wall:.3f}s "
+                f"(sequential {sequential:.3f}s, saved {max(0.0, sequential - wall):.3f}s)"
+            )
+
+    def _func(self, input, config, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        durations = [0.0] * len(tool_calls)
+        start = time.monotonic()
+        futures = [
+            self._executor.submit(
+                contextvars.copy_context().run, self._timed_call, durations, i, call, input_type, call_config
+            )
+            for i, (call, call_config) in enumerate(zip(tool_calls, config_list))
+        ]
+        outputs = []
+        for i, (call, future) in enumerate(zip(tool_calls, futures)):
+            # Deadlines count from dispatch, so the turn never waits longer than its slowest timeout
+            timeout = self.timeout_for(call["name"])
+            remaining = None if timeout is None else max(0.0, start + timeout - time.monotonic())
+            try:
+                outputs.append(future.result(timeout=remaining))
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                durations[i] = self.timeout_for(call["name"])
+                outputs.append(self._timed_out(call))
+        self._record_turn(tool_calls, durations, time.monotonic() - start)
+        return self._combine_tool_outputs(outputs, input_type)
+
+    async def _arun_with_deadline(self, durations, index, call, input_type, config):
+        tool = self.tools_by_name.get(call["name"])
+        try:
+            if tool is not None and getattr(tool, "func", None) is None and getattr(tool, "coroutine", None):
+                # Native coroutine tools run on the event loop
+                start = time.monotonic()
+                output = await asyncio.wait_for(self._arun_one(call, input_type, config), self.timeout_for(call["name"]))
+                durations[index] = time.monotonic() - start
+                return self._compact(call, output)
+            loop = asyncio.get_running_loop()
+            work = loop.run_in_executor(
+                self._executor, contextvars.copy_context().run,
+                self._timed_call, durations, index, call, input_type, config
+            )
+            return await asyncio.wait_for(work, self.timeout_for(call["name"]))
+        except asyncio.TimeoutError:
+            durations[index] = self.timeout_for(call["name"])
+            return self._timed_out(call)
+
+    async def _afunc(self, input, config, *, store: Optional[BaseStore]):
+        tool_calls, input_type = self._parse_input(input, store)
+        config_list = get_config_list(config, len(tool_calls))
+        durations = [0.0] * len(tool_calls)
+        start = time.monotonic()
+        outputs = await asyncio.gather(*(
+            self._arun_with_deadline(durations, i, call, input_type, call_config)
+            for i, (call, call_config) in enumerate(zip(tool_calls, config_list))
+        ))
+        self._record_turn(tool_calls, durations, time.monotonic() - start)
+        return self._combine_tool_outputs(list(outputs), input_type)
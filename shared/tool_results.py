@@ -0,0 +1,85 @@
+"""
+Shaping of tool results before they enter the agent's prompt: field projection,
+a cap on the number of items with a continuation offset, truncation of long
+text fields and a compact JSON encoding.
+"""
+
+import json
+import os
+
+# Limits on what a tool result sends back to the model
+TOOL_RESULT_MAX_ITEMS = int(os.getenv("TOOL_RESULT_MAX_ITEMS", "20"))
+TOOL_RESULT_MAX_TEXT_CHARS = int(os.getenv("TOOL_RESULT_MAX_TEXT_CHARS", "200"))
+
+
+def truncate_text(text, max_chars=TOOL_RESULT_MAX_TEXT_CHARS):
+    """Shorten text to max_chars, marking how much was cut."""
+    if not isinstance(text, str) or len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars].rstrip()}... [+{len(text) - max_chars} chars]"
+
+
+def project(record, fields=None, truncate_fields=("description",), max_chars=TOOL_RESULT_MAX_TEXT_CHARS):
+    """
+    Keep only the requested fields of a record and truncate its long text fields.
+
+    Args:
+        record: Dictionary to shape
+        fields: Field names to keep, or None to keep every field
+        truncate_fields: Fields whose text is shortened to max_chars
+        max_chars: Maximum characters kept for a truncated field
+
+    Returns:
+        The shaped dictionary
+    """
+    if fields:
+        record = {key: value for key, value in record.items() if key in fields}
+    return {
+        key: truncate_text(value, max_chars) if key in truncate_fields else value
+        for key, value in record.items()
+    }
+
+
+def shape_results(records, total=None, offset=0, fields=None, limit=TOOL_RESULT_MAX_ITEMS, **options):
+    """
+    Project and cap a page of records, reporting how many more are available.
+
+    Args:
+        records: Records of the page, starting at offset; only the first `limit` are kept
+        total: Total number of matching records, defaults to offset + len(records)
+        offset: Position of the first record in the full result
+        fields: Field names to keep, or None to keep every field
+        limit: Maximum number of records returned
+        **options: Passed on to project()
+
+    Returns:
+        Dictionary with the results, the total, the number not shown and, when
+        there are more, the offset to pass to fetch the next page
+    """
+    total = offset + len(records) if total is None else total
+    page = [project(record, fields, **options) for record in records[:limit]]
+    more = max(0, total - offset - len(page))
+    shaped = {"results": page, "total": total, "more": more}
+    if more:
+        shaped["next_offset"] = offset + len(page)
+    return shaped
+
+
+def compact_json(value):
+    """Encode a tool result as JSON without optional whitespace."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def compact_content(content):
+    """Re-encode JSON message content compactly; other content is returned unchanged."""
+    if not isinstance(content, str) or content[:1] not in ("{", "["):
+        return content
+    try:
+        return compact_json(json.loads(content))
+    except ValueError:
+        return content
+
+
+def estimate_tokens(text):
+    """Rough token count of a piece of text (about four characters per token)."""
+    return len(str(text)) // 4
@@ -0,0 +1,107 @@
+"""
+Read-through cache of the users table for per-request authentication.
+
+Authenticated requests resolve their user by username. The directory serves
+those lookups from memory. It loads a user from the database on a miss or once
+its entry is older than the TTL. ``shared.models`` writes changes through on
+create, update and delete, and listeners such as the verified-token cache are
+told about every change.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from shared import metrics
+
+# Lifetime and size of the cached user records
+USER_DIRECTORY_TTL_SECONDS = float(os.getenv("USER_DIRECTORY_TTL_SECONDS", "300"))
+USER_DIRECTORY_MAX_ENTRIES = int(os.getenv("USER_DIRECTORY_MAX_ENTRIES", "10000"))
+
+USER_FIELDS = ("id", "username", "email", "full_name", "hashed_password", "disabled", "role")
+
+
+def user_record(user):
+    """Return the cached fields of a User row as a dictionary."""
+    return {field: getattr(user, field) for field in USER_FIELDS}
+
+
+class UserDirectory:
+    """
+    Bounded, TTL-expiring cache of user records keyed by username.
+
+    Args:
+        ttl_seconds: Age after which a record is reloaded from the database
+        max_entries: Maximum number of users kept
+    """
+
+    def __init__(self, ttl_seconds=USER_DIRECTORY_TTL_SECONDS, max_entries=USER_DIRECTORY_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def on_change(self, callback):
+        """Call callback(username) whenever a user is updated or deleted."""
+        self._listeners.append(callback)
+
+    def _load(self, username):
+        from shared.models import SessionLocal, get_user_by_username
+
+        db = SessionLocal()
+        try:
+            user = get_user_by_username(db, username)
+            return user_record(user) if user else None
+        finally:
+            db.close()
+
+    def get(self, username):
+        """Return the record of a user, loading it from the database when needed, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(username)
+                metrics.increment("user_directory.hits")
+                return dict(entry[1])
+        metrics.increment("user_directory.misses")
+        record = self._load(username)
+        if record is not None:
+            self._store(record, now)
+        return dict(record) if record else None
+
+    def _store(self, record, loaded_at):
+        with self._lock:
+            self._entries[record["username"]] = (loaded_at, record)
+            self._entries.move_to_end(record["username"])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put(self, user):
+        """Write a created or updated User row through to the directory."""
+        record = user_record(user)
+        self._store(record, time.monotonic())
+        self._notify(record["username"])
+
+    def invalidate(self, username):
+        """Drop a user, for example after it was deleted."""
+        with self._lock:
+            self._entries.pop(username, None)
+        self._notify(username)
+
+    def _notify(self, username):
+        for callback in self._listeners:
+            callback(username)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by the authentication of every request in the process
+user_directory = UserDirectory()
@@ -0,0 +1,352 @@
+"""
+Local vector index for semantic task search, with no network service.
+
+Task text is embedded by a signed hashing vectorizer (word unigrams, character
+trigrams and a few domain synonym groups) with sublinear term frequency. Vectors
+live in a memory-mapped float32 matrix, with a parallel ID map, and are updated
+in place as tasks are written. A query is weighted by inverse document frequency
+and scored against every task with one matrix-vector product. IDF is applied to
+the query only, so stored vectors never need rewriting as document frequencies drift.
+
+Several worker processes may share one index directory. Writes hold an exclusive
+lock on its lock file and searches a shared one; a process reloads the index when
+another process has written it since, as told by the generation in meta.json.
+meta.json also lists the rows each recent generation changed, so a process that
+has kept up re-reads only those rows of the ID map.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, so run a single worker there
+    fcntl = None
+
+import numpy as np
+from sqlalchemy import select
+
+from logger import db_logger
+from shared import metrics
+from shared.models import SessionLocal, Task
+
+# Index directory, vector size and the lowest score a ranked result may have
+VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", "clara_pm_vectors")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "256"))
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.1"))
+# Rows changed by recent writes that meta.json lists, so that other processes reload only those
+VECTOR_CHANGE_LOG_ROWS = int(os.getenv("VECTOR_CHANGE_LOG_ROWS", "10000"))
+
+INITIAL_CAPACITY = 1024
+TRIGRAM_WEIGHT = 0.5
+SYNONYM_WEIGHT = 2.0
+
+# Words that mean the same thing in task descriptions share one extra feature
+SYNONYM_GROUPS = [
+    {"auth", "authentication", "authenticate", "login", "logon", "signin", "sign", "password", "sso", "oauth", "jwt"},
+    {"ui", "frontend", "interface", "screen", "page", "view", "layout"},
+    {"api", "endpoint", "backend", "route", "service"},
+    {"db", "database", "sql", "schema", "table", "migration"},
+    {"bug", "fix", "defect", "issue", "error", "crash"},
+    {"test", "tests", "testing", "qa", "verify"},
+    {"deploy", "deployment", "release", "ship", "launch"},
+    {"docs", "documentation", "readme", "guide"},
+    {"payment", "payments", "billing", "invoice", "invoices", "checkout"},
+]
+_SYNONYMS = {word: f"syn:{i}" for i, group in enumerate(SYNONYM_GROUPS) for word in group}
+
+
+def features(text):
+    """Return the weighted features of a piece of text."""
+    counts = Counter()
+    for word in re.findall(r"\w+", (text or "").lower()):
+        counts[f"w:{word}"] += 1.0
+        if word in _SYNONYMS:
+            counts[_SYNONYMS[word]] += SYNONYM_WEIGHT
+        padded = f"<{word}>"
+        for i in range(len(padded) - 2):
+            counts[f"c:{padded[i:i + 3]}"] += TRIGRAM_WEIGHT
+    return counts
+
+
+def vectorize(text, dim=VECTOR_DIM):
+    """Embed text as an L2-normalized float32 vector of the given dimension."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature, count in features(text).items():
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        weight = 1.0 + np.log(count) if count >= 1 else count
+        # The top bit picks the sign so that colliding features tend to cancel out
+        vector[h % dim] += weight if h >> 63 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def task_text(title, description):
+    return f"{title or ''} {title or ''} {description or ''}"
+
+
+class VectorIndex:
+    """
+    Memory-mapped float32 matrix of task vectors with a task ID map.
+
+    Args:
+        path: Directory holding the vector matrix, the ID map and the document frequencies
+        dim: Vector dimension
+    """
+
+    def __init__(self, path=VECTOR_INDEX_PATH, dim=VECTOR_DIM):
+        self.path = path
+        self.dim = dim
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(self._file("lock"), "a+")
+        self.generation = -1
+        # Rows written since meta.json was last replaced
+        self._dirty = set()
+        with self._locked(exclusive=True):
+            pass
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, task_id):
+        return task_id in self._rows
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """Hold the index against other threads and processes, with the state written by other processes loaded."""
+        with self._lock:
+            if fcntl:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._reload(exclusive)
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _reload(self, exclusive):
+        """Load the index from disk if another process wrote it since this one last read or wrote it."""
+        meta = self._read_meta()
+        if meta and meta.get("dim") != self.dim:
+            if not exclusive:
+                raise ValueError(f"Vector index at {self.path} was rebuilt with dimension {meta.get('dim')}")
+            db_logger.warning(f"Vector index at {self.path} has dimension {meta.get('dim')}, rebuilding with {self.dim}")
+            meta = None
+        if meta is None:
+            # Only reached with the exclusive lock held: searches run after the index was opened
+            self.capacity, self.size, self.generation = INITIAL_CAPACITY, 0, 0
+            self._open(create=True)
+            self.df = np.zeros(self.dim, dtype=np.float64)
+            self._rows, self._free, self._changes = {}, set(), []
+            self._known_ids = np.zeros(self.capacity, dtype=np.int64)
+            self._write()
+            return
+        generation = meta.get("generation", 0)
+        if generation == self.generation:
+            return
+        changes = meta.get("changes", [])
+        # The rows changed since this process last read the index, if the log reaches back that far
+        missed = [rows for logged, rows in changes if logged > self.generation]
+        caught_up = self.generation >= 0 and len(missed) == generation - self.generation
+        # Mapped pages are shared with the writer, so the files are mapped again only once they have grown
+        if meta["capacity"] != getattr(self, "capacity", None):
+            self.capacity = meta["capacity"]
+            self._open()
+        self.size, self.generation, self._changes = meta["size"], generation, changes
+        df_path = self._file("df.npy")
+        self.df = np.load(df_path) if os.path.exists(df_path) else np.zeros(self.dim, dtype=np.float64)
+        if not caught_up:
+            ids = np.array(self.ids)
+            used = np.flatnonzero(ids[:self.size])
+            self._rows = dict(zip(ids[used].tolist(), used.tolist()))
+            self._free = set(np.flatnonzero(ids[:self.size] == 0).tolist())
+            self._known_ids = ids
+            return
+        self._fit_known_ids()
+        for row in set().union(*missed):
+            previous, task_id = int(self._known_ids[row]), int(self.ids[row])
+            if previous and self._rows.get(previous) == row:
+                del self._rows[previous]
+            self._known_ids[row] = task_id
+            if task_id:
+                self._rows[task_id] = row
+                self._free.discard(row)
+            elif row < self.size:
+                self._free.add(row)
+
+    def _fit_known_ids(self):
+        """Resize the copy of the ID map to the capacity of the files."""
+        if len(self._known_ids) != self.capacity:
+            known = np.zeros(self.capacity, dtype=np.int64)
+            known[:len(self._known_ids)] = self._known_ids
+            self._known_ids = known
+
+    def _open(self, create=False):
+        mode = "w+" if create else "r+"
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode=mode, shape=(self.capacity, self.dim))
+        # Task IDs start at 1, so 0 marks a free row
+        self.ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode=mode, shape=(self.capacity,))
+
+    def _grow(self):
+        """Double the capacity of the memory-mapped files."""
+        self._write()
+        capacity = self.capacity * 2
+        del self.vectors, self.ids
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), ("ids.i64", 8)):
+            with open(self._file(name), "r+b") as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self._open()
+        self._fit_known_ids()
+
+    def _store(self, task_id, vector):
+        row = self._rows.get(task_id)
+        if row is not None:
+            self.df[np.nonzero(self.vectors[row])[0]] -= 1
+        elif self._free:
+            row = self._free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.size
+            self.size += 1
+        self.vectors[row] = vector
+        self.ids[row] = task_id
+        self._rows[task_id] = row
+        self._dirty.add(row)
+        self.df[np.nonzero(vector)[0]] += 1
+
+    def upsert(self, tasks):
+        """Add or replace tasks given as (task_id, title, description) tuples."""
+        # Vectors are computed before taking the lock, so other processes wait only for the writes
+        vectors = [(task_id, vectorize(task_text(title, description), self.dim)) for task_id, title, description in tasks]
+        with self._locked(exclusive=True):
+            for task_id, vector in vectors:
+                self._store(task_id, vector)
+            self._write()
+
+    def remove(self, task_ids):
+        """Drop tasks from the index, freeing their rows for reuse."""
+        with self._locked(exclusive=True):
+            for task_id in task_ids:
+                row = self._rows.pop(task_id, None)
+                if row is None:
+                    continue
+                self.df[np.nonzero(self.vectors[row])[0]] -= 1
+                self.vectors[row] = 0
+                self.ids[row] = 0
+                self._free.add(row)
+                self._dirty.add(row)
+            self._write()
+
+    def search(self, query, k=20, offset=0, min_score=VECTOR_MIN_SCORE):
+        """
+        Rank tasks by cosine similarity to the query.
+
+        Returns:
+            Tuple of the number of tasks scoring at least min_score and the
+            (task_id, score) pairs of ranks offset to offset + k
+        """
+        start = time.perf_counter()
+        with self._locked():
+            if not self._rows:
+                return 0, []
+            n_docs = len(self._rows)
+            idf = (np.log((1.0 + n_docs) / (1.0 + self.df)) + 1.0).astype(np.float32)
+            weighted = vectorize(query, self.dim) * idf
+            norm = np.linalg.norm(weighted)
+            if not norm:
+                return 0, []
+            scores = self.vectors[:self.size] @ (weighted / norm)
+            matching = np.flatnonzero(scores >= min_score)
+            total = len(matching)
+            wanted = min(total, offset + k)
+            if wanted <= offset:
+                return total, []
+            top = matching[np.argpartition(-scores[matching], wanted - 1)[:wanted]]
+            top = top[np.argsort(-scores[top], kind="stable")][offset:wanted]
+            results = [(int(self.ids[row]), float(scores[row])) for row in top]
+        metrics.observe("vector_index.search_seconds", time.perf_counter() - start)
+        return total, results
+
+    def flush(self):
+        """Write the matrix, ID map and document frequencies to disk."""
+        with self._locked(exclusive=True):
+            self._write()
+
+    def _write(self):
+        # Called with the exclusive lock held; meta.json is replaced last, so readers never see a partial write
+        self.vectors.flush()
+        self.ids.flush()
+        rows = sorted(self._dirty)
+        self._dirty.clear()
+        self._known_ids[rows] = self.ids[rows]
+        self.generation += 1
+        # Older entries are dropped once the log is too long; processes further behind reload the whole ID map
+        self._changes = self._changes + [[self.generation, rows]]
+        logged = sum(len(entry[1]) for entry in self._changes)
+        while self._changes and logged > VECTOR_CHANGE_LOG_ROWS:
+            logged -= len(self._changes.pop(0)[1])
+        with open(self._file("df.npy.tmp"), "wb") as f:
+            np.save(f, self.df)
+        os.replace(self._file("df.npy.tmp"), self._file("df.npy"))
+        with open(self._file("meta.json.tmp"), "w") as f:
+            json.dump({
+                "dim": self.dim, "capacity": self.capacity, "size": self.size,
+                "generation": self.generation, "changes": self._changes,
+            }, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    def sync(self, db, batch_size=5000):
+        """Reconcile the index with the tasks table, adding missing tasks and dropping deleted ones."""
+        start = time.perf_counter()
+        task_ids = set()
+        missing = []
+        rows = db.execute(select(Task.id, Task.title, Task.description).execution_options(yield_per=batch_size))
+        for task_id, title, description in rows:
+            task_ids.add(task_id)
+            if task_id not in self._rows:
+                missing.append((task_id, title, description))
+                if len(missing) >= batch_size:
+                    self.upsert(missing)
+                    missing = []
+        self.upsert(missing)
+        stale = [task_id for task_id in list(self._rows) if task_id not in task_ids]
+        self.remove(stale)
+        db_logger.info(f"Vector index synced with {len(self)} tasks in {time.perf_counter() - start:.3f}s ({len(stale)} stale)")
+
+
+_load_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def _load_vector_index():
+    index = VectorIndex()
+    db = SessionLocal()
+    try:
+        index.sync(db)
+    finally:
+        db.close()
+    return index
+
+def get_vector_index():
+    """Return the process-wide vector index, opening and syncing it on first use."""
+    with _load_lock:
+        return _load_vector_index()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Unit tests for intelligent batch assignment
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+import time
+from unittest import mock
+
+# Add the parent directory to the path so we can import the assignment_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from assignment_agent import batch
+
+
+def fake_analysis(task_id, developer_id, config=None):
+    """Developer 2 is the best fit for every task."""
+    return {
+        "task_id": task_id,
+        "developer_id": developer_id,
+        "recommendation": "Good match",
+        "score": 0.9 if developer_id == 2 else 0.3,
+        "workload": 0.1
+    }
+
+
+class TestIntelligentBatch(unittest.TestCase):
+    """Test cases for the intelligent batch runner"""
+
+    def run_batch(self, process, analysis=fake_analysis, **kwargs):
+        async def collect():
+            return [item async for item in batch.run_intelligent_batch(list(range(1, 11)), [1, 2, 3], **kwargs)]
+
+        with mock.patch.object(batch, "analyze_task_assignment_fit", analysis), \
+                mock.patch.object(batch, "process_task_assignment", process):
+            return asyncio.run(collect())
+
+    def test_prescores_and_respects_concurrency(self):
+        """Test that each task goes to the best tree candidate and the cap holds"""
+        in_flight = {"now": 0, "max": 0}
+
+        async def process(task_id, developer_id, analysis=None):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            return {"task_id": task_id, "developer_id": developer_id, "agent_response": "ok"}
+
+        results = self.run_batch(process, concurrency=3, rate_limit_per_minute=0)
+
+        self.assertEqual(len(results), 11)
+        self.assertTrue(all(r["developer_id"] == 2 for r in results[:-1]))
+        self.assertLessEqual(in_flight["max"], 3)
+        summary = results[-1]["summary"]
+        self.assertEqual(summary["completed"], 10)
+        self.assertEqual(summary["failed"], 0)
+        self.assertGreater(summary["tasks_per_minute"], 0)
+
+    def test_counts_failures(self):
+        """Test that errors and exceptions are reported as failures"""
+        async def process(task_id, developer_id, analysis=None):
+            if task_id % 2:
+                raise RuntimeError("provider unavailable")
+            return {"task_id": task_id, "developer_id": developer_id, "agent_response": "ok"}
+
+        results = self.run_batch(process, concurrency=4, rate_limit_per_minute=0)
+
+        self.assertEqual(results[-1]["summary"]["failed"], 5)
+        self.assertEqual(sum(1 for r in results[:-1] if "error" in r), 5)
+
+    def test_tasks_without_candidates_are_reported(self):
+        """Test that a task no developer could be analyzed for is streamed as a failure"""
+        def analysis(task_id, developer_id, config=None):
+            return {"error": "Task not found"} if task_id == 3 else fake_analysis(task_id, developer_id)
+
+        async def process(task_id, developer_id, analysis=None):
+            return {"task_id": task_id, "developer_id": developer_id, "agent_response": "ok"}
+
+        results = self.run_batch(process, analysis=analysis, concurrency=4, rate_limit_per_minute=0)
+
+        (missing,) = [r for r in results[:-1] if "error" in r]
+        self.assertEqual((missing["task_id"], missing["developer_id"]), (3, None))
+        self.assertEqual(results[-1]["summary"]["completed"], 10)
+
+    def test_prescoring_does_not_block_the_event_loop(self):
+        """Test that the behavior tree runs on worker threads while the loop keeps serving"""
+        def slow_analysis(task_id, developer_id, config=None):
+            time.sleep(0.05)
+            return fake_analysis(task_id, developer_id)
+
+        async def process(task_id, developer_id, analysis=None):
+            return {"task_id": task_id, "developer_id": developer_id, "agent_response": "ok"}
+
+        async def collect():
+            ticks = []
+
+            async def heartbeat():
+                while True:
+                    ticks.append(time.monotonic())
+                    await asyncio.sleep(0.01)
+
+            beat = asyncio.create_task(heartbeat())
+            results = [item async for item in batch.run_intelligent_batch([1, 2, 3], [1, 2, 3], 3, 0)]
+            beat.cancel()
+            return results, max(b - a for a, b in zip(ticks, ticks[1:]))
+
+        with mock.patch.object(batch, "analyze_task_assignment_fit", slow_analysis), \
+                mock.patch.object(batch, "process_task_assignment", process):
+            results, longest_gap = asyncio.run(collect())
+        self.assertEqual(len(results), 4)
+        self.assertLess(longest_gap, 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the intake agent's bulk task tools
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+from datetime import datetime
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from shared.dedup import DuplicateIndex
+from shared.vector_index import VectorIndex
+from shared.models import Base, Task
+from intake_agent import langchain_service
+
+
+class TestBulkTaskTools(unittest.TestCase):
+    """Test cases for get_tasks_by_id_list, update_tasks and delete_tasks"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        for i in range(1, 4):
+            db.add(Task(id=i, title=f"Task {i}", description="", priority="low", role_required="dev", created_by="test"))
+        db.commit()
+        db.close()
+        vector_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(vector_dir.cleanup)
+        self.vectors = VectorIndex(path=vector_dir.name)
+        for name, value in (("SessionLocal", self.Session), ("get_task_index", DuplicateIndex), ("get_vector_index", lambda: self.vectors)):
+            patcher = mock.patch.object(langchain_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_get_tasks_by_id_list(self):
+        """Test that several tasks are returned in one call"""
+        tasks = langchain_service.get_tasks_by_id_list([3, 1, 99])
+        self.assertEqual([task["id"] for task in tasks], [1, 3])
+        self.assertEqual(tasks[0]["title"], "Task 1")
+
+    def test_update_tasks_applies_partial_patches(self):
+        """Test that only the given fields change and missing IDs are reported"""
+        result = langchain_service.update_tasks([
+            {"id": 1, "priority": "high"},
+            {"id": 2, "deadline": "2026-01-31", "role_required": "qa"},
+            {"id": 42, "priority": "high"},
+        ])
+        self.assertEqual(result, {"updated": [1, 2], "not_found": [42]})
+
+        db = self.Session()
+        first, second = db.get(Task, 1), db.get(Task, 2)
+        self.assertEqual((first.priority, first.title), ("high", "Task 1"))
+        self.assertEqual((second.role_required, second.deadline), ("qa", datetime(2026, 1, 31)))
+        db.close()
+
+    def test_update_tasks_rejects_invalid_batch(self):
+        """Test that one invalid patch leaves every task untouched"""
+        result = langchain_service.update_tasks([
+            {"id": 1, "priority": "high"},
+            {"id": 2, "status": "done"},
+            {"priority": "low"},
+        ])
+        self.assertIn("error", result)
+        self.assertEqual(len(result["details"]), 2)
+
+        db = self.Session()
+        self.assertEqual(db.get(Task, 1).priority, "low")
+        db.close()
+
+    def test_update_tasks_validates_like_save(self):
+        """Test that malformed patches are reported instead of raising, with the checks of a new task"""
+        result = langchain_service.update_tasks([
+            5,
+            {"id": 1, "deadline": 20250101},
+            {"id": "two", "priority": "high"},
+            {"id": 3, "title": None},
+            {"id": 3, "project_id": "x"},
+        ])
+        self.assertEqual(result["error"], "Invalid updates, nothing was changed")
+        self.assertEqual(len(result["details"]), 5)
+        self.assertIn("expected an object", result["details"][0])
+        self.assertIn("Invalid deadline format", result["details"][1])
+
+        self.assertEqual(langchain_service.update_tasks([{"id": "2", "project_id": "7"}]), {"updated": [2], "not_found": []})
+        db = self.Session()
+        self.assertEqual(db.get(Task, 2).project_id, 7)
+        db.close()
+
+    def test_delete_tasks(self):
+        """Test that several tasks are deleted in one call"""
+        result = langchain_service.delete_tasks([1, 3, 7])
+        self.assertEqual(result, {"deleted": [1, 3], "not_found": [7]})
+
+        db = self.Session()
+        self.assertEqual([task.id for task in db.query(Task).all()], [2])
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
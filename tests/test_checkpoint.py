@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the SQLite checkpointer
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+import time
+from typing import Annotated, TypedDict
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langgraph.graph import StateGraph
+from langgraph.graph.message import add_messages
+from shared.checkpoint import SQLiteCheckpointSaver
+
+
+class ChatState(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def build_graph(checkpointer):
+    """Build a one-node graph that echoes the last message."""
+    builder = StateGraph(ChatState)
+    builder.add_node("echo", lambda state: {"messages": [("ai", "echo: " + state["messages"][-1].content)]})
+    builder.set_entry_point("echo")
+    builder.set_finish_point("echo")
+    return builder.compile(checkpointer=checkpointer)
+
+
+class TestSQLiteCheckpointSaver(unittest.TestCase):
+    """Test cases for the SQLite checkpointer"""
+
+    def setUp(self):
+        """Create a temporary database file"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "checkpoints.db")
+
+    def tearDown(self):
+        """Remove the temporary database file"""
+        shutil.rmtree(self.tmp_dir)
+
+    def test_state_survives_restart(self):
+        """Test that a new saver on the same file sees previous conversations"""
+        saver = SQLiteCheckpointSaver(self.path, compact_interval_seconds=0)
+        config = {"configurable": {"thread_id": "admin_abc"}}
+        build_graph(saver).invoke({"messages": [("user", "hello")]}, config)
+        saver.close()
+
+        saver = SQLiteCheckpointSaver(self.path, compact_interval_seconds=0)
+        state = build_graph(saver).get_state(config)
+        self.assertEqual([m.content for m in state.values["messages"]], ["hello", "echo: hello"])
+        saver.close()
+
+    def test_prunes_to_max_checkpoints(self):
+        """Test that only the newest checkpoints of a thread are kept"""
+        saver = SQLiteCheckpointSaver(self.path, max_checkpoints_per_thread=3, compact_interval_seconds=0)
+        graph = build_graph(saver)
+        config = {"configurable": {"thread_id": "t1"}}
+        for i in range(10):
+            graph.invoke({"messages": [("user", f"message {i}" * 100)]}, config)
+
+        checkpoints = list(saver.list(config))
+        self.assertEqual(len(checkpoints), 3)
+        # The latest state is intact even though older checkpoints were pruned
+        self.assertEqual(len(graph.get_state(config).values["messages"]), 20)
+        saver.close()
+
+    def test_expires_idle_threads(self):
+        """Test that threads idle for longer than the TTL are deleted"""
+        saver = SQLiteCheckpointSaver(self.path, thread_ttl_seconds=60, compact_interval_seconds=0)
+        graph = build_graph(saver)
+        graph.invoke({"messages": [("user", "old")]}, {"configurable": {"thread_id": "old"}})
+        graph.invoke({"messages": [("user", "new")]}, {"configurable": {"thread_id": "new"}})
+        saver._conn.execute("UPDATE threads SET last_access = ? WHERE thread_id = 'old'", (time.time() - 120,))
+
+        self.assertEqual(saver.expire_idle_threads(), 1)
+        self.assertIsNone(saver.get_tuple({"configurable": {"thread_id": "old"}}))
+        self.assertIsNotNone(saver.get_tuple({"configurable": {"thread_id": "new"}}))
+        saver.close()
+
+    def test_delete_thread(self):
+        """Test that deleting a thread removes all of its checkpoints"""
+        saver = SQLiteCheckpointSaver(self.path, compact_interval_seconds=0)
+        config = {"configurable": {"thread_id": "t1"}}
+        build_graph(saver).invoke({"messages": [("user", "hello")]}, config)
+        saver.delete_thread("t1")
+        self.assertEqual(list(saver.list(config)), [])
+        saver.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
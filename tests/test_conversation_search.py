@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Unit tests for full-text search across a user's conversation history
+"""
+
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import models
+from shared.models import Base, User, ConversationSession, Message
+from intake_agent import conversation_store as conversation_store_module
+from intake_agent.conversation_store import ConversationStore, search_expression
+
+
+def exchange(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+class TestConversationSearch(unittest.TestCase):
+    """Test cases for the message search index and its ranking, scoping and pagination"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add_all([User(username=name, email=f"{name}@example.com") for name in ("gina", "hank")])
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = ConversationStore(flush_seconds=60)
+
+    def indexed(self):
+        db = self.Session()
+        try:
+            return db.execute(text("SELECT count(*) FROM messages_fts")).scalar()
+        finally:
+            db.close()
+
+    def test_search_is_ranked_and_scoped_to_the_user(self):
+        """Test that results are the user's own matches, best first, with highlighted snippets"""
+        self.store.save("gina", "s1", exchange("Plan the launch of the mobile app", "Sure"))
+        self.store.save("gina", "s2", exchange("Launch checklist: launch review, launch date", "Noted"))
+        self.store.save("hank", "s3", exchange("Launching the website", "OK"))
+        self.store.flush()
+
+        results, next_offset = self.store.search("gina", "launches")
+        self.assertEqual([r["session_id"] for r in results], ["s2", "s1"])
+        self.assertIsNone(next_offset)
+        self.assertIn("[Launch]", results[0]["snippet"])
+        self.assertEqual((results[1]["type"], results[1]["title"]), ("user", "Plan the launch of the mobile ..."))
+        self.assertEqual(self.store.search("hank", "mobile")[0], [])
+
+    def test_index_follows_writes(self):
+        """Test that cleared and deleted sessions leave the index and that unwritten deletions are hidden"""
+        self.store.save("gina", "s1", exchange("Budget review", "Done"))
+        self.store.save("gina", "s2", exchange("Budget forecast", "Done"))
+        self.store.flush()
+        self.assertEqual(self.indexed(), 4)
+
+        self.store.save("gina", "s1", exchange("Hiring plan", "Done"))
+        self.store.delete("gina", "s2")
+        self.assertEqual(self.store.search("gina", "budget")[0][0]["session_id"], "s1")  # Only s1 is not yet written
+        self.store.flush()
+        self.assertEqual(self.store.search("gina", "budget")[0], [])
+        self.assertEqual(self.store.search("gina", "hiring")[0][0]["session_id"], "s1")
+        self.assertEqual(self.indexed(), 2)
+
+    def test_pagination(self):
+        """Test that pages follow next_offset until the matches run out"""
+        for i in range(5):
+            self.store.save("gina", f"s{i}", exchange(f"Deadline number {i}", "OK"))
+        self.store.flush()
+        first, next_offset = self.store.search("gina", "deadline", limit=3)
+        second, last = self.store.search("gina", "deadline", limit=3, offset=next_offset)
+        self.assertEqual(len({r["session_id"] for r in first + second}), 5)
+        self.assertIsNone(last)
+
+    def test_existing_messages_are_indexed(self):
+        """Test that creating the index fills it from messages stored before it existed"""
+        db = self.Session()
+        # A database from before the index
+        for trigger in ("insert", "update", "delete", "session_delete"):
+            db.execute(text(f"DROP TRIGGER messages_fts_{trigger}"))
+        db.execute(text("DROP TABLE messages_fts"))
+        db.add(ConversationSession(session_id="s1", user_id=1))
+        db.add(Message(session_id="s1", type="user", content="Old roadmap notes"))
+        db.commit()
+        Base.metadata.create_all(bind=db.get_bind())
+        db.close()
+        self.assertEqual(self.store.search("gina", "roadmap")[0][0]["session_id"], "s1")
+
+    def test_query_words_are_quoted(self):
+        """Test that FTS5 syntax in a query is searched as plain words"""
+        self.assertEqual(search_expression('launch OR "x" NEAR(a'), '"launch" "OR" "x" "NEAR" "a"')
+        self.assertIsNone(search_expression("?!"))
+        with mock.patch.object(conversation_store_module, "CONVERSATION_SEARCH_CANDIDATES", 1):
+            self.store.save("gina", "s1", exchange("AND OR NOT", "OK"))
+            self.store.flush()
+            self.assertEqual(len(self.store.search("gina", "and or")[0]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the write-behind conversation store of the intake API
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics, models
+from shared.models import Base, User, ConversationSession, Message
+from intake_agent.conversation_store import ConversationStore, SessionSummary, encode_cursor, decode_cursor, message_bytes
+
+
+def exchange(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+class TestConversationStore(unittest.TestCase):
+    """Test cases for batching writes and rehydrating sessions"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.commits = 0
+
+        def count(conn):
+            self.commits += 1
+
+        event.listen(engine, "commit", count)
+        db = self.Session()
+        db.add_all([User(username=name, email=f"{name}@example.com") for name in ("gina", "hank")])
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = ConversationStore(flush_seconds=60)
+        self.commits = 0
+
+    def count(self, model):
+        db = self.Session()
+        try:
+            return db.query(func.count()).select_from(model).scalar()
+        finally:
+            db.close()
+
+    def test_writes_are_batched(self):
+        """Test that nothing is written until the flush, which commits everything at once"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        self.store.append("gina", "s1", *exchange("Add a QA task", "Done"))
+        self.store.save("hank", "s2", exchange("Hello", "Hi"))
+        self.assertEqual((self.count(Message), self.commits), (0, 0))
+
+        self.assertEqual(self.store.flush(), 11)
+        self.assertEqual(self.commits, 1)
+        self.assertEqual((self.count(ConversationSession), self.count(Message)), (2, 6))
+        db = self.Session()
+        self.assertEqual([m.type for m in db.query(Message).filter(Message.session_id == "s1").order_by(Message.id)],
+                         ["user", "ai", "user", "ai"])
+        db.close()
+
+    def test_sessions_rehydrate_lazily(self):
+        """Test that a new process loads sessions from the database on first access only"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        self.store.save("gina", "s2", exchange("Hello", "Hi"))
+        self.store.flush()
+
+        restarted = ConversationStore(flush_seconds=60)
+        self.assertIsNone(restarted.get("hank", "s1"))
+        self.assertEqual(restarted.get("gina", "s1"), exchange("Plan the launch", "Sure"))
+        self.assertEqual(len(restarted.get("gina", "s2")), 2)
+        with mock.patch.object(models, "SessionLocal", side_effect=AssertionError("loaded again")):
+            self.assertEqual(len(restarted.get("gina", "s2")), 2)
+
+    def test_replace_and_delete(self):
+        """Test that a replaced history and a deleted session are written, and deletions never come back"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        self.store.flush()
+        self.store.save("gina", "s1", exchange("Start over", "OK"))
+        self.store.flush()
+        self.assertEqual(ConversationStore().get("gina", "s1"), exchange("Start over", "OK"))
+
+        self.assertTrue(self.store.delete("gina", "s1"))
+        self.assertFalse(self.store.delete("gina", "s1"))
+        self.assertIsNone(self.store.get("gina", "s1"))
+        self.store.flush()
+        self.assertEqual((self.count(ConversationSession), self.count(Message)), (0, 0))
+
+    def test_failed_flush_is_retried(self):
+        """Test that changes survive a failed write and keep their order"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        with mock.patch.object(self.store, "_write", side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                self.store.flush()
+        self.store.append("gina", "s1", *exchange("Add a QA task", "Done"))
+        self.assertEqual(self.store.flush(), 7)
+        self.assertEqual(len(ConversationStore().get("gina", "s1")), 4)
+
+    def test_sessions_of_other_users_are_never_overwritten(self):
+        """Test that saving under another user's session ID stores nothing, before or after it is written"""
+        self.store.save("gina", "s1", exchange("hi", "yo"))
+        self.store.flush()
+        restarted = ConversationStore(flush_seconds=60)
+        self.assertFalse(restarted.save("hank", "s1", exchange("x", "y")))
+        self.assertEqual(restarted.flush(), 0)
+
+        # A session created by another user between save() and the write is left alone
+        with mock.patch.object(ConversationStore, "_owner", return_value=None):
+            self.assertTrue(restarted.save("hank", "s1", exchange("x", "y")))
+        self.store.save("hank", "s2", exchange("Hello", "Hi"))
+        restarted.flush()
+        self.store.flush()
+        self.assertEqual(ConversationStore().get("gina", "s1"), exchange("hi", "yo"))
+        self.assertEqual(len(ConversationStore().get("hank", "s2")), 2)
+
+    def test_failing_sessions_do_not_block_the_others(self):
+        """Test that a session whose writes keep failing is set aside while the others are written"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        self.store.save("hank", "s2", exchange("Hello", "Hi"))
+        write = ConversationStore._write
+
+        def fail_s1(store, db, ops):
+            if any(op[1] == "s1" for op in ops):
+                raise RuntimeError("constraint failed")
+            write(store, db, ops)
+
+        with mock.patch.object(ConversationStore, "_write", fail_s1):
+            for attempt in range(3):
+                with self.assertRaises(RuntimeError):
+                    self.store.flush()
+        self.assertEqual(self.count(Message), 2)
+        self.assertEqual(self.store.flush(), 0)
+        self.assertEqual([session_id for session_id, _, _ in self.store.dead_letters], ["s1"])
+        self.assertEqual(self.store._dirty["s1"], 0)
+
+    def test_writer_flushes_on_size_and_shutdown(self):
+        """Test that the background writer flushes once enough changes are queued, and on stop"""
+        # The writer thread needs its own connection, so this test uses a database file
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir.name, 'conversations.db')}")
+        self.addCleanup(engine.dispose)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add(User(username="gina", email="gina@example.com"))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        store = ConversationStore(flush_seconds=60, flush_max_pending=3)
+        store.start()
+        store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        deadline = time.time() + 5
+        while self.count(Message) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.count(Message), 2)
+
+        store.append("gina", "s1", {"role": "user", "content": "Thanks"})
+        store.stop()
+        self.assertEqual(self.count(Message), 3)
+
+
+class TestSessionSummaries(unittest.TestCase):
+    """Test cases for incrementally maintained summaries and keyset pagination"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        db.add(User(username="gina", email="gina@example.com"))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = ConversationStore(flush_seconds=60)
+
+    def list_all(self, store, limit):
+        pages, cursor = [], None
+        while True:
+            items, cursor = store.list_sessions("gina", limit=limit, cursor=cursor)
+            pages.append([item["session_id"] for item in items])
+            if cursor is None:
+                return pages
+
+    def test_summaries_follow_appends(self):
+        """Test that title, count, preview and activity are updated by each append"""
+        self.store.save("gina", "s1", exchange("Plan the product launch for next quarter", "Sure"))
+        self.store.append("gina", "s1", {"role": "assistant", "content": "x" * 80})
+        (item,), _ = self.store.list_sessions("gina")
+        self.assertEqual(item["title"], "Plan the product launch for ne...")
+        self.assertEqual(item["message_count"], 3)
+        self.assertEqual(item["last_message"], "x" * 50 + "...")
+
+    def test_keyset_pagination_by_recency(self):
+        """Test that pages are ordered by last activity and stay consistent when a session moves to the top"""
+        for i in range(5):
+            self.store.save("gina", f"s{i}", exchange(f"Question {i}", "Answer"))
+        self.assertEqual(self.list_all(self.store, 2), [["s4", "s3"], ["s2", "s1"], ["s0"]])
+
+        first, cursor = self.store.list_sessions("gina", limit=2)
+        self.store.append("gina", "s0", *exchange("Back again", "Welcome back"))
+        rest, _ = self.store.list_sessions("gina", limit=10, cursor=cursor)
+        self.assertEqual([item["session_id"] for item in rest], ["s2", "s1"])
+        with self.assertRaises(ValueError):
+            self.store.list_sessions("gina", cursor="not-a-cursor")
+
+    def test_listing_after_restart_skips_message_bodies(self):
+        """Test that summaries are loaded from the database without loading the messages"""
+        for i in range(3):
+            self.store.save("gina", f"s{i}", exchange(f"Question {i}", "A long answer " * 10))
+        self.store.flush()
+        expected, _ = self.store.list_sessions("gina")
+
+        restarted = ConversationStore(flush_seconds=60)
+        self.assertEqual(restarted.list_sessions("gina")[0], expected)
+        self.assertEqual(restarted.resident_bytes, 0)
+
+    def test_cursor_round_trip(self):
+        """Test that a cursor encodes the sort key of the last session of a page"""
+        summary = SessionSummary("s1")
+        self.assertEqual(decode_cursor(encode_cursor(summary)), summary.sort_key())
+
+
+class TestMemoryBudget(unittest.TestCase):
+    """Test cases for evicting cold sessions and paging them back in"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        db.add(User(username="gina", email="gina@example.com"))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+        # Room for about two sessions of one exchange each
+        self.session_bytes = 2 * message_bytes("x" * 100)
+        self.store = ConversationStore(flush_seconds=60, memory_budget_bytes=int(2.5 * self.session_bytes))
+
+    def test_least_recently_used_clean_sessions_are_evicted(self):
+        """Test that unwritten sessions stay resident and written ones are evicted oldest first"""
+        for i in range(4):
+            self.store.save("gina", f"s{i}", exchange("x" * 100, "x" * 100))
+        self.assertEqual(self.store.resident_bytes, 4 * self.session_bytes)
+
+        self.store.flush()
+        self.assertLessEqual(self.store.resident_bytes, self.store.memory_budget_bytes)
+        self.assertEqual(metrics.snapshot()["counters"]["conversations.evictions"], 2)
+
+        self.assertEqual(self.store.get("gina", "s0"), exchange("x" * 100, "x" * 100))
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["conversations.page_ins"], 1)
+        self.assertEqual(snapshot["histograms"]["conversations.page_in_seconds"]["count"], 1)
+        self.assertLessEqual(snapshot["gauges"]["conversations.resident_bytes"], self.store.memory_budget_bytes)
+
+    def test_appends_to_evicted_sessions_are_not_lost(self):
+        """Test that a session appended to while evicted pages in with every message"""
+        for i in range(4):
+            self.store.save("gina", f"s{i}", exchange("x" * 100, "x" * 100))
+        self.store.flush()
+        self.store.append("gina", "s0", *exchange("Still there?", "Yes"))
+        messages = self.store.get("gina", "s0")
+        self.assertEqual([m["content"] for m in messages[2:]], ["Still there?", "Yes"])
+        (first,), _ = self.store.list_sessions("gina", limit=1)
+        self.assertEqual((first["session_id"], first["message_count"]), ("s0", 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Unit tests for near-duplicate task detection
+"""
+
+import unittest
+import os
+import sys
+import tempfile
+import tracemalloc
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics
+from shared.dedup import DuplicateIndex, minhash, similarity
+from shared.models import Base, Task, TaskSignature
+from shared.vector_index import VectorIndex
+from intake_agent import langchain_service
+
+LOGIN = ("Implement user authentication", "Add user login, registration, and JWT authentication to the app")
+LOGIN_AGAIN = ("Implement user authentication.", "Add user login, registration and JWT authentication to the app")
+BILLING = ("Set up billing", "Integrate the payment provider and send monthly invoices")
+
+
+def task(title, description, project_id=1):
+    return {"title": title, "description": description, "user_id": 1, "project_id": project_id,
+            "priority": "high", "role_required": "developer"}
+
+
+class TestMinHash(unittest.TestCase):
+    """Test cases for signatures and the in-memory index"""
+
+    def test_similarity_estimates(self):
+        """Test that rewordings score high and unrelated tasks score low"""
+        self.assertGreater(similarity(minhash(*LOGIN), minhash(*LOGIN_AGAIN)), 0.8)
+        self.assertLess(similarity(minhash(*LOGIN), minhash(*BILLING)), 0.3)
+
+    def test_index_is_partitioned_by_project(self):
+        """Test lookups, project isolation and removal"""
+        index = DuplicateIndex()
+        db = mock.Mock(**{"scalar.return_value": 1})
+        index.add(db, 1, 1, *LOGIN)
+        index.add(db, 2, 1, *BILLING)
+        self.assertEqual([task_id for task_id, _ in index.find_duplicates(1, *LOGIN_AGAIN)], [1])
+        self.assertEqual(index.find_duplicates(2, *LOGIN_AGAIN), [])
+        index.forget([1])
+        self.assertEqual(index.find_duplicates(1, *LOGIN_AGAIN), [])
+
+    def test_lookup_is_sub_millisecond(self):
+        """Test the median lookup time over an index of 10,000 tasks"""
+        metrics.reset()
+        index = DuplicateIndex()
+        for i in range(10000):
+            index._insert(i, i % 20, minhash(f"Task {i} for module {i % 97}", f"Work item number {i * 7919}"))
+        for i in range(200):
+            index.find_duplicates(i % 20, *LOGIN)
+        self.assertLess(metrics.snapshot()["histograms"]["dedup.lookup_seconds"]["p50"], 0.001)
+
+    def test_memory_per_task(self):
+        """Test that the index keeps under 1 KB per task, also after tasks are replaced"""
+        signatures = [minhash(f"Task {i} for module {i % 97}", f"Work item number {i * 7919}") for i in range(6000)]
+        tracemalloc.start()
+        try:
+            index = DuplicateIndex()
+            for i, signature in enumerate(signatures):
+                index._insert(i + 1, i % 20, signature)
+            # Replaced tasks leave stale bucket entries until the next rebuild
+            for i, signature in enumerate(signatures[:3000]):
+                index._insert(i + 1, i % 20, signature)
+            retained = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(index), 6000)
+        self.assertLess(retained / len(index), 1024)
+        self.assertEqual(index.find_duplicates(1, None, signature=signatures[1])[0], (2, 1.0))
+
+
+
+class TestSaveWithDeduplication(unittest.TestCase):
+    """Test cases for duplicate handling in save_tasks_to_db and index persistence"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.index = DuplicateIndex(mode="merge")
+        vector_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(vector_dir.cleanup)
+        self.vectors = VectorIndex(path=vector_dir.name)
+        for name, value in (("SessionLocal", self.Session), ("get_task_index", lambda: self.index), ("get_vector_index", lambda: self.vectors)):
+            patcher = mock.patch.object(langchain_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_merge_skips_duplicates_within_a_project(self):
+        """Test that a re-emitted task is skipped and reported, also within one batch"""
+        first = langchain_service.save_tasks_to_db([task(*LOGIN), task(*BILLING), task(*LOGIN_AGAIN)])
+        self.assertEqual(len(first["saved"]), 2)
+        self.assertEqual(first["duplicates"][0]["duplicate_of"], first["saved"][0])
+
+        second = langchain_service.save_tasks_to_db([task(*LOGIN_AGAIN), task(*LOGIN_AGAIN, project_id=2)])
+        self.assertEqual(len(second["saved"]), 1)
+        self.assertEqual(len(second["duplicates"]), 1)
+
+    def test_flag_mode_saves_and_reports(self):
+        """Test that flag mode keeps the duplicate but reports it"""
+        self.index.mode = "flag"
+        result = langchain_service.save_tasks_to_db([task(*LOGIN), task(*LOGIN_AGAIN)])
+        self.assertEqual((len(result["saved"]), len(result["duplicates"])), (2, 1))
+
+    def test_deleted_tasks_leave_the_index(self):
+        """Test that deleting a task allows it to be saved again"""
+        saved = langchain_service.save_tasks_to_db([task(*LOGIN)])["saved"]
+        langchain_service.delete_tasks(saved)
+        self.assertEqual(len(langchain_service.save_tasks_to_db([task(*LOGIN_AGAIN)])["saved"]), 1)
+
+    def test_index_rebuilds_from_stored_signatures(self):
+        """Test that a fresh index loads stored signatures and reconciles with the tasks table"""
+        saved = langchain_service.save_tasks_to_db([task(*LOGIN), task(*BILLING)])["saved"]
+        db = self.Session()
+        # A task created outside the index and a signature of a task deleted outside it
+        db.add(Task(id=100, title="Write release notes", description="Summarize changes", project_id=1))
+        db.query(Task).filter(Task.id == saved[1]).delete()
+        db.commit()
+
+        rebuilt = DuplicateIndex()
+        rebuilt.load(db)
+        self.assertEqual(sorted(rebuilt._rows), [saved[0], 100])
+        self.assertEqual(rebuilt.find_duplicates(1, *LOGIN_AGAIN)[0][0], saved[0])
+        self.assertEqual(db.query(TaskSignature).count(), 2)
+        db.close()
+
+    def test_changes_made_by_other_workers_are_seen(self):
+        """Test that refresh applies the tasks another worker's index saved or deleted"""
+        db = self.Session()
+        other = DuplicateIndex()
+        other.load(db)
+        saved = langchain_service.save_tasks_to_db([task(*LOGIN)])["saved"]
+        other.refresh(db)
+        self.assertEqual(other.find_duplicates(1, *LOGIN_AGAIN)[0][0], saved[0])
+        # The same tasks replayed by the worker that saved them are not re-inserted
+        self.index.refresh(db)
+        self.assertEqual(self.index._stale, 0)
+
+        langchain_service.delete_tasks(saved)
+        other.refresh(db)
+        self.assertEqual(other.find_duplicates(1, *LOGIN_AGAIN), [])
+
+        # A worker whose unseen changes were trimmed from the log reloads the index
+        with mock.patch("shared.dedup.DEDUP_CHANGE_LOG_SIZE", 1):
+            saved = langchain_service.save_tasks_to_db([task(*LOGIN), task(*BILLING)])["saved"]
+        with mock.patch.object(other, "load", wraps=other.load) as load:
+            other.refresh(db)
+        load.assert_called_once()
+        self.assertEqual(sorted(other._rows), saved)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the streaming NDJSON/CSV export
+"""
+
+import unittest
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import export as export_module
+from shared.export import export, iter_decisions
+from shared.models import Base, Task, User, Assignment
+
+
+class TestExport(unittest.TestCase):
+    """Test cases for streaming exports"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=self.engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        db = Session()
+        db.add_all([User(id=i, username=f"dev{i}", full_name=f"Dev {i}", role="developer") for i in (1, 2)])
+        for i in range(1, 11):
+            db.add(Task(id=i, title=f"Task {i}", description="Line one\nline two, with comma",
+                        project_id=1 if i <= 6 else 2, priority="high", deadline=datetime(2026, 1, i)))
+            db.add(Assignment(id=i, task_id=i, user_id=1 + i % 2))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(export_module, "SessionLocal", Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_tasks_ndjson_with_filters(self):
+        """Test the project and inclusive deadline filters"""
+        rows = [json.loads(line) for line in export("tasks", project_id=1, since=date(2026, 1, 2), until=date(2026, 1, 4))]
+        self.assertEqual([row["id"] for row in rows], [2, 3, 4])
+        self.assertEqual(rows[0]["deadline"], "2026-01-02T00:00:00")
+
+    def test_tasks_csv_in_batches(self):
+        """Test that CSV comes out in chunks with a single header and quoted text"""
+        chunks = list(export("tasks", "csv", batch_size=4))
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]["description"], "Line one\nline two, with comma")
+
+    def test_assignments_are_joined_in_one_query(self):
+        """Test that assignments come with task and developer data without N+1 queries"""
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.engine, "before_cursor_execute", listener)
+        try:
+            rows = [json.loads(line) for line in export("assignments", project_id=2, batch_size=2)]
+        finally:
+            event.remove(self.engine, "before_cursor_execute", listener)
+        self.assertEqual([row["task_id"] for row in rows], [7, 8, 9, 10])
+        self.assertEqual(rows[0]["developer_username"], "dev2")
+        self.assertEqual(len(statements), 1)
+
+    def test_decisions_from_log(self):
+        """Test that the decision log is streamed and filtered by date"""
+        with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as f:
+            for day in (1, 2, 3):
+                f.write(json.dumps({"timestamp": f"2026-02-0{day}T10:00:00", "decision": f"d{day}", "task_id": day}) + "\n")
+            f.write("not json\n")
+        self.addCleanup(os.remove, f.name)
+        decisions = list(iter_decisions(since=date(2026, 2, 2), path=f.name))
+        self.assertEqual([d["decision"] for d in decisions], ["d2", "d3"])
+
+    def test_export_endpoint(self):
+        """Test the /export/{kind} streaming endpoint"""
+        from fastapi.testclient import TestClient
+        from assignment_agent.main import app
+
+        client = TestClient(app)
+        response = client.get("/export/tasks", params={"format": "csv", "project_id": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/csv"))
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(response.text)))), 4)
+        self.assertEqual(client.get("/export/users").status_code, 404)
+        self.assertEqual(client.get("/export/tasks", params={"format": "xml"}).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Import-time budget tests for the API entry points
+"""
+
+import unittest
+import os
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cumulative import time allowed for each entry point, in seconds
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "2.0"))
+
+
+def measure_import_seconds(module):
+    """Import a module in a fresh interpreter with -X importtime and return its cumulative time."""
+    env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise AssertionError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1e6
+    raise AssertionError(f"No importtime entry found for {module}")
+
+
+class TestImportTime(unittest.TestCase):
+    """Test that importing the services stays cheap"""
+
+    def test_intake_server_import_budget(self):
+        """Test the cumulative import time of the intake API"""
+        seconds = measure_import_seconds("intake_agent.server")
+        print(f"intake_agent.server imported in {seconds:.3f}s")
+        self.assertLess(seconds, IMPORT_TIME_BUDGET_SECONDS)
+
+    def test_assignment_main_import_budget(self):
+        """Test the cumulative import time of the assignment API, without an API key"""
+        seconds = measure_import_seconds("assignment_agent.main")
+        print(f"assignment_agent.main imported in {seconds:.3f}s")
+        self.assertLess(seconds, IMPORT_TIME_BUDGET_SECONDS)
+
+    def test_no_eager_work_at_import(self):
+        """Test that the agent, the user directory and tables are only built on first use"""
+        script = (
+            "import intake_agent.server, assignment_agent.main\n"
+            "from intake_agent import langchain_service, auth\n"
+            "from assignment_agent import agent\n"
+            "from shared import models\n"
+            "from shared.user_directory import user_directory\n"
+            "built = [f.__qualname__ for f in (langchain_service.get_agent, langchain_service.get_llm,\n"
+            "    agent.get_agent, models.init_db) if f.cache_info().currsize]\n"
+            "assert not built, built\n"
+            "assert not len(user_directory), 'users loaded at import'\n"
+        )
+        env = {k: v for k, v in os.environ.items() if k != "OPENAI_API_KEY"}
+        result = subprocess.run([sys.executable, "-c", script], cwd=PROJECT_ROOT, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+
+if __name__ == "__main__":
+    unittest.main()
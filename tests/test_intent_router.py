@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the intake intent router
+"""
+
+import unittest
+import os
+import sys
+from datetime import datetime
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics
+from shared.models import Base, Task, User, Assignment
+from intake_agent import intent_router
+
+
+class TestClassification(unittest.TestCase):
+    """Test cases for recognising lookup intents"""
+
+    def test_lookups_are_recognised(self):
+        """Test the intent and slots of common lookups"""
+        cases = {
+            "What tasks are assigned to me?": ("my_tasks", {}),
+            "list high-priority tasks in project 2": ("list_tasks", {"priority": "high", "project_id": 2}),
+            "How many unassigned tasks are there?": ("count_tasks", {"unassigned": True}),
+            "tell me about task #4": ("task_details", {"task_id": 4}),
+        }
+        for text, (intent, slots) in cases.items():
+            with self.subTest(text=text):
+                predicted, _, found = intent_router.classify(text)
+                self.assertEqual((predicted, found), (intent, slots))
+
+    def test_other_messages_fall_through(self):
+        """Test that requests to change data and open-ended messages go to the agent"""
+        for text in ("Create a task for the login page", "delete task 4", "I need an app for managing recipes",
+                     "what should we prioritise in project 2", "hi", "tell me about it"):
+            with self.subTest(text=text):
+                self.assertIsNone(intent_router.classify(text)[0])
+
+
+    def test_conversation_context_goes_to_the_agent(self):
+        """Test that follow-ups referring back to the conversation or to proposed tasks are not routed"""
+        for text in ("show the tasks you just listed", "list the high priority ones", "which of those are in project 2"):
+            with self.subTest(text=text):
+                self.assertIsNone(intent_router.classify(text)[0])
+
+        proposal = [
+            {"role": "user", "content": "Plan the launch"},
+            {"role": "assistant", "content": "Here are the tasks:\n1. Write the press release\n2. Set up the landing page"},
+        ]
+        self.assertIsNone(intent_router.classify("list high priority tasks", proposal)[0])
+        lookup = [
+            {"role": "user", "content": "show all tasks"},
+            {"role": "assistant", "content": "Found 2 tasks:\n- #1 Write docs\n- #2 Fix login"},
+        ]
+        self.assertEqual(intent_router.classify("list high priority tasks", lookup)[0], "list_tasks")
+
+class TestRouting(unittest.TestCase):
+    """Test cases for answering routed lookups from the database"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        db.add(User(id=1, username="pm", email="pm@example.com"))
+        db.add_all([
+            Task(id=1, title="Build login", priority="high", project_id=2, deadline=datetime(2026, 1, 31)),
+            Task(id=2, title="Write docs", priority="low", project_id=2),
+            Task(id=3, title="Set up CI", priority="high", project_id=1),
+        ])
+        db.add(Assignment(task_id=3, user_id=1))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(intent_router, "SessionLocal", Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+
+    def test_templated_replies(self):
+        """Test the replies to each lookup intent"""
+        self.assertEqual(intent_router.route_query("what tasks are assigned to me?", "pm")["reply"],
+                         "You have 1 task assigned:\n- #3 Set up CI (high priority, project 1)")
+        self.assertEqual(intent_router.route_query("list high priority tasks in project 2", "pm")["reply"],
+                         "Found 1 high-priority task in project 2:\n- #1 Build login (high priority, project 2, due 2026-01-31)")
+        self.assertEqual(intent_router.route_query("how many unassigned tasks are there", "pm")["reply"],
+                         "There are 2 unassigned tasks.")
+        self.assertIn("Assigned to: pm", intent_router.route_query("show task 3", "pm")["reply"])
+        self.assertEqual(intent_router.route_query("show task 99", "pm")["reply"], "There is no task with ID 99.")
+
+    def test_decisions_are_recorded(self):
+        """Test that routed and passed-through queries are counted and timed"""
+        self.assertIsNotNone(intent_router.route_query("show my tasks", "pm"))
+        self.assertIsNone(intent_router.route_query("break the website into tasks", "pm"))
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["intent_router.routed.my_tasks"], 1)
+        self.assertEqual(snapshot["counters"]["intent_router.fallthrough"], 1)
+        self.assertEqual(snapshot["histograms"]["intent_router.seconds"]["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
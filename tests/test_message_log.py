@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the compact message log of in-memory conversations
+"""
+
+import unittest
+import os
+import sys
+from datetime import datetime
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from intake_agent.message_log import MESSAGE_OVERHEAD_BYTES, ROLES, MessageLog
+
+
+def exchange(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+class TestMessageLog(unittest.TestCase):
+    """Test cases for the columnar message log and its formatted view"""
+
+    def test_behaves_as_a_list_of_messages(self):
+        """Test that the log reads back the messages it was given"""
+        when = datetime(2026, 1, 2, 3, 4, 5)
+        log = MessageLog(exchange("Plan the launch", "Sure"), when)
+        log.append("tool", "Looked it up")
+        self.assertEqual(len(log), 3)
+        self.assertEqual(log[-1], {"role": "tool", "content": "Looked it up"})
+        self.assertEqual(log[:2], exchange("Plan the launch", "Sure"))
+        self.assertEqual(log, exchange("Plan the launch", "Sure") + [{"role": "tool", "content": "Looked it up"}])
+        self.assertEqual(log.timestamp(0), when)
+
+    def test_roles_are_interned(self):
+        """Test that every message of a role shares one role string"""
+        log = MessageLog([{"role": "".join(["assis", "tant"]), "content": str(i)} for i in range(3)])
+        self.assertTrue(all(message["role"] is log[0]["role"] for message in log))
+
+    def test_unknown_roles_do_not_grow_the_role_table(self):
+        """Test that roles outside the fixed table are kept as assistant messages"""
+        log = MessageLog([{"role": f"role{i}", "content": str(i)} for i in range(300)])
+        self.assertEqual({message["role"] for message in log}, {"assistant"})
+        self.assertEqual(len(ROLES), 4)
+
+    def test_formatted_view_shares_the_contents(self):
+        """Test that the API view follows appends and references the stored strings"""
+        log = MessageLog(exchange("Hello", "Hi"))
+        view = log.formatted()
+        log.append("system", "Be brief")
+        self.assertEqual(list(view), [{"type": "user", "content": "Hello"}, {"type": "ai", "content": "Hi"},
+                                      {"type": "ai", "content": "Be brief"}])
+        self.assertIs(view[1]["content"], log[1]["content"])
+
+    def test_size_accounting(self):
+        """Test that the estimate counts the contents and the per-message overhead"""
+        log = MessageLog(exchange("Hello", "Hi"))
+        self.assertEqual(log.nbytes(), sys.getsizeof("Hello") + sys.getsizeof("Hi") + 2 * MESSAGE_OVERHEAD_BYTES)
+
+
+if __name__ == "__main__":
+    unittest.main()
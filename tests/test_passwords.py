@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Unit tests for password hashing on the bounded worker pool
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from passlib.context import CryptContext
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics, models
+from shared import user_directory as user_directory_module
+from shared.models import Base, User
+from shared.passwords import PasswordHasher
+from shared.user_directory import UserDirectory
+from intake_agent import auth
+
+
+class SlowContext:
+    """Stand-in for a CryptContext that records how many hashes run at once"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def hash(self, password):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+        return f"hashed:{password}"
+
+
+class TestPasswordHasher(unittest.TestCase):
+    """Test cases for the bounded hashing pool"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_concurrency_is_capped(self):
+        """Test that no more hashes run at once than there are workers, and queue waits are recorded"""
+        context = SlowContext(0.05)
+        hasher = PasswordHasher(context, max_workers=2)
+
+        async def run():
+            return await asyncio.gather(*(hasher.ahash(str(i)) for i in range(6)))
+
+        self.assertEqual(asyncio.run(run()), [f"hashed:{i}" for i in range(6)])
+        self.assertEqual(context.peak, 2)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["histograms"]["passwords.queue_wait_seconds"]["count"], 6)
+        self.assertGreater(snapshot["histograms"]["passwords.queue_wait_seconds"]["max"], 0.05)
+        self.assertEqual(snapshot["histograms"]["passwords.hash_seconds"]["count"], 6)
+        self.assertEqual(snapshot["gauges"]["passwords.queued"], 0)
+        self.assertEqual(snapshot["gauges"]["passwords.running"], 0)
+
+    def test_hashing_does_not_block_the_event_loop(self):
+        """Test that the event loop keeps ticking while hashes are computed"""
+        hasher = PasswordHasher(SlowContext(0.2), max_workers=2)
+
+        async def run():
+            lags = []
+            done = asyncio.Event()
+
+            async def ticker():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.01)
+                    lags.append(time.perf_counter() - started - 0.01)
+
+            ticking = asyncio.create_task(ticker())
+            await asyncio.gather(*(hasher.ahash(str(i)) for i in range(4)))
+            done.set()
+            await ticking
+            return lags
+
+        lags = asyncio.run(run())
+        self.assertGreater(len(lags), 10)
+        self.assertLess(max(lags), 0.1)
+
+
+class TestLoginRehash(unittest.TestCase):
+    """Test cases for upgrading stored hashes on login"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        old_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+        db.add(User(username="dave", email="dave@example.com", hashed_password=old_context.hash("secret")))
+        db.commit()
+        db.close()
+        directory = UserDirectory()
+        hasher = PasswordHasher(CryptContext(schemes=["bcrypt"], bcrypt__rounds=5), max_workers=2)
+        for target, name, value in (
+            (models, "SessionLocal", self.Session),
+            (auth, "SessionLocal", self.Session),
+            (auth, "user_directory", directory),
+            (user_directory_module, "user_directory", directory),
+            (auth, "password_hasher", hasher),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stored_hash(self):
+        db = self.Session()
+        try:
+            return models.get_user_by_username(db, "dave").hashed_password
+        finally:
+            db.close()
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        """Test that a hash with another cost factor is replaced after a successful login only"""
+        self.assertFalse(asyncio.run(auth.authenticate_user("dave", "wrong")))
+        self.assertTrue(self.stored_hash().startswith("$2b$04$"))
+
+        self.assertEqual(asyncio.run(auth.authenticate_user("dave", "secret")).username, "dave")
+        upgraded = self.stored_hash()
+        self.assertTrue(upgraded.startswith("$2b$05$"))
+        self.assertTrue(asyncio.run(auth.authenticate_user("dave", "secret")))
+        self.assertEqual(self.stored_hash(), upgraded)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Unit tests for speculative precomputation of assignment analyses
+"""
+
+import unittest
+import json
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the assignment_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import fakeredis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics
+from shared.models import Base, Task, User, AssignmentAnalysis
+from assignment_agent import behavior_tree, precompute, tools
+
+
+class TestPrecompute(unittest.TestCase):
+    """Test cases for precomputing, storing and serving analyses"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add(Task(id=1, title="Existing task", description=""))
+        db.add_all([User(id=i, username=f"dev{i}", email=f"dev{i}@example.com", role="developer") for i in range(1, 5)])
+        db.commit()
+        db.close()
+
+        self.redis = fakeredis.FakeStrictRedis()
+        for developer_id in range(1, 5):
+            self.redis.set(f"developer:{developer_id}:task_count", developer_id)
+        self.tree_calls = 0
+        for target, name, value in (
+            (precompute, "SessionLocal", self.Session),
+            (behavior_tree, "redis_client", self.redis),
+            (behavior_tree.assignment_tree, "analyze_assignment", self.fake_tree),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        metrics.reset()
+
+    def fake_tree(self, task_id, developer_id):
+        """Score developers by their task count in Redis, lighter workloads first."""
+        self.tree_calls += 1
+        workload = int(self.redis.get(f"developer:{developer_id}:task_count")) / 5
+        return {"task_id": task_id, "developer_id": developer_id, "recommendation": "Good match",
+                "score": 1.0 - workload, "skill_match": 1.0, "workload": workload}
+
+    def add_task(self, task_id):
+        db = self.Session()
+        db.add(Task(id=task_id, title=f"Task {task_id}", description=""))
+        db.commit()
+        db.close()
+
+    def test_new_tasks_are_precomputed(self):
+        """Test that only tasks created after startup are picked up and the top candidates stored"""
+        precomputer = precompute.AnalysisPrecomputer(top_k=2)
+        precomputer.poll()
+        self.add_task(2)
+        precomputer.poll()
+        self.assertEqual(precomputer.run_pending(), 1)
+
+        db = self.Session()
+        rows = db.query(AssignmentAnalysis).order_by(AssignmentAnalysis.developer_id).all()
+        self.assertEqual([(row.task_id, row.developer_id) for row in rows], [(2, 1), (2, 2)])
+        db.close()
+
+    def test_analysis_is_served_while_inputs_are_unchanged(self):
+        """Test that the assignment tool reuses a current analysis and recomputes a stale one"""
+        precompute.precompute_task(1)
+        calls = self.tree_calls
+
+        result = tools.analyze_task_assignment_fit(1, 1)
+        self.assertEqual(self.tree_calls, calls)
+        self.assertIn("explanation", result)
+
+        self.redis.set("developer:1:task_count", 4)
+        self.assertAlmostEqual(tools.analyze_task_assignment_fit(1, 1)["workload"], 0.8)
+        self.assertEqual(self.tree_calls, calls + 1)
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual((counters["precompute.hits"], counters["precompute.stale"]), (1, 1))
+
+    def test_recommendations(self):
+        """Test that recommendations are ranked and recomputed once an input changes"""
+        ranked = [analysis["developer_id"] for analysis in precompute.get_recommendations(1)]
+        self.assertEqual(ranked, [1, 2, 3])
+        calls = self.tree_calls
+
+        self.assertEqual([analysis["developer_id"] for analysis in precompute.get_recommendations(1)], ranked)
+        self.assertEqual(self.tree_calls, calls)
+
+        self.redis.set("developer:1:task_count", 5)
+        self.assertEqual([analysis["developer_id"] for analysis in precompute.get_recommendations(1)], [2, 3, 4])
+
+        db = self.Session()
+        self.assertEqual(json.loads(db.get(AssignmentAnalysis, (1, 2)).analysis)["developer_id"], 2)
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
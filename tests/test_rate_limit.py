@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the LLM rate limiter
+"""
+
+import unittest
+import asyncio
+import fakeredis
+import os
+import sys
+import threading
+import time
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shared import metrics
+from shared.rate_limit import (
+    LLMRateLimiter, MemoryBudget, RedisBudget, INTERACTIVE, BACKGROUND
+)
+
+
+class TestLLMRateLimiter(unittest.TestCase):
+    """Test cases for the token-bucket limiter"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_interactive_lane_preempts_background(self):
+        """Test that a later interactive call is served before a queued background call"""
+        limiter = LLMRateLimiter(requests_per_minute=600, tokens_per_minute=10**6)
+        limiter.budget._requests.level = 0  # Drained: the next slot opens in 0.1s
+        order = []
+
+        def call(lane):
+            limiter.acquire(tokens=1, lane=lane)
+            order.append(lane)
+
+        background = threading.Thread(target=call, args=(BACKGROUND,))
+        background.start()
+        time.sleep(0.02)
+        interactive = threading.Thread(target=call, args=(INTERACTIVE,))
+        interactive.start()
+        background.join()
+        interactive.join()
+
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+        self.assertEqual(metrics.snapshot()["histograms"]["llm.queue_wait_seconds.background"]["count"], 1)
+
+    def test_user_over_quota_does_not_block_others(self):
+        """Test that per-user quotas only delay that user"""
+        limiter = LLMRateLimiter(requests_per_minute=1000, tokens_per_minute=10**6, user_requests_per_minute=2)
+
+        async def scenario():
+            await limiter.aacquire("alice", 10, INTERACTIVE)
+            await limiter.aacquire("alice", 10, INTERACTIVE)
+            blocked = asyncio.create_task(limiter.aacquire("alice", 10, INTERACTIVE))
+            await asyncio.sleep(0.1)
+            waited = await asyncio.wait_for(limiter.aacquire("bob", 10, INTERACTIVE), timeout=1)
+            self.assertFalse(blocked.done())
+            blocked.cancel()
+            return waited
+
+        self.assertLess(asyncio.run(scenario()), 0.2)
+        self.assertEqual(limiter._waiting, [])
+
+    def test_settle_charges_actual_usage(self):
+        """Test that token buckets are corrected with the real usage"""
+        limiter = LLMRateLimiter(tokens_per_minute=1000)
+        limiter.acquire("alice", 100)
+        limiter.settle("alice", 100, 400)
+        self.assertAlmostEqual(limiter.budget._tokens.level, 600, delta=5)
+        self.assertEqual(metrics.get_counter("llm.tokens"), 400)
+
+    def test_user_buckets_are_bounded(self):
+        """Test that the least recently used user buckets are dropped"""
+        limiter = LLMRateLimiter(budget=MemoryBudget(1000, 10**6, 30, 10**6, max_users=2))
+        for user in ("alice", "bob", "alice", "carol"):
+            limiter.acquire(user, 10)
+        self.assertEqual(list(limiter.budget._user_buckets), ["alice", "carol"])
+
+
+class TestSharedBudget(unittest.TestCase):
+    """Test cases for token buckets shared between processes through Redis"""
+
+    def setUp(self):
+        metrics.reset()
+        self.client = fakeredis.FakeRedis()
+
+    def limiter(self, requests_per_minute=1000, user_requests_per_minute=30):
+        # One limiter per process, all drawing on the same Redis
+        return LLMRateLimiter(budget=RedisBudget(requests_per_minute, 10**6, user_requests_per_minute, 10**6, client=self.client))
+
+    def test_quota_is_shared_between_processes(self):
+        """Test that calls made by one process count against another's budget"""
+        intake, assignment = self.limiter(user_requests_per_minute=2), self.limiter(user_requests_per_minute=2)
+        intake.acquire("alice", 10)
+        assignment.acquire("alice", 10)
+
+        async def third_call():
+            return await asyncio.wait_for(intake.aacquire("alice", 10), timeout=0.2)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(third_call())
+        self.assertLess(intake.acquire("bob", 10), 0.1)
+        self.assertEqual(self.client.zcard("llm_rate:interactive"), 0)
+
+    def test_interactive_lane_preempts_background_in_other_processes(self):
+        """Test that a background call waits while another process has an interactive call queued"""
+        intake, assignment = self.limiter(requests_per_minute=600), self.limiter(requests_per_minute=600)
+        seconds, microseconds = self.client.time()
+        # Drained: the next slot opens in 0.1s
+        self.client.hset("llm_rate:global", mapping={"requests": 0, "tokens": 10**6, "updated": seconds + microseconds / 1e6})
+        order = []
+
+        def call(limiter, lane):
+            limiter.acquire(tokens=1, lane=lane)
+            order.append(lane)
+
+        interactive = threading.Thread(target=call, args=(intake, INTERACTIVE))
+        interactive.start()
+        time.sleep(0.02)
+        self.assertEqual(self.client.zcard("llm_rate:interactive"), 1)
+        background = threading.Thread(target=call, args=(assignment, BACKGROUND))
+        background.start()
+        interactive.join()
+        background.join()
+
+        self.assertEqual(order, [INTERACTIVE, BACKGROUND])
+        self.assertEqual(self.client.zcard("llm_rate:interactive"), 0)
+
+    def test_async_callers_reach_redis_off_the_event_loop(self):
+        """Test that waiting for a shared budget never blocks the event loop on a Redis round trip"""
+        limiter = self.limiter()
+        threads = []
+        take = limiter.budget.take
+        limiter.budget.take = lambda ticket: threads.append(threading.current_thread()) or take(ticket)
+
+        async def call():
+            await limiter.aacquire("alice", 10, INTERACTIVE)
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(call())
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], loop_thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the assignment tools' record cache
+"""
+
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import metrics
+from shared.models import Base, Task, User, Assignment
+from shared.record_cache import RecordCache
+from assignment_agent import tools
+
+
+class TestRecordCache(unittest.TestCase):
+    """Test cases for cached task and developer lookups and their invalidation"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add_all([
+            Task(id=1, title="Build login", description="", priority="high", role_required="developer"),
+            Task(id=2, title="Write docs", description="", priority="low", role_required="writer"),
+            User(id=7, username="dev", email="dev@example.com", hashed_password="x"),
+        ])
+        db.commit()
+        db.close()
+        self.cache = RecordCache()
+        self.queries = 0
+        original = tools.get_task
+
+        def counting_get_task(db, task_id):
+            self.queries += 1
+            return original(db, task_id)
+
+        for name, value in (("get_db", self.Session), ("record_cache", self.cache), ("get_task", counting_get_task)):
+            patcher = mock.patch.object(tools, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The commit hooks invalidate the module-level cache
+        patcher = mock.patch("shared.record_cache.record_cache", self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metrics.reset()
+
+    def test_repeated_lookups_hit_the_cache(self):
+        """Test that only the first lookup queries the database and hit ratios are exported"""
+        with self.cache.run_scope():
+            for _ in range(3):
+                self.assertEqual(tools.get_task_details(1)["title"], "Build login")
+        self.assertEqual(tools.get_task_details(1)["title"], "Build login")
+        self.assertEqual(self.queries, 1)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["record_cache.run_hits"], 2)
+        self.assertEqual(snapshot["counters"]["record_cache.process_hits"], 1)
+        self.assertEqual(snapshot["gauges"]["record_cache.hit_ratio"], 0.75)
+
+    def test_missing_records_are_not_cached(self):
+        """Test that a not-found lookup is queried again"""
+        self.assertIn("error", tools.get_task_details(99))
+        self.assertIn("error", tools.get_task_details(99))
+        self.assertEqual(self.queries, 2)
+
+    def test_commits_invalidate_entries(self):
+        """Test that committed task, user and assignment changes are seen by the next lookup"""
+        with self.cache.run_scope():
+            tools.get_task_details(1)
+            self.assertEqual(tools.check_developer_availability(7)["current_task_count"], 0)
+
+            tools.assign_task_to_developer(1, 7)
+            self.assertEqual(tools.check_developer_availability(7)["current_task_count"], 1)
+
+            db = self.Session()
+            db.get(Task, 1).title = "Build SSO login"
+            db.commit()
+            self.assertEqual(tools.get_task_details(1)["title"], "Build SSO login")
+
+            db.get(User, 7).disabled = True
+            db.rollback()
+            self.assertEqual(tools.check_developer_availability(7)["availability"], "available")
+            db.close()
+
+    def test_bulk_statements_invalidate_the_kind(self):
+        """Test that bulk updates and deletes drop every record of the affected kind"""
+        tools.get_task_details(1)
+        tools.get_task_details(2)
+        db = self.Session()
+        db.execute(update(Task), [{"id": 2, "priority": "high"}])
+        db.query(Assignment).filter(Assignment.user_id == 7).delete()
+        db.commit()
+        db.close()
+        self.assertEqual(tools.get_task_details(2)["priority"], "high")
+        self.assertEqual(self.queries, 3)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used record is evicted first"""
+        cache = RecordCache(max_entries=2)
+        for record_id in (1, 2, 1, 3):
+            cache.get_or_load("task", record_id, lambda: {"id": record_id})
+        self.assertEqual(sorted(key[1] for key in cache._entries), [1, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Unit tests for rotating refresh tokens and batched last_login updates
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import models
+from shared import user_directory as user_directory_module
+from shared.last_login import LastLoginRecorder
+from shared.models import Base, User, RefreshToken
+from shared.user_directory import UserDirectory
+from intake_agent import auth
+
+
+class AuthDatabaseTestCase(unittest.TestCase):
+    """Base class running authentication against an in-memory users table"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", lambda conn, cursor, statement, *args: self.statements.append(statement))
+        db = self.Session()
+        db.add_all([User(username=name, email=f"{name}@example.com", hashed_password="x") for name in ("erin", "frank")])
+        db.commit()
+        self.erin_id = models.get_user_by_username(db, "erin").id
+        db.close()
+        self.recorder = LastLoginRecorder()
+        directory = UserDirectory()
+        for target, name, value in (
+            (models, "SessionLocal", self.Session),
+            (auth, "SessionLocal", self.Session),
+            (auth, "user_directory", directory),
+            (user_directory_module, "user_directory", directory),
+            (auth, "last_login_recorder", self.recorder),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestRefreshTokens(AuthDatabaseTestCase):
+    """Test cases for issuing, rotating and revoking refresh tokens"""
+
+    def test_tokens_are_stored_as_digests(self):
+        """Test that only a digest of a refresh token is stored"""
+        token = auth.issue_refresh_token(self.erin_id)
+        db = self.Session()
+        (stored,) = [row.token_hash for row in db.query(RefreshToken)]
+        db.close()
+        self.assertNotIn(token, stored)
+        self.assertEqual(len(stored), 64)
+
+    def test_rotation_issues_a_successor_once(self):
+        """Test that a refresh token can be exchanged exactly once"""
+        token = auth.issue_refresh_token(self.erin_id)
+        user, successor = auth.rotate_refresh_token(token)
+        self.assertEqual(user.username, "erin")
+        self.assertNotEqual(successor, token)
+        user, _ = auth.rotate_refresh_token(successor)
+        self.assertEqual(user.username, "erin")
+        self.assertIsNone(auth.rotate_refresh_token("not-a-token"))
+
+    def test_reuse_revokes_the_whole_login(self):
+        """Test that presenting a rotated token again revokes its successors but not other logins"""
+        token = auth.issue_refresh_token(self.erin_id)
+        other_login = auth.issue_refresh_token(self.erin_id)
+        _, successor = auth.rotate_refresh_token(token)
+        with mock.patch.object(auth, "REFRESH_TOKEN_REUSE_GRACE_SECONDS", 0):
+            self.assertIsNone(auth.rotate_refresh_token(token))
+        self.assertIsNone(auth.rotate_refresh_token(successor))
+        self.assertIsNotNone(auth.rotate_refresh_token(other_login))
+
+    def test_concurrent_refreshes_keep_the_login(self):
+        """Test that a token presented again right after its rotation gets a token instead of revoking the login"""
+        token = auth.issue_refresh_token(self.erin_id)
+        _, first = auth.rotate_refresh_token(token)
+        user, second = auth.rotate_refresh_token(token)
+        self.assertEqual(user.username, "erin")
+        self.assertIsNotNone(auth.rotate_refresh_token(first))
+        self.assertIsNotNone(auth.rotate_refresh_token(second))
+
+        # Once the login is revoked the grace no longer applies
+        auth.disable_user("erin")
+        auth.disable_user("erin", disabled=False)
+        self.assertIsNone(auth.rotate_refresh_token(token))
+
+    def test_expired_and_disabled_are_rejected(self):
+        """Test that expired tokens and tokens of disabled users cannot be rotated"""
+        token = auth.issue_refresh_token(self.erin_id)
+        with mock.patch.object(auth, "REFRESH_TOKEN_EXPIRE_DAYS", -1):
+            expired = auth.issue_refresh_token(self.erin_id)
+        self.assertIsNone(auth.rotate_refresh_token(expired))
+
+        auth.disable_user("erin")
+        auth.disable_user("erin", disabled=False)
+        self.assertIsNone(auth.rotate_refresh_token(token))
+
+
+class TestLastLoginBatching(AuthDatabaseTestCase):
+    """Test cases for writing last_login times in batches"""
+
+    def test_logins_are_written_in_one_statement(self):
+        """Test that logins write nothing until the flush, which updates every user at once"""
+        with mock.patch.object(auth.password_hasher, "averify_and_update", mock.AsyncMock(return_value=(True, None))):
+            for name in ("erin", "frank", "erin"):
+                self.assertTrue(asyncio.run(auth.authenticate_user(name, "secret")))
+        self.assertFalse([s for s in self.statements if s.lstrip().upper().startswith("UPDATE")])
+
+        self.assertEqual(len(self.recorder), 2)
+        self.assertEqual(self.recorder.flush(), 2)
+        self.assertEqual(len([s for s in self.statements if s.lstrip().upper().startswith("UPDATE")]), 1)
+        db = self.Session()
+        self.assertTrue(all(user.last_login for user in models.get_users(db)))
+        db.close()
+        self.assertEqual(self.recorder.flush(), 0)
+
+    def test_failed_flush_keeps_pending_times(self):
+        """Test that login times survive a failed write"""
+        self.recorder.record("erin", datetime.utcnow() - timedelta(minutes=1))
+        with mock.patch.object(models, "record_logins", side_effect=RuntimeError("database is locked")):
+            with self.assertRaises(RuntimeError):
+                self.recorder.flush()
+        self.assertEqual(self.recorder.flush(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
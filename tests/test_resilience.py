@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the LLM resilience layer, using a fault-injecting fake model
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+import time
+from typing import Any, List
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from shared import metrics
+from shared.rate_limit import LLMRateLimiter, llm_user, INTERACTIVE
+from shared.resilience import (
+    CircuitBreaker, CircuitOpenError, LLMUnavailableError, ResilientChatModel
+)
+
+
+class ProviderError(Exception):
+    """Mimics an HTTP error raised by a provider SDK."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FaultInjectingChatModel(BaseChatModel):
+    """Fake chat model that plays back a script of faults before answering.
+
+    Each entry of `faults` is consumed by one call: an exception is raised,
+    a number is a delay in seconds before answering, None answers at once.
+    """
+
+    faults: List[Any] = []
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fault-injecting"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[{"type": "function", "function": {"name": getattr(t, "name", None) or t.__name__}} for t in tools])
+
+    def _next_fault(self):
+        self.calls += 1
+        return self.faults.pop(0) if self.faults else None
+
+    def _answer(self):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"answer {self.calls}"))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        fault = self._next_fault()
+        if isinstance(fault, Exception):
+            raise fault
+        if fault:
+            time.sleep(fault)
+        return self._answer()
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        fault = self._next_fault()
+        if isinstance(fault, Exception):
+            raise fault
+        if fault:
+            await asyncio.sleep(fault)
+        return self._answer()
+
+
+def resilient(faults, breaker=None, **kwargs):
+    options = {"timeout_seconds": 0.2, "max_retries": 2, "backoff_seconds": 0.01}
+    options.update(kwargs)
+    fake = FaultInjectingChatModel(faults=faults)
+    return fake, ResilientChatModel(model=fake, breaker=breaker or CircuitBreaker(failure_threshold=5), **options)
+
+
+class TestResilientChatModel(unittest.TestCase):
+    """Test cases for deadlines, retries, hedging and the circuit breaker"""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_retries_transient_errors(self):
+        """Test that 5xx errors and timeouts are retried until a call succeeds"""
+        fake, llm = resilient([ProviderError(503), 1.0])
+        self.assertEqual(llm.invoke("hi").content, "answer 3")
+        self.assertEqual(metrics.get_counter("llm.retries"), 2)
+        self.assertEqual(metrics.get_counter("llm.timeouts"), 1)
+
+    def test_async_deadline_and_retry_budget(self):
+        """Test that exhausting the retries raises LLMUnavailableError"""
+        fake, llm = resilient([1.0, 1.0, 1.0])
+        with self.assertRaises(LLMUnavailableError):
+            asyncio.run(llm.ainvoke("hi"))
+        self.assertEqual(fake.calls, 3)
+
+    def test_client_errors_are_not_retried(self):
+        """Test that a 400 surfaces immediately"""
+        fake, llm = resilient([ProviderError(400)])
+        with self.assertRaises(ProviderError):
+            llm.invoke("hi")
+        self.assertEqual(fake.calls, 1)
+
+    def test_hedged_attempt_wins_over_slow_call(self):
+        """Test that a hedged second attempt cuts tail latency"""
+        fake, llm = resilient([0.5, None], timeout_seconds=1.0, hedge_after_seconds=0.05)
+        start = time.monotonic()
+        self.assertEqual(asyncio.run(llm.ainvoke("hi")).content, "answer 2")
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(metrics.get_counter("llm.hedged_requests"), 1)
+
+    def test_breaker_opens_and_recovers(self):
+        """Test that the breaker fails fast while open and closes after a good trial call"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_seconds=0.1)
+        fake, llm = resilient([ProviderError(500), ProviderError(500)], breaker=breaker, max_retries=5)
+        with self.assertRaises(CircuitOpenError):
+            llm.invoke("hi")
+        self.assertEqual(fake.calls, 2)
+        self.assertTrue(breaker.is_open)
+
+        time.sleep(0.15)
+        self.assertEqual(llm.invoke("hi").content, "answer 3")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+    def test_cancelled_trial_call_frees_its_slot(self):
+        """Test that a half-open trial call that is cancelled lets the next call probe the provider"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=0.05)
+        fake, llm = resilient([ProviderError(500), 1.0], breaker=breaker, max_retries=0, timeout_seconds=2.0)
+        with self.assertRaises(LLMUnavailableError):
+            llm.invoke("hi")
+        time.sleep(0.1)
+
+        async def cancel_trial():
+            task = asyncio.ensure_future(llm.ainvoke("hi"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_trial())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertEqual(llm.invoke("hi").content, "answer 3")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_every_attempt_is_rate_limited(self):
+        """Test that retries wait for their own limiter tokens and a hedge is only sent when one is free"""
+        limiter = LLMRateLimiter(requests_per_minute=1000, tokens_per_minute=10**6)
+        fake, llm = resilient([ProviderError(503), None], limiter=limiter, lane=INTERACTIVE)
+        self.assertEqual(llm.invoke("hi").content, "answer 2")
+        self.assertEqual(metrics.get_counter("llm.requests.interactive"), 2)
+
+        limiter.budget._requests.level = 1
+        fake, llm = resilient([0.3], limiter=limiter, lane=INTERACTIVE, timeout_seconds=1.0, hedge_after_seconds=0.05)
+        self.assertEqual(llm.invoke("hi").content, "answer 1")
+        self.assertEqual((fake.calls, metrics.get_counter("llm.hedged_requests")), (1, 0))
+
+    def test_hedged_attempts_are_charged_and_settled(self):
+        """Test that a hedge is charged to the current user and settled like the attempt it duplicates"""
+        limiter = LLMRateLimiter(requests_per_minute=1000, tokens_per_minute=10**6, user_requests_per_minute=30)
+        fake, llm = resilient([0.5, None], limiter=limiter, timeout_seconds=1.0, hedge_after_seconds=0.05)
+        with mock.patch.object(limiter, "settle_call", wraps=limiter.settle_call) as settle_call, llm_user("alice"):
+            self.assertEqual(asyncio.run(llm.ainvoke("hi")).content, "answer 2")
+        self.assertEqual(settle_call.call_count, 2)
+        self.assertAlmostEqual(limiter.budget._user_buckets["alice"][0].level, 28, delta=0.1)
+
+
+class TestAssignmentFallback(unittest.TestCase):
+    """Test that assignment degrades to the behavior tree decision"""
+
+    analysis = {
+        "task_id": 1, "developer_id": 2, "recommendation": "Good match",
+        "explanation": "Developer has good skill match.", "score": 0.7, "skill_match": 0.7, "workload": 0.2
+    }
+
+    def test_falls_back_when_provider_is_down(self):
+        from langgraph.prebuilt import create_react_agent
+        from assignment_agent import agent as assignment_agent
+        from assignment_agent.tools import tools
+
+        breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=60)
+        _, llm = resilient([ProviderError(503)], breaker=breaker, max_retries=0)
+        graph = create_react_agent(model=llm, tools=tools)
+
+        with mock.patch.object(assignment_agent, "get_agent", return_value=graph), \
+                mock.patch.object(assignment_agent, "llm_circuit_breaker", breaker):
+            first = asyncio.run(assignment_agent.process_task_assignment(1, 2, analysis=self.analysis))
+            # The breaker is now open, so the agent is skipped entirely
+            with mock.patch.object(graph, "ainvoke", side_effect=AssertionError("agent should be skipped")):
+                second = asyncio.run(assignment_agent.process_task_assignment(1, 2, analysis=self.analysis))
+
+        for result in (first, second):
+            self.assertEqual(result["fallback"], "behavior_tree")
+            self.assertTrue(result["agent_response"].startswith("Good match"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Integration tests for the Redis session backend of the conversation store, against fakeredis
+"""
+
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fakeredis
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import models
+from shared.models import Base, User, Message
+from intake_agent.conversation_store import ConversationStore
+from intake_agent.session_backends import (
+    MemorySessionBackend, RedisSessionBackend, create_session_backend, decode_message, encode_message
+)
+
+
+def exchange(question, answer):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+
+class TestRedisSessionBackend(unittest.TestCase):
+    """Test cases for sessions shared by several workers through Redis"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add_all([User(username=name, email=f"{name}@example.com") for name in ("gina", "hank")])
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(models, "SessionLocal", self.Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis = fakeredis.FakeStrictRedis()
+        self.store = self.worker()
+
+    def worker(self):
+        """A store as another worker process would have it: its own queue, the same Redis."""
+        return ConversationStore(flush_seconds=60, backend=RedisSessionBackend(self.redis, ttl_seconds=600))
+
+    def test_messages_are_compact_list_entries(self):
+        """Test that each message is one list entry appended with RPUSH"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        self.store.append("gina", "s1", *exchange("Add a QA task", "Done"))
+        self.assertEqual(self.redis.lrange("conv:session:s1:messages", 0, -1),
+                         [b"uPlan the launch", b"aSure", b"uAdd a QA task", b"aDone"])
+        self.assertEqual(decode_message(encode_message({"role": "tool", "content": "x"})), {"role": "tool", "content": "x"})
+
+    def test_keys_expire(self):
+        """Test that every key of a session has the TTL, refreshed on access"""
+        self.store.save("gina", "s1", exchange("Hello", "Hi"))
+        for key in ("conv:session:s1:messages", "conv:session:s1:summary", "conv:user:gina:sessions"):
+            self.assertTrue(0 < self.redis.ttl(key) <= 600, key)
+        self.redis.expire("conv:session:s1:messages", 5)
+        self.store.get("gina", "s1")
+        self.assertGreater(self.redis.ttl("conv:session:s1:messages"), 5)
+
+    def test_workers_share_sessions(self):
+        """Test that a session written by one worker is read and appended to by another without the database"""
+        self.store.save("gina", "s1", exchange("Plan the launch", "Sure"))
+        other = self.worker()
+        self.assertEqual(other.get("gina", "s1"), exchange("Plan the launch", "Sure"))
+        self.assertIsNone(other.get("hank", "s1"))
+
+        other.append("gina", "s1", *exchange("Add a QA task", "Done"))
+        self.assertEqual(len(self.store.get("gina", "s1")), 4)
+        sessions, _ = self.store.list_sessions("gina")
+        self.assertEqual((sessions[0]["title"], sessions[0]["message_count"]), ("Plan the launch", 4))
+
+        self.store.flush()
+        other.flush()
+        db = self.Session()
+        self.assertEqual(db.query(func.count()).select_from(Message).scalar(), 4)
+        db.close()
+
+    def test_sessions_keep_their_owner(self):
+        """Test that another user cannot replace a session held in Redis"""
+        self.store.save("gina", "s1", exchange("hi", "yo"))
+        with mock.patch.object(ConversationStore, "_owner", return_value=None):
+            self.assertFalse(self.worker().save("hank", "s1", exchange("x", "y")))
+        self.assertEqual(self.store.get("gina", "s1"), exchange("hi", "yo"))
+        self.assertEqual(self.redis.hget("conv:session:s1:summary", "user"), b"gina")
+
+    def test_expired_sessions_page_in_from_the_database(self):
+        """Test that the database serves a session once its keys have expired"""
+        self.store.save("gina", "s1", exchange("Hello", "Hi"))
+        self.store.flush()
+        self.redis.flushall()
+        other = self.worker()
+        self.assertEqual(other.get("gina", "s1"), exchange("Hello", "Hi"))
+        self.assertEqual(self.redis.llen("conv:session:s1:messages"), 2)
+
+        sessions, _ = other.list_sessions("gina")
+        self.assertEqual([s["session_id"] for s in sessions], ["s1"])
+
+    def test_pagination_and_deletion(self):
+        """Test that pages follow the cursor and that a deleted session is gone for every worker"""
+        for i in range(5):
+            self.store.save("gina", f"s{i}", exchange(f"Question {i}", "Answer"))
+        first, cursor = self.store.list_sessions("gina", limit=3)
+        second, last = self.store.list_sessions("gina", limit=3, cursor=cursor)
+        self.assertEqual([s["session_id"] for s in first + second], ["s4", "s3", "s2", "s1", "s0"])
+        self.assertIsNone(last)
+
+        other = self.worker()
+        self.assertTrue(self.store.delete("gina", "s2"))
+        self.assertIsNone(other.get("gina", "s2"))
+        self.assertNotIn("s2", [s["session_id"] for s in other.list_sessions("gina")[0]])
+        self.store.flush()
+        self.assertFalse(self.redis.exists("conv:session:s2:deleted"))
+
+    def test_backend_selection(self):
+        """Test that CONVERSATION_BACKEND picks the backend"""
+        self.assertIsInstance(create_session_backend("memory"), MemorySessionBackend)
+        with mock.patch("redis.Redis.from_url", return_value=self.redis):
+            self.assertIsInstance(create_session_backend("redis"), RedisSessionBackend)
+        with self.assertRaises(ValueError):
+            create_session_backend("memcached")
+
+
+if __name__ == "__main__":
+    unittest.main()
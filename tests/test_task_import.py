@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the LLM-free bulk task import
+"""
+
+import unittest
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared.dedup import DuplicateIndex
+from shared.vector_index import VectorIndex
+from shared.models import Base, Task
+from intake_agent import task_import
+
+
+def task_row(i, **overrides):
+    row = {"title": f"Task {i}", "description": "Imported task", "user_id": 1, "project_id": 1,
+           "priority": "medium", "role_required": "developer", "deadline": "2026-12-31"}
+    row.update(overrides)
+    return row
+
+
+class GeneratedJSONL(io.RawIOBase):
+    """Binary file that produces JSONL task rows on demand, without holding them in memory."""
+
+    def __init__(self, rows):
+        self.rows = iter(range(rows))
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) < len(buffer):
+            i = next(self.rows, None)
+            if i is None:
+                break
+            self.pending += (json.dumps(task_row(i)) + "\n").encode()
+        size = min(len(buffer), len(self.pending))
+        buffer[:size], self.pending = self.pending[:size], self.pending[size:]
+        return size
+
+
+class TestTaskImport(unittest.TestCase):
+    """Test cases for streaming JSONL/CSV task import"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.index = DuplicateIndex()
+        vector_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(vector_dir.cleanup)
+        self.vectors = VectorIndex(path=vector_dir.name)
+        for name, value in (("SessionLocal", self.Session), ("get_task_index", lambda: self.index), ("get_vector_index", lambda: self.vectors)):
+            patcher = mock.patch.object(task_import, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def count_tasks(self):
+        db = self.Session()
+        try:
+            return db.query(func.count(Task.id)).scalar()
+        finally:
+            db.close()
+
+    def test_jsonl_import_reports_row_errors(self):
+        """Test that valid rows are inserted and invalid ones reported by row number"""
+        lines = [
+            json.dumps(task_row(1)),
+            json.dumps(task_row(2, deadline="31/12/2026")),
+            "{not json",
+            "",
+            json.dumps({"title": "Incomplete"}),
+            json.dumps(task_row(5, created_by="alice")),
+        ]
+        report = task_import.import_tasks(io.StringIO("\n".join(lines)), "jsonl", username="bob", chunk_size=2)
+
+        self.assertEqual((report["imported"], report["failed"]), (2, 3))
+        self.assertEqual([error["row"] for error in report["errors"]], [2, 3, 4])
+        self.assertIn("Missing required fields", report["errors"][2]["error"])
+
+        db = self.Session()
+        self.assertEqual([task.created_by for task in db.query(Task).order_by(Task.id)], ["bob", "alice"])
+        db.close()
+
+    def test_imported_tasks_are_indexed(self):
+        """Test that imported tasks are added to the near-duplicate and search indexes"""
+        lines = [json.dumps(task_row(i)) for i in range(3)]
+        task_import.import_tasks(io.StringIO("\n".join(lines)), "jsonl")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(len(self.vectors), 3)
+        self.assertTrue(self.index.find_duplicates(1, "Task 1", "Imported task"))
+
+    def test_csv_import(self):
+        """Test that CSV rows are converted and empty cells count as missing"""
+        csv_text = (
+            "title,description,user_id,project_id,priority,role_required,deadline\n"
+            "Design,Draw the mockups,1,2,high,designer,2026-11-01\n"
+            "Build,Write the code,1,2,high,developer,\n"
+            ",No title,1,2,low,developer,\n"
+            "Test,Check it,one,2,low,qa,\n"
+        )
+        report = task_import.import_tasks(io.StringIO(csv_text), "csv")
+
+        self.assertEqual((report["imported"], report["failed"]), (2, 2))
+        self.assertIn("title", report["errors"][0]["error"])
+        self.assertIn("user_id must be an integer", report["errors"][1]["error"])
+        db = self.Session()
+        design = db.query(Task).filter(Task.title == "Design").one()
+        self.assertEqual((design.project_id, design.deadline.year, design.created_by), (2, 2026, "system"))
+        db.close()
+
+    def test_error_report_is_capped(self):
+        """Test that a file full of bad rows does not grow the report without bound"""
+        report = task_import.import_tasks(io.StringIO("{}\n" * 50), "jsonl", max_errors=10)
+        self.assertEqual((report["failed"], len(report["errors"]), report["errors_truncated"]), (50, 10, True))
+
+    def test_large_file_in_bounded_memory(self):
+        """Test that the memory of an import is the resident indexes plus a working set that does not grow with the rows"""
+        tracemalloc.start()
+        try:
+            report = task_import.import_task_file(GeneratedJSONL(5000), "jsonl", chunk_size=250)
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(report["imported"], 5000)
+        self.assertEqual(self.count_tasks(), 5000)
+        self.assertEqual((len(self.index), len(self.vectors)), (5000, 5000))
+        # The indexes stay resident by design: under 1 KB per task for the duplicate index, plus the search index's ID map
+        self.assertLess(retained / 5000, 1536)
+        self.assertLess(peak - retained, 4 * 1024 * 1024)
+
+    def test_import_endpoint(self):
+        """Test the /intake/tasks/import upload endpoint"""
+        from fastapi.testclient import TestClient
+        from intake_agent.auth import User, get_current_active_user
+        from intake_agent.server import app
+
+        app.dependency_overrides[get_current_active_user] = lambda: User(username="pm")
+        self.addCleanup(app.dependency_overrides.clear)
+        client = TestClient(app)
+
+        body = "\n".join(json.dumps(task_row(i)) for i in range(3)).encode()
+        response = client.post("/intake/tasks/import", files={"file": ("tasks.jsonl", body, "application/octet-stream")})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["imported"], 3)
+
+        response = client.post("/intake/tasks/import", files={"file": ("tasks.txt", body, "text/plain")})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
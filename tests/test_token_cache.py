@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the verified-token cache of the intake API
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+import time
+from datetime import timedelta
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import models
+from shared import user_directory as user_directory_module
+from shared.models import Base, User
+from shared.user_directory import UserDirectory
+from intake_agent import auth
+
+
+class TestVerifiedTokenCache(unittest.TestCase):
+    """Test cases for caching, expiry and revocation of verified tokens"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        db.add_all([User(username=name, email=f"{name}@example.com", hashed_password="x") for name in ("alice", "bob")])
+        db.commit()
+        db.close()
+        self.cache = auth.VerifiedTokenCache(max_entries=2)
+        directory = UserDirectory()
+        directory.on_change(self.cache.revoke_user)
+        for target, name, value in (
+            (models, "SessionLocal", Session),
+            (auth, "SessionLocal", Session),
+            (auth, "user_directory", directory),
+            (user_directory_module, "user_directory", directory),
+            (auth, "token_cache", self.cache),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def resolve(self, token):
+        return asyncio.run(auth.get_current_active_user(asyncio.run(auth.get_current_user(token))))
+
+    def test_verified_tokens_skip_decoding(self):
+        """Test that a cached token is resolved without verifying its signature again"""
+        token = auth.create_access_token({"sub": "alice"})
+        self.assertEqual(self.resolve(token).username, "alice")
+        with mock.patch.object(auth.jwt, "decode", side_effect=AssertionError("decoded again")):
+            self.assertEqual(self.resolve(token).username, "alice")
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        """Test that bad tokens are never cached and expired entries are dropped"""
+        with self.assertRaises(HTTPException):
+            self.resolve("not-a-token")
+        self.assertEqual(len(self.cache), 0)
+
+        token = auth.create_access_token({"sub": "alice"}, expires_delta=timedelta(minutes=5))
+        self.resolve(token)
+        with mock.patch.object(auth.time, "time", return_value=time.time() + 600):
+            self.assertIsNone(self.cache.get(token))
+
+    def test_disabling_or_deleting_a_user_revokes_tokens(self):
+        """Test that revocation takes effect on the next request"""
+        alice = auth.create_access_token({"sub": "alice"})
+        bob = auth.create_access_token({"sub": "bob"})
+        self.resolve(alice)
+        self.resolve(bob)
+
+        auth.disable_user("alice")
+        with self.assertRaises(HTTPException) as raised:
+            self.resolve(alice)
+        self.assertEqual(raised.exception.status_code, 400)
+
+        auth.delete_user("bob")
+        with self.assertRaises(HTTPException) as raised:
+            self.resolve(bob)
+        self.assertEqual(raised.exception.status_code, 401)
+
+    def test_changes_made_by_other_workers_are_seen(self):
+        """Test that a user disabled by another worker is rejected once the directory TTL has passed"""
+        alice = auth.create_access_token({"sub": "alice"})
+        self.cache.max_age_seconds = auth.user_directory.ttl_seconds = 0.05
+        self.resolve(alice)
+
+        # Another worker disables alice: only the database changes here
+        db = models.SessionLocal()
+        db.query(User).filter(User.username == "alice").update({"disabled": True})
+        db.commit()
+        db.close()
+        time.sleep(0.1)
+        with self.assertRaises(HTTPException) as raised:
+            self.resolve(alice)
+        self.assertEqual(raised.exception.status_code, 400)
+
+    def test_cache_is_bounded(self):
+        """Test that the least recently used token is evicted"""
+        tokens = [auth.create_access_token({"sub": "alice", "n": i}) for i in range(3)]
+        for token in tokens:
+            self.resolve(token)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(tokens[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
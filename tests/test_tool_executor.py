@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Unit tests for concurrent tool execution in the ReAct agents
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+import time
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage
+from shared import metrics
+from shared.tool_executor import ConcurrentToolNode
+
+
+def get_task_details(task_id):
+    """Return a task after a simulated database round trip."""
+    time.sleep(0.2)
+    return {"task_id": task_id}
+
+
+def check_developer_availability(developer_id):
+    """Return a developer's availability after a simulated database round trip."""
+    time.sleep(0.2)
+    return {"developer_id": developer_id, "availability": "available"}
+
+
+def analyze_task_assignment_fit(task_id, developer_id):
+    """Return a fit score after a simulated behavior tree run."""
+    time.sleep(0.2)
+    return {"score": 0.8}
+
+
+def hanging_lookup(task_id):
+    """Never answers in time."""
+    time.sleep(1.0)
+    return {"task_id": task_id}
+
+
+def turn(*calls):
+    """Build the agent state for one model turn emitting the given tool calls."""
+    tool_calls = [{"name": name, "args": args, "id": f"call_{i}"} for i, (name, args) in enumerate(calls)]
+    return {"messages": [AIMessage(content="", tool_calls=tool_calls)]}
+
+
+class TestConcurrentToolNode(unittest.TestCase):
+    """Test cases for concurrent, deadline-bound tool calls"""
+
+    def setUp(self):
+        metrics.reset()
+        self.node = ConcurrentToolNode(
+            [get_task_details, check_developer_availability, analyze_task_assignment_fit, hanging_lookup],
+            tool_timeouts={"hanging_lookup": 0.3}
+        )
+        self.state = turn(
+            ("get_task_details", {"task_id": 1}),
+            ("check_developer_availability", {"developer_id": 2}),
+            ("analyze_task_assignment_fit", {"task_id": 1, "developer_id": 2}),
+        )
+
+    def assert_in_call_order(self, messages):
+        self.assertEqual([m.tool_call_id for m in messages], ["call_0", "call_1", "call_2"])
+        self.assertEqual(messages[0].name, "get_task_details")
+
+    def test_sync_calls_run_concurrently(self):
+        """Test that three 0.2s tools finish in well under 0.6s, in call order"""
+        start = time.monotonic()
+        messages = self.node.invoke(self.state)["messages"]
+        self.assertLess(time.monotonic() - start, 0.45)
+        self.assert_in_call_order(messages)
+        self.assertGreater(metrics.snapshot()["histograms"]["tools.turn_saved_seconds"]["max"], 0.2)
+
+    def test_async_calls_run_concurrently(self):
+        """Test the async path used by the API services"""
+        start = time.monotonic()
+        messages = asyncio.run(self.node.ainvoke(self.state))["messages"]
+        self.assertLess(time.monotonic() - start, 0.45)
+        self.assert_in_call_order(messages)
+        self.assertEqual(metrics.get_counter("tools.calls"), 3)
+
+    def test_slow_tool_times_out_without_blocking_others(self):
+        """Test that a tool missing its deadline is answered with an error message"""
+        state = turn(("hanging_lookup", {"task_id": 1}), ("get_task_details", {"task_id": 1}))
+        for run in (lambda: self.node.invoke(state), lambda: asyncio.run(self.node.ainvoke(state))):
+            start = time.monotonic()
+            timed_out, ok = run()["messages"]
+            self.assertLess(time.monotonic() - start, 0.6)
+            self.assertEqual(timed_out.status, "error")
+            self.assertIn("timed out", timed_out.content)
+            self.assertEqual(ok.content, '{"task_id":1}')
+        self.assertEqual(metrics.get_counter("tools.timeouts"), 2)
+
+    def test_serial_and_write_tools(self):
+        """Test that serial tools never overlap, not even with each other, and that writes run past the deadline to completion"""
+        node = ConcurrentToolNode(
+            [get_task_details, check_developer_availability, analyze_task_assignment_fit, hanging_lookup],
+            tool_timeouts={"hanging_lookup": 0.3}, write_tools={"hanging_lookup"},
+            serial_tools={"analyze_task_assignment_fit", "check_developer_availability"}
+        )
+        state = turn(
+            ("analyze_task_assignment_fit", {"task_id": 1, "developer_id": 2}),
+            ("analyze_task_assignment_fit", {"task_id": 1, "developer_id": 3}),
+            ("check_developer_availability", {"developer_id": 2}),
+            ("get_task_details", {"task_id": 1}),
+        )
+        for run in (lambda: node.invoke(state), lambda: asyncio.run(node.ainvoke(state))):
+            start = time.monotonic()
+            run()
+            self.assertGreaterEqual(time.monotonic() - start, 0.6)
+
+        write = node.invoke(turn(("hanging_lookup", {"task_id": 1})))["messages"][0]
+        self.assertEqual(write.content, '{"task_id":1}')
+        self.assertEqual(metrics.get_counter("tools.timeouts"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Unit tests for tool result shaping
+"""
+
+import unittest
+import json
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from langchain_core.messages import AIMessage
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.orm import sessionmaker
+from shared import metrics
+from shared.models import Base, Task
+from shared.tool_executor import ConcurrentToolNode
+from shared.tool_results import shape_results, truncate_text, compact_content
+from intake_agent import langchain_service
+
+
+class TestShapeResults(unittest.TestCase):
+    """Test cases for projection, capping and truncation"""
+
+    def test_projection_cap_and_continuation(self):
+        """Test that only requested fields and the first page are kept"""
+        records = [{"id": i, "title": f"Task {i}", "description": "x" * 500} for i in range(30)]
+        shaped = shape_results(records, fields=["id", "description"], limit=10, max_chars=50)
+        self.assertEqual(len(shaped["results"]), 10)
+        self.assertEqual(set(shaped["results"][0]), {"id", "description"})
+        self.assertTrue(shaped["results"][0]["description"].endswith("[+450 chars]"))
+        self.assertEqual((shaped["total"], shaped["more"], shaped["next_offset"]), (30, 20, 10))
+
+    def test_last_page_has_no_continuation(self):
+        """Test that a complete result reports nothing more"""
+        shaped = shape_results([{"id": 1}], total=6, offset=5)
+        self.assertEqual(shaped["more"], 0)
+        self.assertNotIn("next_offset", shaped)
+
+    def test_truncate_and_compact(self):
+        """Test that short text is untouched and JSON loses its whitespace"""
+        self.assertEqual(truncate_text("short", 10), "short")
+        self.assertEqual(compact_content('{"a": [1, 2], "b": "x"}'), '{"a":[1,2],"b":"x"}')
+        self.assertEqual(compact_content("plain text"), "plain text")
+
+
+class TestSearchTool(unittest.TestCase):
+    """Test cases for the shaped task search tool"""
+
+    def setUp(self):
+        metrics.reset()
+        # One shared in-memory database, also visible from the tool worker threads
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = Session()
+        for i in range(1, 51):
+            db.add(Task(id=i, title=f"Login page {i}", description="Build the login flow. " * 40, priority="low"))
+        db.add(Task(id=51, title="Billing", description=None))
+        db.commit()
+        db.close()
+        patcher = mock.patch.object(langchain_service, "SessionLocal", Session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_broad_search_is_paged_and_truncated(self):
+        """Test that a broad term returns one compact page with a continuation offset"""
+        result = langchain_service.retrieve_tasks_by_name_or_description("login", fields=["id", "title", "description"])
+        self.assertEqual((result["total"], result["more"], result["next_offset"]), (50, 30, 20))
+        self.assertEqual(set(result["results"][0]), {"id", "title", "description"})
+        self.assertLess(len(result["results"][0]["description"]), 250)
+
+        last = langchain_service.retrieve_tasks_by_name_or_description("login", offset=40)
+        self.assertEqual([task["id"] for task in last["results"]], list(range(41, 51)))
+        self.assertEqual(last["more"], 0)
+
+    def test_result_tokens_are_recorded_per_tool(self):
+        """Test that the tool node records a compact result size per tool"""
+        node = ConcurrentToolNode(langchain_service.tools)
+        call = {"name": "retrieve_tasks_by_name_or_description", "args": {"search_term": "login"}, "id": "call_0"}
+        message = node.invoke({"messages": [AIMessage(content="", tool_calls=[call])]})["messages"][0]
+
+        self.assertNotIn('", "', message.content)
+        self.assertEqual(json.loads(message.content)["total"], 50)
+        histogram = metrics.snapshot()["histograms"]["tools.result_tokens.retrieve_tasks_by_name_or_description"]
+        self.assertLess(histogram["max"], 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
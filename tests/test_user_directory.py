@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Unit tests for DB-backed authentication through the cached user directory
+"""
+
+import unittest
+import asyncio
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path so we can import the intake_agent module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared import models
+from shared import user_directory as user_directory_module
+from shared.last_login import LastLoginRecorder
+from shared.models import Base, User
+from shared.user_directory import UserDirectory
+from intake_agent import auth
+
+
+class TestUserDirectory(unittest.TestCase):
+    """Test cases for the read-through user directory and its write-through invalidation"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.queries = 0
+
+        def count(*args):
+            self.queries += 1
+
+        event.listen(engine, "before_cursor_execute", count)
+        self.directory = UserDirectory()
+        self.directory.on_change(auth.token_cache.revoke_user)
+        self.recorder = LastLoginRecorder()
+        for target, name, value in (
+            (models, "SessionLocal", self.Session),
+            (auth, "SessionLocal", self.Session),
+            (auth, "user_directory", self.directory),
+            (user_directory_module, "user_directory", self.directory),
+            (auth, "last_login_recorder", self.recorder),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        asyncio.run(auth.create_user("carol", "secret", "carol@example.com", "Carol"))
+
+    def current_user(self, token):
+        return asyncio.run(auth.get_current_user(token))
+
+    def test_login_uses_the_users_table(self):
+        """Test that credentials are checked against the users table and last_login is recorded"""
+        self.assertFalse(asyncio.run(auth.authenticate_user("carol", "wrong")))
+        self.assertEqual(asyncio.run(auth.authenticate_user("carol", "secret")).username, "carol")
+        self.recorder.flush()
+        db = self.Session()
+        self.assertIsNotNone(models.get_user_by_username(db, "carol").last_login)
+        db.close()
+
+    def test_steady_state_requests_run_no_queries(self):
+        """Test that resolving a token costs no queries once the user is cached"""
+        token = auth.create_access_token({"sub": "carol"})
+        auth.token_cache.clear()
+        self.queries = 0
+        for _ in range(5):
+            auth.token_cache.clear()
+            self.assertEqual(self.current_user(token).username, "carol")
+        self.assertEqual(self.queries, 0)
+
+    def test_writes_go_through_to_the_directory(self):
+        """Test that updates are visible at once and deleted users are rejected"""
+        token = auth.create_access_token({"sub": "carol"})
+        self.current_user(token)
+        auth.disable_user("carol")
+        self.assertTrue(self.current_user(token).disabled)
+
+        auth.delete_user("carol")
+        self.assertIsNone(self.directory.get("carol"))
+        with self.assertRaises(auth.HTTPException):
+            self.current_user(token)
+
+    def test_entries_expire(self):
+        """Test that an entry older than the TTL is reloaded"""
+        self.directory.ttl_seconds = 0
+        self.queries = 0
+        self.directory.get("carol")
+        self.assertEqual(self.queries, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
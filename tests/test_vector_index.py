@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the local vector index and ranked task search
+"""
+
+import unittest
+import multiprocessing
+import os
+import sys
+import tempfile
+from unittest import mock
+
+# Add the parent directory to the path so we can import the shared module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from shared.models import Base, Task
+from shared.vector_index import VectorIndex, INITIAL_CAPACITY
+from intake_agent import langchain_service
+
+TASKS = [
+    (1, "Implement login page", "Users sign in with email and password"),
+    (2, "Set up billing", "Integrate the payment provider and send invoices"),
+    (3, "Write API docs", "Document every endpoint"),
+    (4, "Fix crash on startup", "The app crashes when the config file is missing"),
+]
+
+
+def write_tasks(path, first, count):
+    """Upsert tasks one at a time from another worker process."""
+    index = VectorIndex(path=path)
+    for task_id in range(first, first + count):
+        index.upsert([(task_id, f"Generated task {task_id}", "Routine maintenance work")])
+
+
+class TestVectorIndex(unittest.TestCase):
+    """Test cases for the memory-mapped vector index"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        self.index = VectorIndex(path=self.path)
+        self.index.upsert(TASKS)
+
+    def top(self, index, query):
+        return [task_id for task_id, _ in index.search(query, k=1)[1]]
+
+    def test_finds_paraphrases(self):
+        """Test that related wording ranks the right task first"""
+        self.assertEqual(self.top(self.index, "auth"), [1])
+        self.assertEqual(self.top(self.index, "payments"), [2])
+        self.assertEqual(self.top(self.index, "documentation for the api"), [3])
+        self.assertEqual(self.top(self.index, "bug"), [4])
+
+    def test_persists_and_grows(self):
+        """Test that the index reopens from disk after growing past its initial capacity"""
+        self.index.upsert((i, f"Generated task {i}", "Routine maintenance work") for i in range(10, 10 + INITIAL_CAPACITY))
+        reopened = VectorIndex(path=self.path)
+        self.assertEqual(len(reopened), len(TASKS) + INITIAL_CAPACITY)
+        self.assertGreater(reopened.capacity, INITIAL_CAPACITY)
+        self.assertEqual(self.top(reopened, "auth"), [1])
+
+    def test_remove_and_update(self):
+        """Test that removed tasks disappear and their rows are reused"""
+        self.index.remove([1])
+        self.assertNotIn(1, self.top(self.index, "login"))
+        self.index.upsert([(5, "Add single sign-on", "Support SSO login")])
+        self.assertEqual(self.index.size, len(TASKS))
+        self.assertEqual(self.top(self.index, "login"), [5])
+
+    def test_paging(self):
+        """Test the total and offset of ranked results"""
+        total, first = self.index.search("task", k=1, min_score=-1)
+        _, second = self.index.search("task", k=1, offset=1, min_score=-1)
+        self.assertEqual(total, len(TASKS))
+        self.assertNotEqual(first, second)
+
+    def test_processes_share_the_index(self):
+        """Test that workers writing one index at the same time keep every task and see each other's writes"""
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=write_tasks, args=(self.path, first, 600)) for first in (100, 1000)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        # Grown past its capacity by the other processes, and reloaded before searching
+        self.assertEqual(self.index.search("generated task", k=1, min_score=-1)[0], len(TASKS) + 1200)
+        self.assertEqual(self.top(self.index, "auth"), [1])
+        reopened = VectorIndex(path=self.path)
+        self.assertEqual(len(reopened), len(TASKS) + 1200)
+        # Document frequencies still count the stored vectors
+        self.assertEqual((reopened.vectors[:reopened.size] != 0).sum(axis=0).tolist(), reopened.df.tolist())
+
+    def test_other_workers_reload_only_changed_rows(self):
+        """Test that a worker that has kept up patches just the rows listed in meta.json, and one too far behind reloads everything"""
+        other = VectorIndex(path=self.path)
+        known_ids = other._known_ids
+        self.index.remove([2])
+        self.index.upsert([(5, "Add single sign-on", "Support SSO login")])
+        self.assertNotIn(2, self.top(other, "payments"))
+        self.assertEqual(self.top(other, "sso"), [5])
+        self.assertIs(other._known_ids, known_ids)
+        self.assertEqual((other._rows, other._free), (self.index._rows, self.index._free))
+
+        with mock.patch("shared.vector_index.VECTOR_CHANGE_LOG_ROWS", 1):
+            self.index.upsert([(6, "Set up billing", "Send invoices"), (7, "Write API docs", "Document every endpoint")])
+        self.assertEqual(self.top(other, "invoices"), [6])
+        self.assertIsNot(other._known_ids, known_ids)
+        self.assertEqual(other._rows, self.index._rows)
+
+
+class TestRankedTaskSearch(unittest.TestCase):
+    """Test cases for the ranked mode of the task search tool"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        db = self.Session()
+        db.add_all([Task(id=task_id, title=title, description=description, project_id=1) for task_id, title, description in TASKS])
+        db.commit()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.vectors = VectorIndex(path=directory.name)
+        # Sync picks up tasks written outside the index
+        self.vectors.sync(db)
+        db.close()
+        for name, value in (("SessionLocal", self.Session), ("get_vector_index", lambda: self.vectors)):
+            patcher = mock.patch.object(langchain_service, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_ranked_mode(self):
+        """Test that ranked results carry a score and honour field projection"""
+        result = langchain_service.retrieve_tasks_by_name_or_description("auth", fields=["id", "title"], mode="ranked")
+        self.assertEqual(result["mode"], "ranked")
+        self.assertEqual(set(result["results"][0]), {"id", "title", "score"})
+        self.assertEqual(result["results"][0]["id"], 1)
+
+    def test_substring_miss_falls_back_to_ranked(self):
+        """Test that a substring search with no matches returns ranked results instead"""
+        result = langchain_service.retrieve_tasks_by_name_or_description("authentication")
+        self.assertEqual(result["mode"], "ranked")
+        self.assertEqual(result["results"][0]["id"], 1)
+
+        exact = langchain_service.retrieve_tasks_by_name_or_description("billing")
+        self.assertNotIn("mode", exact)
+        self.assertEqual(exact["total"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()